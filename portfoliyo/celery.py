@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 
 from collections import Sequence
+from datetime import timedelta
 import logging
 import threading
 
@@ -271,4 +272,11 @@ celery.conf.update(
     CELERY_DISABLE_RATE_LIMITS=True,
     CELERY_TIMEZONE=settings.TIME_ZONE,
     CELERY_STORE_ERRORS_EVEN_IF_IGNORED=True,
+    # run by the beat scheduler embedded in the worker (see Procfile)
+    CELERYBEAT_SCHEDULE={
+        'sweep-expired-notifications': {
+            'task': 'portfoliyo.tasks.sweep_expired_notifications',
+            'schedule': timedelta(hours=1),
+            },
+        },
     )
@@ -2,11 +2,43 @@
 Email-sending.
 
 """
-from django.core.mail import EmailMultiAlternatives
+import contextlib
+import threading
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.conf import settings
 
 
+_local = threading.local()
+
+
+
+@contextlib.contextmanager
+def shared_connection():
+    """
+    Send all emails sent within this block over one backend connection.
+
+    Normally each email opens (and closes) its own connection; with SMTP that
+    means a full handshake per email. Within this block the connection is
+    opened on first use and kept open for subsequent emails, and closed at the
+    end of the block. If sending an email fails, the connection is closed so
+    the next email reconnects; so one failure doesn't break the rest.
+
+    Nested blocks share the outermost block's connection.
+
+    """
+    if getattr(_local, 'connection', None) is not None:
+        yield _local.connection
+        return
+    connection = _local.connection = get_connection()
+    try:
+        yield connection
+    finally:
+        _local.connection = None
+        _close_quietly(connection)
+
+
 
 def send_templated_multipart(template_name, context, recipients,
                              sender=None, fail_silently=False):
@@ -52,11 +84,36 @@ def send_multipart(subject, text_part, html_part, recipients,
     ``sender`` can be an email, 'Name <email>' or None. If unspecified, the
     ``DEFAULT_FROM_EMAIL`` setting will be used.
 
+    Within a ``shared_connection`` block, uses the block's connection.
+
     """
     sender = sender or settings.DEFAULT_FROM_EMAIL
 
     # collapse newlines in subject to spaces
     subject = u" ".join(subject.splitlines()).strip()
-    msg = EmailMultiAlternatives(subject, text_part, sender, recipients)
+    connection = getattr(_local, 'connection', None)
+    msg = EmailMultiAlternatives(
+        subject, text_part, sender, recipients, connection=connection)
     msg.attach_alternative(html_part, "text/html")
-    return msg.send(fail_silently)
+    if connection is None:
+        return msg.send(fail_silently)
+    sent = False
+    try:
+        # open it ourselves, else the backend closes it again after sending
+        connection.open()
+        result = msg.send(fail_silently)
+        sent = True
+    finally:
+        if not sent:
+            # a failed send may leave the connection unusable; start afresh
+            _close_quietly(connection)
+    return result
+
+
+
+def _close_quietly(connection):
+    """Close ``connection``, ignoring errors (it may already be broken)."""
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,136 @@
+"""Thread-safe pooling of keep-alive HTTP connections."""
+import httplib
+import select
+import socket
+import threading
+import time
+
+
+# methods whose requests can safely be repeated if they may have been sent
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+
+
+class ConnectionPool(object):
+    """
+    A pool of keep-alive HTTP(S) connections to a single host.
+
+    Safe to share between threads: each request checks a connection out of
+    the pool of idle connections (opening a new one if none is idle) and
+    returns it afterwards, so no connection is ever used by two threads at
+    once.
+
+    Connections idle for more than ``idle_timeout`` seconds, or that the
+    server has already closed (see ``is_dropped``), are closed rather than
+    reused.
+
+    ``connections_opened`` and ``requests_sent`` count new connections made
+    and requests sent through this pool.
+
+    """
+    def __init__(self, host, port, secure=True, timeout=5, max_idle=4,
+                 idle_timeout=15):
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+
+    def request(self, method, path, body=None, headers=None):
+        """Make an HTTP request on a pooled connection; return status, body."""
+        headers = headers or {}
+        conn, reused = self._checkout()
+        sent = False
+        try:
+            self._send(conn, method, path, body, headers)
+            sent = True
+            response = conn.getresponse()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            # the server may have closed an idle connection; retry once on a
+            # fresh connection. Don't retry failures of fresh connections, nor
+            # (lest it take effect twice) a non-idempotent request that was
+            # sent and so may have reached the server
+            if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                raise
+            conn = self._connect()
+            try:
+                self._send(conn, method, path, body, headers)
+                response = conn.getresponse()
+            except:
+                conn.close()
+                raise
+        content = response.read()
+        if response.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        return response.status, content
+
+
+    def _send(self, conn, method, path, body, headers):
+        """Send a request on ``conn`` (without awaiting the response)."""
+        conn.request(method, path, body, headers)
+        with self._lock:
+            self.requests_sent += 1
+
+
+    def _checkout(self):
+        """Return (connection, reused) tuple."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn = self._idle.pop()
+            idle = time.time() - conn.idle_since
+            if idle <= self.idle_timeout and not is_dropped(conn):
+                return conn, True
+            conn.close()
+        return self._connect(), False
+
+
+    def _checkin(self, conn):
+        """Return a connection to the idle pool, or close it if full."""
+        conn.idle_since = time.time()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+
+    def _connect(self):
+        """Return a new (lazily connecting) HTTP(S) connection."""
+        with self._lock:
+            self.connections_opened += 1
+        if self.secure:
+            conn_class = httplib.HTTPSConnection
+        else:
+            conn_class = httplib.HTTPConnection
+        return conn_class(self.host, self.port, timeout=self.timeout)
+
+
+
+def is_dropped(conn):
+    """
+    Return ``True`` if idle connection ``conn`` can no longer be used.
+
+    An idle keep-alive socket should have nothing to read; if it's readable,
+    the server has closed it (or sent something unexpected). Checking first
+    avoids sending a request that the server will never answer, which (for a
+    non-idempotent request) can't safely be retried.
+
+    """
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
@@ -9,7 +9,7 @@ and then reference any model class as e.g. model.User, model.Profile...
 
 """
 from django.contrib.auth.models import User
-from .users import utils
+from .users import codes, utils
 from .users.models import (
     School, Profile, TextSignup, Relationship, Group, AllStudentsGroup,
     elder_in_context, contextualized_elders, Donation)
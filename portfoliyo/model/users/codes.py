@@ -0,0 +1,100 @@
+"""
+Redis-cached index of signup codes.
+
+Lets inbound SMS handling tell whether a token could be a teacher or group
+signup code without querying the database. The index is a Redis set of codes.
+It may contain stale codes (a lookup for one just misses in the database).
+``Group.save`` and ``Profile.create_with_user`` add codes to it as they are
+assigned (once the assigning transaction commits); the whole index is rebuilt
+from the database if it is missing or has expired, which also picks up codes
+set any other way (e.g. in the admin).
+
+"""
+import threading
+import time
+
+from django.db import transaction
+
+from portfoliyo import redis, xact
+
+
+KEY = 'signup-codes'
+
+# always in a built index; distinguishes a missing index from a miss
+SENTINEL = '-'
+
+# seconds before the index expires and is rebuilt, dropping stale codes
+LIFETIME = 24 * 60 * 60
+
+
+
+_thread_data = threading.local()
+
+
+
+def _get_pending_codes():
+    """Return calling thread's codes waiting for transaction commit."""
+    return _thread_data.__dict__.setdefault('pending_codes', [])
+
+
+
+def is_code(token):
+    """Return True if ``token`` may be a signup code, False if surely not."""
+    p = redis.client.pipeline()
+    p.sismember(KEY, token).sismember(KEY, SENTINEL)
+    found, built = p.execute()
+    if not built:
+        return token in rebuild()
+    return found
+
+
+
+def add(code):
+    """Add ``code`` to the index, once the current transaction commits."""
+    if transaction.is_managed():
+        _get_pending_codes().append(code)
+    else:
+        _add([code])
+
+
+
+def rebuild():
+    """Add all codes in the database to the index; return set of codes."""
+    from .models import Group, Profile
+    codes = set(Group.objects.values_list('code', flat=True))
+    codes.update(
+        Profile.objects.filter(code__isnull=False).values_list(
+            'code', flat=True)
+        )
+    _add(codes | set([SENTINEL]), expire=True)
+    return codes
+
+
+
+def _add(codes, expire=False):
+    """Add given codes to the index in one Redis round-trip."""
+    p = redis.client.pipeline()
+    for code in codes:
+        p.sadd(KEY, code)
+    if expire:
+        p.expireat(KEY, int(time.time()) + LIFETIME)
+    p.execute()
+
+
+
+def _add_pending_codes(**kw):
+    """Transaction is committed; add its codes to the index."""
+    pending = _get_pending_codes()
+    if pending:
+        _add(pending)
+        pending[:] = []
+
+xact.post_commit.connect(_add_pending_codes)
+
+
+
+def _discard_pending_codes(**kw):
+    """Transaction is rolled back; its codes were never assigned."""
+    _get_pending_codes()[:] = []
+
+xact.post_rollback.connect(_discard_pending_codes)
@@ -13,7 +13,7 @@ from django.utils import timezone
 from model_utils import Choices
 
 from portfoliyo import tasks
-from . import managers
+from . import codes, managers
 
 
 # monkeypatch Django's User.email to be sufficiently long and unique/nullable
@@ -198,6 +198,9 @@ class Profile(models.Model):
             # give up and try one last save without catching errors
             profile.save()
 
+        if profile.code:
+            codes.add(profile.code)
+
         return profile
 
 
@@ -290,7 +293,13 @@ class Group(GroupBase, models.Model):
 
 
     def save(self, *args, **kwargs):
-        """Set code for all new groups."""
+        """Set code for all new groups; add code to the signup-code index."""
+        ret = self._save_with_code(*args, **kwargs)
+        codes.add(self.code)
+        return ret
+
+
+    def _save_with_code(self, *args, **kwargs):
         if self.code:
             return super(Group, self).save(*args, **kwargs)
         # try a few times to generate a unique code, then give up and error out
@@ -657,6 +666,11 @@ class QuerySetWrapper(object):
         return self.queryset.values_list(*args, **kw)
 
 
+    def select_related(self, *args):
+        args = [self._mangle_fieldname(fn) for fn in args]
+        return self.__class__(self.queryset.select_related(*args))
+
+
 
 class EldersForRelationships(QuerySetWrapper):
     """Relationship queryset wrapper; emulates QS of contextualized elders."""
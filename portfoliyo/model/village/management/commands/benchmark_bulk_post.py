@@ -0,0 +1,103 @@
+"""Benchmark ``BulkPost.create`` latency and query count by group size."""
+from optparse import make_option
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from portfoliyo import model, redis, xact
+
+
+DEFAULT_SIZES = [1, 10, 50, 150, 300]
+
+
+
+class Rollback(Exception):
+    """Raised (with timing results) to roll back all benchmark data."""
+    pass
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Create bulk posts to throwaway groups of the given sizes and report "
+        "latency and SQL query count for each. All data is rolled back; "
+        "Celery tasks are discarded and Redis writes go to an in-memory fake."
+        )
+    args = "[group-size ...]"
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--repeat',
+            type='int',
+            default=3,
+            help="Number of bulk posts to time per group size (default 3).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(a) for a in args] or DEFAULT_SIZES
+        except ValueError:
+            raise CommandError("Group sizes must be integers.")
+        repeat = options['repeat']
+
+        self.stdout.write("%8s %12s %8s\n" % ("students", "ms/post", "queries"))
+        orig_client = redis.client
+        redis.client = redis.InMemoryRedis()
+        try:
+            for size in sizes:
+                elapsed, num_queries = self.time_bulk_post(size, repeat)
+                self.stdout.write(
+                    "%8s %12.1f %8s\n" % (
+                        size, elapsed * 1000 / repeat, num_queries / repeat)
+                    )
+        finally:
+            redis.client = orig_client
+
+
+    def time_bulk_post(self, size, repeat):
+        """Return (total seconds, total queries) for ``repeat`` bulk posts."""
+        try:
+            with xact.xact():
+                group = self.create_group(size)
+                old_debug_cursor = connection.use_debug_cursor
+                connection.use_debug_cursor = True
+                start_queries = len(connection.queries)
+                start = time.time()
+                try:
+                    for i in range(repeat):
+                        model.BulkPost.create(group.owner, group, "Benchmark")
+                    elapsed = time.time() - start
+                    num_queries = len(connection.queries) - start_queries
+                finally:
+                    connection.use_debug_cursor = old_debug_cursor
+                raise Rollback(elapsed, num_queries)
+        except Rollback as r:
+            return r.args
+
+
+    def create_group(self, size):
+        """Create a teacher with a group of ``size`` students, each w/ parent."""
+        school = model.School.objects.create(
+            name="Benchmark School", postcode="bench-%s" % time.time())
+        teacher = model.Profile.create_with_user(
+            school=school, name="Benchmark Teacher", school_staff=True)
+        group = model.Group.objects.create(name="Benchmark", owner=teacher)
+        for i in range(size):
+            student = model.Profile.create_with_user(
+                school=school, name="Student %s" % i)
+            parent = model.Profile.create_with_user(
+                school=school,
+                name="Parent %s" % i,
+                email="bench-%s-%s-%s@example.com" % (size, i, time.time()),
+                )
+            model.Relationship.objects.create(
+                from_profile=teacher,
+                to_profile=student,
+                level=model.Relationship.LEVEL.owner,
+                )
+            model.Relationship.objects.create(
+                from_profile=parent, to_profile=student)
+            group.students.add(student)
+        return group
@@ -2,12 +2,13 @@
 from __future__ import absolute_import
 
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models
 from django.utils import html, timezone
 from jsonfield import JSONField
 from model_utils import Choices
 
 from portfoliyo import tasks
+from portfoliyo.sms import outbox
 from ..users import models as user_models
 from . import unread
 
@@ -54,6 +55,8 @@ class BasePost(models.Model):
     meta = JSONField(default=lambda: {})
 
     is_bulk = None
+    # outbound SMS scheduling lane for this kind of post
+    sms_lane = outbox.PRIORITY
 
 
     class Meta:
@@ -106,6 +109,7 @@ class BasePost(models.Model):
             to_sms = to_sms.filter(filters)
 
         to_mark_done = []
+        recipients = []
 
         for elder in to_sms:
             sms_data = {
@@ -116,12 +120,21 @@ class BasePost(models.Model):
                 }
             # with in_reply_to we assume caller sent SMS
             if elder.phone != in_reply_to:
-                elder.send_sms(sms_body)
+                recipients.append((elder.phone, elder.source_phone))
                 to_mark_done.append(elder)
             sms_sent = True
 
             meta_sms.append(sms_data)
 
+        # a single task carries the whole recipient list
+        if recipients:
+            tasks.send_sms_batch.delay(
+                recipients,
+                sms_body,
+                sender=self.author_id,
+                lane=self.sms_lane,
+                )
+
         # when we send an elder who didn't finish answering their signup
         # questions an SMS, we can no longer assume their next reply is
         # answering the last question we asked. So we mark all in-process
@@ -159,6 +172,7 @@ class BulkPost(BasePost):
 
 
     is_bulk = True
+    sms_lane = outbox.BULK
 
 
     def extra_data(self):
@@ -227,18 +241,25 @@ class BulkPost(BasePost):
 
         students = list(group.students.all())
 
+        # one query for all elder relationships in all affected villages; gives
+        # us both the author's relationships and the elders to mark unread
         relationships = user_models.Relationship.objects.filter(
-            from_profile=author, to_profile__in=students).select_related(
-            'to_profile')
-        rels_by_student = {}
+            kind=user_models.Relationship.KIND.elder,
+            to_profile__in=students,
+            ).select_related('from_profile__user')
+        rels_by_student_id = {}
+        elders_by_student_id = {}
         for rel in relationships:
-            rels_by_student[rel.student] = rel
+            if author is not None and rel.from_profile_id == author.id:
+                rels_by_student_id[rel.to_profile_id] = rel
+            elders_by_student_id.setdefault(
+                rel.to_profile_id, []).append(rel.elder)
 
-        for student in group.students.all():
-            sub = Post.objects.create(
+        subs = [
+            Post(
                 author=author,
                 student=student,
-                relationship=rels_by_student.get(student, None),
+                relationship=rels_by_student_id.get(student.id, None),
                 original_text=text,
                 html_text=html_text,
                 from_sms=from_sms,
@@ -246,18 +267,25 @@ class BulkPost(BasePost):
                 meta=post.meta,
                 from_bulk=post,
                 )
-            tasks.push_event.delay(
-                'posted',
-                sub.id,
-                author_sequence_id=sequence_id,
-                mark_read_url=reverse(
-                    'mark_post_read', kwargs={'post_id': sub.id}),
-                )
-            # mark the subpost unread by all web users in village (not author)
-            for elder in student.elders:
-                if elder.user.email and elder != author:
-                    unread.mark_unread(sub, elder)
+            for student in students
+            ]
+        Post.objects.bulk_create(subs)
+
+        # bulk_create doesn't set primary keys; fetch them all in one query
+        sub_ids_by_student_id = dict(
+            post.triggered.values_list('student_id', 'id'))
+        for sub in subs:
+            sub.id = sub_ids_by_student_id[sub.student_id]
+
+        # mark the subposts unread by all web users in village (not author)
+        unread.mark_unread_many(
+            (sub, elder)
+            for sub in subs
+            for elder in elders_by_student_id.get(sub.student_id, [])
+            if elder.user.email and elder != author
+            )
 
+        # one task sends events for the bulk post and all its sub-posts
         tasks.push_event.delay(
             'bulk_posted', post.id, author_sequence_id=sequence_id)
 
@@ -374,9 +402,10 @@ class Post(BasePost):
             post.attachments.create(attachment=uploaded_file)
 
         # mark the post unread by all web users in village (except the author)
-        for elder in student.elders:
-            if elder.user.email and elder != author:
-                unread.mark_unread(post, elder)
+        unread.mark_unread_many(
+            (post, elder) for elder in student.elders
+            if elder.user.email and elder != author
+            )
 
         tasks.push_event.delay(
             'posted',
@@ -396,6 +425,93 @@ class Post(BasePost):
         return post
 
 
+    @classmethod
+    def create_many(cls, author, students, text,
+                    from_sms=False, in_reply_to=None, notifications=True):
+        """
+        Create/return a message Post in each of ``students``' villages.
+
+        Equivalent to calling ``create`` for each student, but with a single
+        relationship query, bulk insert, unread-marking Redis round-trip,
+        Pusher task and notification task for the whole set.
+
+        No SMSes are sent: as with ``create``, if ``in_reply_to`` is a phone
+        number an SMS is assumed already sent to it, and it is recorded as an
+        SMS recipient of each post.
+
+        """
+        students = list(students)
+        if not students:
+            return []
+
+        html_text = text2html(text)
+        timestamp = now()
+
+        relationships = user_models.Relationship.objects.filter(
+            kind=user_models.Relationship.KIND.elder,
+            to_profile__in=students,
+            ).select_related('from_profile__user')
+        rels_by_student_id = {}
+        elders_by_student_id = {}
+        for rel in relationships:
+            if author is not None and rel.from_profile_id == author.id:
+                rels_by_student_id[rel.to_profile_id] = rel
+            elders_by_student_id.setdefault(
+                rel.to_profile_id, []).append(
+                user_models.elder_in_context(rel))
+
+        posts = []
+        for student in students:
+            post = cls(
+                author=author,
+                student=student,
+                relationship=rels_by_student_id.get(student.id),
+                timestamp=timestamp,
+                original_text=text,
+                html_text=html_text,
+                from_sms=from_sms,
+                )
+            if in_reply_to:
+                post.meta['sms'] = [
+                    {
+                        'id': elder.id,
+                        'role': elder.role_in_context,
+                        'name': elder.name,
+                        'phone': elder.phone,
+                        }
+                    for elder in elders_by_student_id.get(student.id, [])
+                    if elder.phone == in_reply_to and is_sms_eligible(elder)
+                    ]
+                post.to_sms = bool(post.meta['sms'])
+            else:
+                post.meta['sms'] = []
+            posts.append(post)
+        # bulk_create doesn't set primary keys, and nothing else identifies
+        # these rows uniquely; so reserve their IDs up front
+        for post, post_id in zip(posts, reserve_ids(cls, len(posts))):
+            post.id = post_id
+        cls.objects.bulk_create(posts)
+
+        # mark the posts unread by all web users in village (except author)
+        unread.mark_unread_many(
+            (post, elder)
+            for post in posts
+            for elder in elders_by_student_id.get(post.student_id, [])
+            if elder.user.email and elder != author
+            )
+
+        tasks.push_event.delay('posted_many', [post.id for post in posts])
+
+        if notifications:
+            tasks.record_notification.delay('post_all_many', posts)
+
+        if author and not author.has_posted:
+            user_models.Profile.objects.filter(pk=author.pk).update(
+                has_posted=True)
+
+        return posts
+
+
     def get_relationship(self):
         """Return Relationship between author and student, or None."""
         return self.relationship
@@ -414,6 +530,18 @@ class PostAttachment(models.Model):
 
 
 
+def reserve_ids(model, count):
+    """Reserve and return ``count`` new primary keys for ``model``."""
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+        "FROM generate_series(1, %s)",
+        [model._meta.db_table, model._meta.pk.column, count],
+        )
+    return [row[0] for row in cursor.fetchall()]
+
+
+
 def text2html(text):
     """Process given post text to HTML."""
     return html.escape(text).replace('\n', '<br>')
@@ -8,6 +8,22 @@ def mark_unread(post, profile):
     redis.client.sadd(make_key(post.student, profile), post.id)
 
 
+def mark_unread_many(pairs):
+    """
+    Mark posts unread by profiles, given iterable of (post, profile) pairs.
+
+    All marking is pipelined into a single Redis round-trip.
+
+    """
+    p = None
+    for post, profile in pairs:
+        if p is None:
+            p = redis.client.pipeline()
+        p.sadd(make_key(post.student, profile), post.id)
+    if p is not None:
+        p.execute()
+
+
 def mark_read(post, profile):
     """Mark given post read by given profile."""
     redis.client.srem(make_key(post.student, profile), post.id)
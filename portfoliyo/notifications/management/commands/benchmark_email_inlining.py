@@ -0,0 +1,119 @@
+"""Benchmark CSS inlining throughput for notification emails."""
+from optparse import make_option
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.template.loader import render_to_string
+import premailer
+
+from portfoliyo import model, redis, xact
+from portfoliyo.notifications import record
+from portfoliyo.notifications.render import base, collect, inline
+
+
+
+class Rollback(Exception):
+    """Raised (with the rendered digest HTML) to roll back benchmark data."""
+    pass
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Render a sample activity digest and report emails/sec for inlining "
+        "its CSS with plain premailer and with the cached inliner. All data "
+        "is rolled back and Redis writes go to an in-memory fake."
+        )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--posts',
+            type='int',
+            default=10,
+            help="Number of posts in the sample digest (default 10).",
+            ),
+        make_option(
+            '--repeat',
+            type='int',
+            default=50,
+            help="Number of emails to inline per method (default 50).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        orig_client = redis.client
+        redis.client = redis.InMemoryRedis()
+        try:
+            html = self.render_digest(options['posts'])
+        finally:
+            redis.client = orig_client
+
+        plain, plain_html = self.time_inlining(plain_transform, html, repeat)
+        cached, cached_html = self.time_inlining(
+            inline.transform, html, repeat)
+
+        self.stdout.write("%8s %12s\n" % ("method", "emails/sec"))
+        self.stdout.write("%8s %12.1f\n" % ("plain", repeat / plain))
+        self.stdout.write("%8s %12.1f\n" % ("cached", repeat / cached))
+        if cached_html != plain_html:
+            self.stderr.write("Warning: inlined output differs!\n")
+
+
+    def time_inlining(self, transform, html, repeat):
+        """Return (total seconds, output) for inlining ``html`` repeatedly."""
+        start = time.time()
+        for i in range(repeat):
+            output = transform(html)
+        return time.time() - start, output
+
+
+    def render_digest(self, num_posts):
+        """Return HTML (pre-inlining) of a digest with ``num_posts`` posts."""
+        try:
+            with xact.xact():
+                school = model.School.objects.create(
+                    name="Benchmark School", postcode="bench-%s" % time.time())
+                teacher = model.Profile.create_with_user(
+                    school=school,
+                    name="Benchmark Teacher",
+                    email="bench-teacher-%s@example.com" % time.time(),
+                    school_staff=True,
+                    )
+                student = model.Profile.create_with_user(
+                    school=school, name="Benchmark Student")
+                parent = model.Profile.create_with_user(
+                    school=school, name="Benchmark Parent")
+                model.Relationship.objects.create(
+                    from_profile=teacher,
+                    to_profile=student,
+                    level=model.Relationship.LEVEL.owner,
+                    )
+                model.Relationship.objects.create(
+                    from_profile=parent, to_profile=student)
+                for i in range(num_posts):
+                    post = model.Post.create(
+                        parent,
+                        student,
+                        "Benchmark post %s" % i,
+                        notifications=False,
+                        )
+                    record.post(teacher, post)
+                collection = collect.NotificationCollection(
+                    teacher, clear=False)
+                context = collection.context
+                context['BASE_URL'] = settings.PORTFOLIYO_BASE_URL
+                raise Rollback(render_to_string(base.HTML_TEMPLATE, context))
+        except Rollback as r:
+            return r.args[0]
+
+
+
+def plain_transform(html):
+    """Inline ``html`` the way ``render`` did before inlining was cached."""
+    return premailer.Premailer(
+        html,
+        base_url=settings.PORTFOLIYO_BASE_URL,
+        output_xhtml=True,
+        ).transform()
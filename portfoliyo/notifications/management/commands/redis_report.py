@@ -0,0 +1,66 @@
+"""Report Redis key counts and approximate memory use by key family."""
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from redis.exceptions import ResponseError
+
+from portfoliyo import redis
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Scan all Redis keys and report, for each key family (the part of "
+        "the key before the first colon, e.g. notify, unread, "
+        "announcements), the number of keys and their approximate size. "
+        "Sizes are extrapolated from the serialized length (DEBUG OBJECT) "
+        "of a sample of each family's keys."
+        )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--sample',
+            type='int',
+            default=100,
+            help="Number of keys per family to measure (default 100).",
+            ),
+        )
+
+
+    def handle(self, *args, **options):
+        sample = options['sample']
+        counts = {}
+        samples = {}
+        cursor = 0
+        while True:
+            cursor, keys = redis.scan(cursor, count=1000)
+            for key in keys:
+                family = key.split(':', 1)[0]
+                counts[family] = counts.get(family, 0) + 1
+                family_sample = samples.setdefault(family, [])
+                if len(family_sample) < sample:
+                    family_sample.append(key)
+            if not cursor:
+                break
+
+        self.stdout.write("%-16s %10s %14s\n" % ("family", "keys", "~bytes"))
+        for family in sorted(counts):
+            size = self.estimate_size(samples[family], counts[family])
+            self.stdout.write(
+                "%-16s %10s %14s\n" % (
+                    family, counts[family], "?" if size is None else size)
+                )
+
+
+    def estimate_size(self, keys, total):
+        """Estimate size of ``total`` keys from measuring sample ``keys``."""
+        sizes = []
+        for key in keys:
+            try:
+                info = redis.client.debug_object(key)
+            except ResponseError:
+                # key expired since the scan, or DEBUG is disabled
+                continue
+            sizes.append(int(info.get('serializedlength', 0)))
+        if not sizes:
+            return None
+        return sum(sizes) * total // len(sizes)
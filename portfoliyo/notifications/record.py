@@ -1,8 +1,38 @@
 """Record notifications."""
+from contextlib import contextmanager
+import threading
+
 from django.conf import settings
 
-from portfoliyo import tasks
-from . import store, types
+from . import schedule, store, types
+
+
+
+_batch = threading.local()
+
+
+
+@contextmanager
+def batch():
+    """
+    Context manager: record all notifications within block in one go.
+
+    Notifications recorded within the block are stored at its end in a single
+    Redis round-trip, and notification emails they trigger are scheduled
+    together (once per profile). If the block raises an exception, nothing
+    is recorded. Nested batches are part of the outermost batch.
+
+    """
+    if getattr(_batch, 'notifications', None) is not None:
+        yield
+        return
+    _batch.notifications = []
+    try:
+        yield
+        notifications = _batch.notifications
+    finally:
+        _batch.notifications = None
+    _record_many(notifications)
 
 
 
@@ -11,8 +41,18 @@ def post_all(p):
     if not p.author:
         return
     record_func = bulk_post if p.is_bulk else post
-    for profile in p.elders_in_context.exclude(pk=p.author.pk):
-        record_func(profile, p)
+    with batch():
+        for profile in p.elders_in_context.exclude(
+                pk=p.author.pk).select_related('user'):
+            record_func(profile, p)
+
+
+
+def post_all_many(posts):
+    """Send all appropriate notifications for creation of given posts."""
+    with batch():
+        for p in posts:
+            post_all(p)
 
 
 
@@ -81,7 +121,26 @@ def _record(profile, name, triggering=False, data=None):
     """Record a notification for the given profile."""
     if profile.user.email is None or not profile.user.is_active:
         return
+    pending = getattr(_batch, 'notifications', None)
+    if pending is not None:
+        pending.append((profile.id, name, triggering, data))
+        return
     store.store(profile.id, name, triggering=triggering, data=data)
     # @@@ later this will be only if user prefers instant notifications
     if triggering and settings.NOTIFICATION_EMAILS:
-        tasks.send_notification_email.delay(profile.id)
+        schedule.schedule([profile.id])
+
+
+
+def _record_many(notifications):
+    """Record (profile_id, name, triggering, data) notifications at once."""
+    if not notifications:
+        return
+    store.store_many(notifications)
+    if settings.NOTIFICATION_EMAILS:
+        profile_ids = []
+        for profile_id, name, triggering, data in notifications:
+            if triggering and profile_id not in profile_ids:
+                profile_ids.append(profile_id)
+        if profile_ids:
+            schedule.schedule(profile_ids)
@@ -3,16 +3,22 @@ import re
 
 from django.conf import settings
 from django.template.loader import render_to_string
-import premailer
 
 from portfoliyo import email
 from portfoliyo import model
-from . import collect
+from portfoliyo import redis
+from . import collect, inline
 
 
 HTML_TEMPLATE = 'notifications/activity.html'
 TEXT_TEMPLATE = 'notifications/activity.txt'
 
+RENDER_LEASE_KEY_PATTERN = 'notify:profiles:%s:render-lease'
+RENDER_SKIPPED_KEY = 'notify:render:skipped'
+
+# seconds before a render lease lapses (if its holder died)
+RENDER_LEASE_SECONDS = 5 * 60
+
 
 consecutive_newlines = re.compile('\n\n+')
 
@@ -28,11 +34,31 @@ def send(profile_id, clear=True):
     Send activity notification(s) to user with given profile ID.
 
     If ``clear`` is ``True`` (the default), clear all notifications for this
-    profile ID.
+    profile ID. Only one such send per profile runs at a time; if another is
+    already in progress, this one is skipped (and counted, see
+    ``skipped_renders``). Notifications the other send had already fetched go
+    out with it; any recorded since are left pending (the profile stays in
+    the pending set), so the next pending-notifications sweep sends them.
 
     Return ``True`` if email was sent, ``False`` otherwise.
 
     """
+    lease = None
+    if clear:
+        lease = take_lease(profile_id)
+        if lease is None:
+            redis.client.incr(RENDER_SKIPPED_KEY)
+            return False
+    try:
+        return _send(profile_id, clear)
+    finally:
+        if lease is not None:
+            release_lease(profile_id, lease)
+
+
+
+def _send(profile_id, clear):
+    """Send notification email to given profile ID; return True if sent."""
     profile = model.Profile.objects.select_related('user').get(pk=profile_id)
     user = profile.user
     # bail out if user can't receive notification emails anyway
@@ -72,10 +98,37 @@ def render(profile, clear=True):
 
     text = consecutive_newlines.sub(
         '\n\n', render_to_string(TEXT_TEMPLATE, context))
-    html = premailer.Premailer(
-        render_to_string(HTML_TEMPLATE, context),
-        base_url=settings.PORTFOLIYO_BASE_URL,
-        output_xhtml=True,
-        ).transform()
+    html = inline.transform(render_to_string(HTML_TEMPLATE, context))
 
     return subject, text, html
+
+
+
+def take_lease(profile_id):
+    """
+    Try to take the render lease for ``profile_id``.
+
+    Return the lease token (needed to release it) if taken, else ``None``. The
+    lease lapses after ``RENDER_LEASE_SECONDS`` even if not released.
+
+    """
+    return redis.take_lease(
+        make_render_lease_key(profile_id), RENDER_LEASE_SECONDS)
+
+
+
+def release_lease(profile_id, token):
+    """Release the render lease for ``profile_id``, if ``token`` holds it."""
+    redis.release_lease(make_render_lease_key(profile_id), token)
+
+
+
+def skipped_renders():
+    """Return number of sends skipped because a render was in progress."""
+    return int(redis.client.get(RENDER_SKIPPED_KEY) or 0)
+
+
+
+def make_render_lease_key(profile_id):
+    """Construct Redis key for the render lease for given profile ID."""
+    return RENDER_LEASE_KEY_PATTERN % profile_id
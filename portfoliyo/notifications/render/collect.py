@@ -3,6 +3,7 @@ import logging
 
 from .. import store
 from .collectors import COLLECTOR_CLASSES
+from .collectors.base import load_objects
 
 
 
@@ -79,6 +80,8 @@ class NotificationCollection(object):
 
 
     def _hydrate(self):
+        # load objects for all notifications up front, one query per model
+        objects = load_objects(self.notification_data, COLLECTOR_CLASSES)
         collectors = {}
         for data in self.notification_data:
             name = data.pop('name', None)
@@ -88,7 +91,7 @@ class NotificationCollection(object):
                 logger.warning("Unknown notification type '%s'", name)
                 continue
             collector = collectors.setdefault(
-                name, collector_class(self.profile))
+                name, collector_class(self.profile, objects))
             try:
                 collector.add(data)
             except SwitchType as switch:
@@ -38,6 +38,60 @@ class RehydrationFailed(Exception):
 
 
 
+def load_objects(notification_data, collector_classes):
+    """
+    Load all database objects referred to by ``notification_data``.
+
+    ``collector_classes`` maps notification type names to collector classes,
+    whose ``db_lookup`` attributes say which keys in the data are IDs of which
+    model.
+
+    Returns a dictionary mapping model class to a dictionary mapping primary
+    key to model instance (or ``None`` if there's no such object), suitable
+    for passing to collectors. Makes one query per model class, regardless of
+    the number of notifications. Then each collector class with notifications
+    may load further objects in bulk (see ``load_related``).
+
+    """
+    used_classes = set()
+    ids = {}
+    select_related = {}
+    prefetch_related = {}
+    for data in notification_data:
+        collector_class = collector_classes.get(data.get('name'))
+        if collector_class is None:
+            continue
+        used_classes.add(collector_class)
+        for src_key, (model_class, dest_key) in (
+                collector_class.db_lookup.items()):
+            try:
+                pk = int(data[src_key])
+            except (KeyError, ValueError):
+                continue
+            ids.setdefault(model_class, set()).add(pk)
+            select_related.setdefault(model_class, set()).update(
+                collector_class.db_select_related.get(dest_key, []))
+            prefetch_related.setdefault(model_class, set()).update(
+                collector_class.db_prefetch_related.get(dest_key, []))
+
+    objects = {}
+    for model_class, pks in ids.items():
+        qs = model_class.objects.all()
+        if select_related[model_class]:
+            qs = qs.select_related(*select_related[model_class])
+        if prefetch_related[model_class]:
+            qs = qs.prefetch_related(*prefetch_related[model_class])
+        instances = dict.fromkeys(pks)
+        instances.update(qs.in_bulk(list(pks)))
+        objects[model_class] = instances
+
+    for collector_class in used_classes:
+        collector_class.load_related(objects)
+
+    return objects
+
+
+
 class NotificationTypeCollector(object):
     """
     Base class for collections of notifications of the same type.
@@ -58,13 +112,18 @@ class NotificationTypeCollector(object):
     subject_template = None
     #  mapping of source data ID keys to lookup model and hydrated data key
     db_lookup = {}
+    #  mapping of hydrated data key to related fields to select/prefetch
+    db_select_related = {}
+    db_prefetch_related = {}
     #  what notification preference does this collector map to?
     notification_pref = None
 
 
     """Base class for notification types."""
-    def __init__(self, profile):
+    def __init__(self, profile, objects=None):
         self.profile = profile
+        # maps model class to dict of pre-loaded instances (or None) by pk
+        self.objects = {} if objects is None else objects
         self.notifications = []
 
 
@@ -99,17 +158,40 @@ class NotificationTypeCollector(object):
         model class and key for the hydrated data), raise
         ``RehydrationFailed``.
 
+        Objects already loaded in ``self.objects`` (see ``load_objects``) are
+        not queried for again.
+
         """
         hydrated = {}
         for src_key, (model_class, dest_key) in self.db_lookup.items():
             try:
-                hydrated[dest_key] = model_class.objects.get(pk=data[src_key])
-            except (KeyError, model_class.DoesNotExist):
+                pk = int(data[src_key])
+                instances = self.objects.get(model_class, {})
+                if pk in instances:
+                    instance = instances[pk]
+                else:
+                    instance = model_class.objects.get(pk=pk)
+            except (KeyError, ValueError, model_class.DoesNotExist):
                 raise RehydrationFailed()
+            if instance is None:
+                raise RehydrationFailed()
+            hydrated[dest_key] = instance
 
         return hydrated
 
 
+    @classmethod
+    def load_related(cls, objects):
+        """
+        Load (in bulk) any further objects needed, given loaded ``objects``.
+
+        ``objects`` is as built by ``load_objects``; add to it in place. Called
+        once per render, for each collector class with notifications.
+
+        """
+        pass
+
+
     def get_context(self):
         """Get template context for this notification type."""
         return {}
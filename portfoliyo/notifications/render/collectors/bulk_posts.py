@@ -82,9 +82,16 @@ class BulkPostCollector(base.NotificationTypeCollector):
     type_name = types.BULK_POST
     subject_template = 'notifications/activity/_bulk_posts.subject.txt'
     db_lookup = {'bulk-post-id': (model.BulkPost, 'bulk-post')}
+    db_select_related = {'bulk-post': ['author__user']}
     notification_pref = 'notify_teacher_post'
 
 
+    def __init__(self, *args, **kw):
+        super(BulkPostCollector, self).__init__(*args, **kw)
+        # maps bulk-post ID to list of its sub-posts visible to self.profile
+        self._visible = None
+
+
     def get_context(self):
         collection = BulkPostCollection()
         for n in self.notifications:
@@ -100,15 +107,12 @@ class BulkPostCollector(base.NotificationTypeCollector):
         """Determine how many villages I see this post in."""
         hydrated = super(BulkPostCollector, self).hydrate(data)
         bulk_post = hydrated['bulk-post']
-        # triggered individual posts that are in villages I am in
-        visible = list(
-            bulk_post.triggered.filter(
-                student__relationships_to__from_profile=self.profile).distinct(
-                ).select_related('student')
-            )
+        visible = self.get_visible_posts(bulk_post)
         # if only one triggered post is visible, treat it as a non-bulk post
         if len(visible) == 1:
             from .. import collect
+            # save the post collector from querying for the post again
+            self.objects.setdefault(model.Post, {})[visible[0].id] = visible[0]
             raise collect.SwitchType(
                 types.POST,
                 {'post-id': visible[0].id, 'triggering': data['triggering']}
@@ -121,5 +125,38 @@ class BulkPostCollector(base.NotificationTypeCollector):
         return hydrated
 
 
+    def get_visible_posts(self, bulk_post):
+        """
+        Return triggered posts of ``bulk_post`` in villages I am in.
+
+        On first call, finds visible posts for all pre-loaded bulk posts (see
+        ``base.load_objects``) at once, in a single query.
+
+        """
+        if self._visible is None:
+            bulk_post_ids = [
+                pk for pk, bp in self.objects.get(model.BulkPost, {}).items()
+                if bp is not None
+                ]
+            self._visible = dict((pk, []) for pk in bulk_post_ids)
+            if bulk_post_ids:
+                for post in self._visible_posts().filter(
+                        from_bulk__in=bulk_post_ids):
+                    self._visible[post.from_bulk_id].append(post)
+        if bulk_post.id not in self._visible:
+            self._visible[bulk_post.id] = list(
+                self._visible_posts().filter(from_bulk=bulk_post))
+        return self._visible[bulk_post.id]
+
+
+    def _visible_posts(self):
+        """Queryset of triggered posts that are in villages I am in."""
+        return model.Post.objects.filter(
+            student__relationships_to__from_profile=self.profile).distinct(
+            ).select_related(
+            'student', 'author__user', 'relationship').prefetch_related(
+            'attachments')
+
+
     def get_students(self):
         return [s for n in self.notifications for s in n['students']]
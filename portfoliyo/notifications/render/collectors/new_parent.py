@@ -4,6 +4,10 @@ from portfoliyo.notifications import types
 from . import base
 
 
+# key in loaded objects (see ``base.load_objects``) for signup relationships
+SIGNUP_RELATIONSHIPS = 'signup-relationships'
+
+
 
 class Signup(object):
     """Encapsulates a single family-member signing up in a single village."""
@@ -15,13 +19,26 @@ class Signup(object):
 
 
     @classmethod
-    def from_textsignup(cls, text_signup):
-        """Instantiate from a ``TextSignup`` model instance."""
-        try:
-            rel = model.Relationship.objects.get(
-                from_profile=text_signup.family,
-                to_profile=text_signup.student)
-        except model.Relationship.DoesNotExist:
+    def from_textsignup(cls, text_signup, relationships=None):
+        """
+        Instantiate from a ``TextSignup`` model instance.
+
+        If given, ``relationships`` maps (family ID, student ID) to
+        ``Relationship`` (see ``NewParentCollector.load_related``); the
+        signup's relationship is looked up there instead of queried for.
+
+        """
+        if relationships is None:
+            try:
+                rel = model.Relationship.objects.get(
+                    from_profile=text_signup.family,
+                    to_profile=text_signup.student)
+            except model.Relationship.DoesNotExist:
+                rel = None
+        else:
+            rel = relationships.get(
+                (text_signup.family_id, text_signup.student_id))
+        if rel is None:
             role = text_signup.family.role
         else:
             role = rel.description_or_role
@@ -42,13 +59,33 @@ class NewParentCollector(base.NotificationTypeCollector):
     type_name = types.NEW_PARENT
     subject_template = 'notifications/activity/_new_parents.subject.txt'
     db_lookup = {'signup-id': (model.TextSignup, 'signup')}
+    db_select_related = {'signup': ['student', 'family', 'group']}
     notification_pref = 'notify_new_parent'
 
 
+    @classmethod
+    def load_related(cls, objects):
+        """Load relationships between all signed-up families and students."""
+        signups = [
+            signup for signup in objects.get(model.TextSignup, {}).values()
+            if signup is not None and signup.student_id
+            ]
+        relationships = {}
+        if signups:
+            rels = model.Relationship.objects.filter(
+                from_profile__in=set(s.family_id for s in signups),
+                to_profile__in=set(s.student_id for s in signups),
+                ).select_related('from_profile')
+            for rel in rels:
+                relationships[(rel.from_profile_id, rel.to_profile_id)] = rel
+        objects[SIGNUP_RELATIONSHIPS] = relationships
+
+
     def get_context(self):
+        relationships = self.objects.get(SIGNUP_RELATIONSHIPS)
         return {
             'signups': [
-                Signup.from_textsignup(n['signup'])
+                Signup.from_textsignup(n['signup'], relationships)
                 for n in self.notifications
                 ],
             'any_requested_new_parent': self.any_requested(),
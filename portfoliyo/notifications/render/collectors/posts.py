@@ -1,6 +1,7 @@
 """Post notification collector."""
 from datetime import timedelta
 
+from django.db import connection
 from django.utils import timezone
 
 from portfoliyo import model, serializers
@@ -9,6 +10,13 @@ from . import base
 
 
 
+# number of latest posts in a village to consider for context
+CONTEXT_POSTS = 5
+# how recent a post must be to be shown as context
+CONTEXT_HOURS = 48
+
+
+
 def serialize_post(post, **extra):
     """Transform ``Post`` instance into its serialized representation."""
     extra['plain_text'] = post.original_text
@@ -61,22 +69,73 @@ class Village(object):
     def context_posts(self):
         """List of context posts."""
         if self._context_posts is None:
-            cutoff = timezone.now() - timedelta(hours=48)
             # get latest five posts in village, excluding the new ones
             latest = list(
                 self.student.posts_in_village.exclude(
                     pk__in=[p['post_id'] for p in self.new_posts]).order_by(
-                    '-timestamp')[:5]
+                    '-timestamp')[:CONTEXT_POSTS]
                 )
-            # only keep those within last 48 hours
-            ctx = [p for p in latest if p.timestamp > cutoff]
-            # if there are posts but they are all old, keep one
-            if latest and not ctx:
-                ctx = list(latest)[-1:]
-            self._context_posts = [serialize_post(p, new=False) for p in ctx]
+            self.set_context_posts(latest)
         return self._context_posts
 
 
+    def set_context_posts(self, latest):
+        """Set context posts given latest (non-new) posts, newest first."""
+        cutoff = timezone.now() - timedelta(hours=CONTEXT_HOURS)
+        # only keep those within last 48 hours
+        ctx = [p for p in latest if p.timestamp > cutoff]
+        # if there are posts but they are all old, keep one
+        if latest and not ctx:
+            ctx = list(latest)[-1:]
+        self._context_posts = [serialize_post(p, new=False) for p in ctx]
+
+
+
+def load_context_posts(villages):
+    """
+    Set context posts for all given villages, with a single query.
+
+    A window function ranks each village's posts (other than the new ones)
+    by recency, and the latest ``CONTEXT_POSTS`` for every village are fetched
+    together, with attachments prefetched.
+
+    """
+    villages = list(villages)
+    if not villages:
+        return
+    student_ids = [v.student.id for v in villages]
+    new_post_ids = [p['post_id'] for v in villages for p in v.new_posts]
+
+    table = connection.ops.quote_name(model.Post._meta.db_table)
+    exclude = ''
+    if new_post_ids:
+        exclude = 'AND id NOT IN (%s)' % ', '.join(['%s'] * len(new_post_ids))
+    where = (
+        "%(table)s.id IN ("
+        "SELECT id FROM ("
+        "SELECT id, row_number() OVER ("
+        "PARTITION BY student_id ORDER BY timestamp DESC, id DESC"
+        ") AS position FROM %(table)s "
+        "WHERE student_id IN (%(students)s) %(exclude)s"
+        ") AS ranked WHERE position <= %%s)" % {
+            'table': table,
+            'students': ', '.join(['%s'] * len(student_ids)),
+            'exclude': exclude,
+            }
+        )
+    posts = model.Post.objects.extra(
+        where=[where], params=student_ids + new_post_ids + [CONTEXT_POSTS],
+        ).select_related('author__user', 'relationship').prefetch_related(
+        'attachments').order_by('-timestamp', '-id')
+
+    posts_by_student_id = {}
+    for post in posts:
+        posts_by_student_id.setdefault(post.student_id, []).append(post)
+    for village in villages:
+        village.set_context_posts(
+            posts_by_student_id.get(village.student.id, []))
+
+
 
 class PostCollector(base.NotificationTypeCollector):
     """
@@ -97,6 +156,9 @@ class PostCollector(base.NotificationTypeCollector):
     type_name = types.POST
     subject_template = 'notifications/activity/_village_posts.subject.txt'
     db_lookup = {'post-id': (model.Post, 'post')}
+    db_select_related = {
+        'post': ['author__user', 'student', 'relationship']}
+    db_prefetch_related = {'post': ['attachments']}
 
 
     def __init__(self, *args, **kw):
@@ -118,6 +180,7 @@ class PostCollector(base.NotificationTypeCollector):
             village.add(notification)
 
         villages = villages.values()
+        load_context_posts(villages)
         requested = []
         nonrequested = []
         for village in villages:
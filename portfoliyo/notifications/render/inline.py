@@ -0,0 +1,122 @@
+"""
+CSS inlining for notification emails, with the per-email setup cached.
+
+Every notification email is rendered from the same template, so its
+``<style>`` block is the same from one email to the next; only the markup it
+applies to differs. Plain ``premailer`` re-parses that stylesheet and
+re-compiles every selector in it (CSS to XPath, then XPath to an lxml
+evaluator) for each email it inlines, which is most of its cost for our
+small digests. Here we parse each distinct stylesheet once per process, and
+compile each distinct selector once per thread (lxml evaluators shouldn't be
+shared between threads); the inlined output is unchanged. The caching
+relies on premailer internals, so with any premailer version other than the
+one it was checked against we fall back to plain premailer.
+
+The stylesheet is not pre-inlined into the templates at deploy time, because
+the digest markup it applies to is only known at render time.
+
+"""
+import logging
+import threading
+import types
+
+from django.conf import settings
+import premailer
+from lxml.cssselect import CSSSelector
+
+
+# ``CachedPremailer`` relies on premailer internals (``_parse_style_rules``,
+# and ``transform`` looking up ``CSSSelector`` in its module globals), so is
+# only used with this premailer version; check them again before upgrading
+PREMAILER_VERSION = '1.12'
+
+# more distinct stylesheets than this and we stop caching new ones
+MAX_CACHED_STYLESHEETS = 16
+
+
+logger = logging.getLogger(__name__)
+
+_style_rules = {}
+_local = threading.local()
+
+
+
+def transform(html):
+    """Return ``html`` with its ``<style>`` CSS moved into style attributes."""
+    return inliner(
+        html,
+        base_url=settings.PORTFOLIYO_BASE_URL,
+        output_xhtml=True,
+        ).transform()
+
+
+
+def compile_selector(css):
+    """Return a (per-thread cached) compiled ``CSSSelector`` for ``css``."""
+    try:
+        selectors = _local.selectors
+    except AttributeError:
+        selectors = _local.selectors = {}
+    try:
+        return selectors[css]
+    except KeyError:
+        selector = selectors[css] = CSSSelector(css)
+        return selector
+
+
+
+def choose_inliner(version):
+    """
+    Return the ``Premailer`` class to inline with, given premailer ``version``.
+
+    That's ``CachedPremailer`` if it's been checked against ``version``; else
+    (with a logged warning) plain, uncached ``premailer.Premailer``.
+
+    """
+    if version == PREMAILER_VERSION:
+        return CachedPremailer
+    logger.warning(
+        "Cached CSS inlining needs premailer %s, not %s; inlining uncached."
+        % (PREMAILER_VERSION, version)
+        )
+    return premailer.Premailer
+
+
+
+def _with_globals(function, **overrides):
+    """Return a copy of ``function`` that sees ``overrides`` as globals."""
+    return types.FunctionType(
+        function.func_code,
+        dict(function.func_globals, **overrides),
+        function.func_name,
+        function.func_defaults,
+        function.func_closure,
+        )
+
+
+
+class CachedPremailer(premailer.Premailer):
+    """A ``Premailer`` that caches stylesheet parses and compiled selectors."""
+    # premailer's own transform, but compiling selectors via our cache (so
+    # premailer itself is left untouched for any other users)
+    transform = _with_globals(
+        premailer.Premailer.transform.im_func, CSSSelector=compile_selector)
+
+
+    def _parse_style_rules(self, css_body):
+        """Parse stylesheet ``css_body``, or return the cached parse of it."""
+        key = (
+            css_body, self.exclude_pseudoclasses, self.include_star_selectors)
+        try:
+            rules, leftover = _style_rules[key]
+        except KeyError:
+            rules, leftover = super(
+                CachedPremailer, self)._parse_style_rules(css_body)
+            if len(_style_rules) < MAX_CACHED_STYLESHEETS:
+                _style_rules[key] = (rules, leftover)
+        # premailer extends these lists; don't hand it our cached copies
+        return list(rules), list(leftover)
+
+
+
+inliner = choose_inliner(premailer.__version__)
@@ -0,0 +1,109 @@
+"""
+Debounced scheduling of notification emails.
+
+A triggering notification doesn't send its profile's notification email right
+away; it arms a send ``NOTIFICATION_DEBOUNCE_SECONDS`` later. Further
+triggering notifications for that profile while its send is armed don't
+schedule any more sends; the armed send will include them. So a burst of
+activity in a busy village produces one email per teacher, not one per post.
+
+If ``NOTIFICATION_DEBOUNCE_SECONDS`` is zero, every trigger sends right away.
+
+"""
+from django.conf import settings
+
+from portfoliyo import redis, tasks
+
+
+ARMED_KEY_PATTERN = 'notify:profiles:%s:send-armed'
+
+# an armed mark outlives its scheduled send by this many seconds (in case the
+# send is lost, so the profile isn't left armed forever)
+ARMED_GRACE_SECONDS = 5 * 60
+
+
+
+# Arm each given profile's send, unless already armed; return IDs of profiles
+# newly armed.
+#
+# KEYS: armed key per profile
+# ARGV: expiry (seconds), then profile ID per profile
+_ARM_LUA = """
+local armed = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('SETNX', key, '1') == 1 then
+        redis.call('EXPIRE', key, ARGV[1])
+        armed[#armed + 1] = ARGV[i + 1]
+    end
+end
+return armed
+"""
+
+
+
+def _arm_in_memory(client, keys, args):
+    """Python implementation of ``_ARM_LUA``, for ``InMemoryRedis``."""
+    armed = []
+    for key, profile_id in zip(keys, args[1:]):
+        if client.setnx(key, '1'):
+            client.expire(key, int(args[0]))
+            armed.append(str(profile_id))
+    return armed
+
+
+
+_arm_script = redis.Script(_ARM_LUA, _arm_in_memory)
+
+
+
+def schedule(profile_ids):
+    """Schedule (debounced) notification emails to given profile IDs."""
+    window = settings.NOTIFICATION_DEBOUNCE_SECONDS
+    if not window:
+        tasks.send_notification_emails.delay(list(profile_ids))
+        return
+    armed = arm(profile_ids, window + ARMED_GRACE_SECONDS)
+    if armed:
+        tasks.send_notification_emails.apply_async(
+            (armed,), countdown=window)
+
+
+
+def arm(profile_ids, expiry):
+    """
+    Arm sends to given profile IDs; return list of IDs not already armed.
+
+    Armed marks lapse after ``expiry`` seconds if not disarmed. Takes one
+    Redis round-trip.
+
+    """
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return []
+    armed = _arm_script(
+        keys=[make_armed_key(pid) for pid in profile_ids],
+        args=[expiry] + profile_ids,
+        )
+    return [int(pid) for pid in armed]
+
+
+
+def disarm(profile_ids):
+    """
+    Disarm sends to given profile IDs (because they are being sent now).
+
+    Later triggering notifications for these profiles will arm a new send.
+
+    """
+    if not settings.NOTIFICATION_DEBOUNCE_SECONDS:
+        return
+    p = redis.client.pipeline()
+    for profile_id in profile_ids:
+        p.delete(make_armed_key(profile_id))
+    p.execute()
+
+
+
+def make_armed_key(profile_id):
+    """Construct Redis key marking an armed send for given profile ID."""
+    return ARMED_KEY_PATTERN % profile_id
@@ -1,4 +1,20 @@
-"""Notification storage and retrieval."""
+"""
+Notification storage and retrieval.
+
+Each profile's notifications are stored in three keys: a counter allocating
+notification IDs, a sorted set of pending notification IDs (scored by
+expiry), and a hash mapping notification ID to its data, packed into one
+compact string. The data hash expires after the profile's latest
+notification does; until then, expired and cleared notifications are removed
+from it by ``trim_expired`` and ``get_all``.
+
+Notifications used to be stored with a hash key (and an expiry) apiece. Any
+such notifications are still read, and can be moved into the compact layout
+with ``migrate_legacy``; they'll all have expired anyway a
+``NOTIFICATION_EXPIRY_SECONDS`` after deploying the compact layout.
+
+"""
+import json
 import time
 
 from django.conf import settings
@@ -7,8 +23,11 @@ from portfoliyo import redis
 
 
 PENDING_PROFILES_KEY = 'notify:pending:profile-ids'
+SWEEP_LEASE_KEY = 'notify:pending:sweep-lease'
 NEXT_NOTIFICATION_ID_KEY_PATTERN = 'notify:profiles:%s:next-notification-id'
 PENDING_NOTIFICATIONS_KEY_PATTERN = 'notify:profiles:%s:pending'
+NOTIFICATION_DATA_KEY_PATTERN = 'notify:profiles:%s:data'
+# legacy layout: a hash key per notification
 NOTIFICATION_KEY_PATTERN = 'notify:profiles:%s:notifications:%s'
 
 
@@ -19,6 +38,156 @@ def pending_profile_ids():
 
 
 
+def scan_pending_profile_ids(cursor=0, count=None):
+    """
+    Take one step through profile IDs with pending triggering notifications.
+
+    Return (next cursor, list of profile IDs); pass the cursor to the next
+    call, until it is 0. ``count`` is a hint for how many IDs to return. A
+    profile ID may be returned more than once in a full scan.
+
+    """
+    cursor, profile_ids = redis.sscan(PENDING_PROFILES_KEY, cursor, count)
+    return cursor, [int(pid) for pid in profile_ids]
+
+
+
+def trim_expired(cursor=0, count=None):
+    """
+    Take one step through all profiles, removing expired pending notifications.
+
+    ``get_all`` ignores expired notifications, but (unless the profile's
+    notifications are cleared) never removes them from the pending list.
+
+    Return (next cursor, number of notifications removed); pass the cursor to
+    the next call, until it is 0. ``count`` is a hint for how many profiles to
+    examine per step.
+
+    """
+    cursor, pending_keys = redis.scan(
+        cursor, match=PENDING_NOTIFICATIONS_KEY_PATTERN % '*', count=count)
+    if not pending_keys:
+        return cursor, 0
+    keys = []
+    for pending_key in pending_keys:
+        profile_id = pending_key.split(':')[2]
+        keys.extend([pending_key, make_data_key(profile_id)])
+    return cursor, _trim_script(keys=keys, args=[int(time.time())])
+
+
+
+# For each profile: remove notifications that expired before the given time
+# from its pending notifications and its data hash. Return number removed.
+#
+# KEYS: per profile: pending-notifications key and data key
+# ARGV: timestamp
+_TRIM_LUA = """
+local removed = 0
+local before = '(' .. ARGV[1]
+for k = 1, #KEYS, 2 do
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[k], '-inf', before)
+    for _, id in ipairs(ids) do
+        redis.call('HDEL', KEYS[k + 1], id)
+    end
+    removed = removed + redis.call('ZREMRANGEBYSCORE', KEYS[k], '-inf', before)
+end
+return removed
+"""
+
+
+
+def _trim_in_memory(client, keys, args):
+    """Python implementation of ``_TRIM_LUA``, for ``InMemoryRedis``."""
+    removed = 0
+    before = '(%s' % args[0]
+    for pending_key, data_key in zip(keys[::2], keys[1::2]):
+        for notification_id in client.zrangebyscore(
+                pending_key, '-inf', before):
+            client.hdel(data_key, notification_id)
+        removed += client.zremrangebyscore(pending_key, '-inf', before)
+    return removed
+
+
+
+_trim_script = redis.Script(_TRIM_LUA, _trim_in_memory)
+
+
+
+def migrate_legacy(cursor=0, count=None):
+    """
+    Take one step moving notifications from legacy to compact layout.
+
+    Return (next cursor, number of notifications moved); pass the cursor to
+    the next call, until it is 0. ``count`` is a hint for how many legacy
+    notifications to examine per step.
+
+    """
+    cursor, keys = redis.scan(
+        cursor, match=NOTIFICATION_KEY_PATTERN % ('*', '*'), count=count)
+    if not keys:
+        return cursor, 0
+
+    p = redis.client.pipeline()
+    for key in keys:
+        p.hgetall(key)
+        p.ttl(key)
+    results = p.execute()
+
+    script_keys = []
+    args = []
+    for i, key in enumerate(keys):
+        data, ttl = results[i * 2:i * 2 + 2]
+        if data:
+            profile_id, notification_id = key.split(':')[2::2]
+            script_keys.extend([key, make_data_key(profile_id)])
+            args.extend([notification_id, _pack(data), ttl])
+    if not script_keys:
+        return cursor, 0
+    return cursor, _migrate_script(keys=script_keys, args=args)
+
+
+
+# For each legacy notification: store its packed data in the profile's data
+# hash, extending (never shortening) the hash's expiry to cover it, and delete
+# the legacy key. Return number moved.
+#
+# KEYS: per notification: legacy notification key and data key
+# ARGV: per notification: notification ID, packed data, TTL of legacy key
+_MIGRATE_LUA = """
+local a = 1
+for k = 1, #KEYS, 2 do
+    redis.call('HSET', KEYS[k + 1], ARGV[a], ARGV[a + 1])
+    local ttl = tonumber(ARGV[a + 2])
+    if ttl > 0 and redis.call('TTL', KEYS[k + 1]) < ttl then
+        redis.call('EXPIRE', KEYS[k + 1], ttl)
+    end
+    redis.call('DEL', KEYS[k])
+    a = a + 3
+end
+return #KEYS / 2
+"""
+
+
+
+def _migrate_in_memory(client, keys, args):
+    """Python implementation of ``_MIGRATE_LUA``, for ``InMemoryRedis``."""
+    args = list(args)
+    for legacy_key, data_key in zip(keys[::2], keys[1::2]):
+        notification_id, packed, ttl = args[:3]
+        del args[:3]
+        client.hset(data_key, notification_id, packed)
+        ttl = int(ttl)
+        if ttl > 0 and client.ttl(data_key) < ttl:
+            client.expire(data_key, ttl)
+        client.delete(legacy_key)
+    return len(keys) // 2
+
+
+
+_migrate_script = redis.Script(_MIGRATE_LUA, _migrate_in_memory)
+
+
+
 def store(profile_id, name, triggering=False, data=None):
     """
     Store a notification for given profile ID.
@@ -32,26 +201,97 @@ def store(profile_id, name, triggering=False, data=None):
     notification; all values should be strings.
 
     """
-    data = data or {}
-    data['triggering'] = '1' if triggering else '0'
-    data['name'] = name
+    store_many([(profile_id, name, triggering, data)])
 
-    pending_key = make_pending_notifications_key(profile_id)
-    notification_id = get_next_notification_id(profile_id)
-    key = make_notification_key(profile_id, notification_id)
 
-    expiry_timestamp = time.time() + settings.NOTIFICATION_EXPIRY_SECONDS
 
-    p = redis.client.pipeline()
-    # add the notification ID to the list of pending notifications for this user
-    p.zadd(pending_key, expiry_timestamp, notification_id)
-    # Store data hash for the notification. Allow the data to exist for an
-    # extra minute so we don't ever try to query expired data
-    p.hmset(key, data).expireat(key, int(expiry_timestamp) + 60)
-    if triggering:
-        # Add user to the set of users with pending triggering notifications
-        p.sadd(PENDING_PROFILES_KEY, profile_id)
-    p.execute()
+def store_many(notifications):
+    """
+    Store many notifications at once, in a single Redis round-trip.
+
+    ``notifications`` is a list of ``(profile_id, name, triggering, data)``
+    tuples, each as for the arguments to ``store``.
+
+    """
+    if not notifications:
+        return
+    expiry_timestamp = time.time() + settings.NOTIFICATION_EXPIRY_SECONDS
+    # Allow the data to exist for an extra minute so we don't ever try to
+    # query expired data
+    data_expiry_timestamp = int(expiry_timestamp) + 60
+
+    keys = [PENDING_PROFILES_KEY]
+    args = []
+    for profile_id, name, triggering, data in notifications:
+        data = dict(data or {})
+        data['triggering'] = '1' if triggering else '0'
+        data['name'] = name
+        keys.extend([
+            NEXT_NOTIFICATION_ID_KEY_PATTERN % profile_id,
+            make_pending_notifications_key(profile_id),
+            make_data_key(profile_id),
+            ])
+        args.extend([
+            profile_id,
+            expiry_timestamp,
+            data_expiry_timestamp,
+            data['triggering'],
+            _pack(data),
+            ])
+
+    _store_script(keys=keys, args=args)
+
+
+
+# For each notification: allocate the next notification ID for the profile;
+# add it to the profile's pending notifications; store its packed data in the
+# profile's data hash (extending the hash's expiry); and if it's triggering,
+# add the profile to the set of profiles with pending triggering
+# notifications. All atomically, in one round-trip.
+#
+# KEYS: pending-profiles key, then per notification: next-ID key,
+#       pending-notifications key and data key
+# ARGV: per notification: profile ID, expiry timestamp, data expiry timestamp,
+#       triggering ('1' or '0'), packed data
+_STORE_LUA = """
+local ids = {}
+local a = 1
+for k = 2, #KEYS, 3 do
+    local id = redis.call('INCR', KEYS[k])
+    redis.call('ZADD', KEYS[k + 1], ARGV[a + 1], id)
+    redis.call('HSET', KEYS[k + 2], id, ARGV[a + 4])
+    redis.call('EXPIREAT', KEYS[k + 2], ARGV[a + 2])
+    if ARGV[a + 3] == '1' then
+        redis.call('SADD', KEYS[1], ARGV[a])
+    end
+    ids[#ids + 1] = id
+    a = a + 5
+end
+return ids
+"""
+
+
+
+def _store_in_memory(client, keys, args):
+    """Python implementation of ``_STORE_LUA``, for ``InMemoryRedis``."""
+    ids = []
+    args = list(args)
+    for next_id_key, pending_key, data_key in zip(
+            keys[1::3], keys[2::3], keys[3::3]):
+        profile_id, expiry, data_expiry, triggering, packed = args[:5]
+        del args[:5]
+        notification_id = client.incr(next_id_key)
+        client.zadd(pending_key, expiry, notification_id)
+        client.hset(data_key, notification_id, packed)
+        client.expireat(data_key, data_expiry)
+        if triggering == '1':
+            client.sadd(keys[0], profile_id)
+        ids.append(notification_id)
+    return ids
+
+
+
+_store_script = redis.Script(_STORE_LUA, _store_in_memory)
 
 
 
@@ -64,6 +304,9 @@ def get_all(profile_id, clear=False):
 
     If ``clear`` is ``True``, also clear all pending notifications.
 
+    Takes two Redis round-trips regardless of the number of notifications
+    (plus one if any are stored in the legacy layout).
+
     """
     pending_key = make_pending_notifications_key(profile_id)
     now_ts = int(time.time())
@@ -72,33 +315,79 @@ def get_all(profile_id, clear=False):
     # get non-expired pending notifications for this user
     p.zrangebyscore(pending_key, now_ts, '+inf')
     if clear:
+        # get all pending notifications, expired or not, to clear their data
+        p.zrange(pending_key, 0, -1)
         # clear the pending notifications list
         p.delete(pending_key)
         # remove user from the set of users w/ pending triggering notifications
         p.srem(PENDING_PROFILES_KEY, profile_id)
-        # don't clear out individual notification data; redis expiration will
-    ids = p.execute()[0]
+    results = p.execute()
+    ids = results[0]
+    # with the pending list gone, ``trim_expired`` can't find this profile's
+    # data, so clear expired notifications' data too
+    cleared = results[1] if clear else []
+    data_key = make_data_key(profile_id)
+    if not ids:
+        if cleared:
+            redis.client.hdel(data_key, *cleared)
+        return
+
+    p = redis.client.pipeline()
+    p.hmget(data_key, ids)
+    if cleared:
+        p.hdel(data_key, *cleared)
+    packed = p.execute()[0]
+
+    legacy = {}
+    legacy_ids = [nid for nid, data in zip(ids, packed) if data is None]
+    if legacy_ids:
+        p = redis.client.pipeline()
+        for notification_id in legacy_ids:
+            p.hgetall(make_notification_key(profile_id, notification_id))
+        legacy = dict(zip(legacy_ids, p.execute()))
 
-    for notification_id in ids:
-        yield get(profile_id, notification_id)
+    for notification_id, data in zip(ids, packed):
+        if data is None:
+            yield legacy[notification_id]
+        else:
+            yield _unpack(data)
 
 
 
 def get(profile_id, notification_id):
     """Get a notification's data by id."""
-    key = make_notification_key(profile_id, notification_id)
-    return redis.client.hgetall(key)
+    data = redis.client.hget(make_data_key(profile_id), notification_id)
+    if data is None:
+        key = make_notification_key(profile_id, notification_id)
+        return redis.client.hgetall(key)
+    return _unpack(data)
+
+
+
+def _pack(data):
+    """Pack a notification's data (a dict of strings) into a string."""
+    return json.dumps(
+        dict((k, v if isinstance(v, basestring) else str(v))
+             for k, v in data.items()),
+        separators=(',', ':'),
+        )
+
+
+
+def _unpack(packed):
+    """Unpack a notification's data packed by ``_pack``."""
+    return json.loads(packed)
 
 
 
-def get_next_notification_id(profile_id):
-    """Get the next notification ID for the given profile ID."""
-    return redis.client.incr(NEXT_NOTIFICATION_ID_KEY_PATTERN % profile_id)
+def make_data_key(profile_id):
+    """Make Redis key for a profile's hash of notification data."""
+    return NOTIFICATION_DATA_KEY_PATTERN % profile_id
 
 
 
 def make_notification_key(profile_id, notification_id):
-    """Make Redis key for a notification's data."""
+    """Make Redis key for a notification's data (in the legacy layout)."""
     return NOTIFICATION_KEY_PATTERN % (profile_id, notification_id)
 
 
@@ -1 +1,2 @@
-from .base import get_pusher
+from .base import (
+    get_pusher, get_client, send_event, MAX_CHANNELS_PER_EVENT)
@@ -1,16 +1,185 @@
 """Code to get access to a Pusher API instance."""
 from __future__ import absolute_import
 
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
 from django.conf import settings
 import pusher
 
+from portfoliyo import httppool
 
 
-def get_pusher():
-    """Return a real pusher client if configured in settings, or None."""
+DEFAULT_HOST = 'api.pusherapp.com'
+
+# Pusher's REST API accepts at most this many channels for a single event
+MAX_CHANNELS_PER_EVENT = 10
+
+# seconds to wait on the Pusher API before giving up
+TIMEOUT = 5
+
+# idle keep-alive connections kept open per process
+MAX_IDLE_CONNECTIONS = 4
+
+
+
+class PusherError(Exception):
+    """The Pusher API returned an error response."""
+    pass
+
+
+
+def get_config():
+    """Return dict of Pusher API settings if configured, or None."""
     app_id = getattr(settings, 'PUSHER_APPID', None)
     key = getattr(settings, 'PUSHER_KEY', None)
     secret = getattr(settings, 'PUSHER_SECRET', None)
     if app_id and key and secret:
-       return pusher.Pusher(app_id=app_id, key=key, secret=secret, port=443)
+        return {
+            'app_id': app_id,
+            'key': key,
+            'secret': secret,
+            'host': getattr(settings, 'PUSHER_HOST', DEFAULT_HOST),
+            'port': getattr(settings, 'PUSHER_PORT', 443),
+            }
+    return None
+
+
+
+def get_pusher():
+    """Return a real pusher client if configured in settings, or None."""
+    config = get_config()
+    if config is not None:
+        return pusher.Pusher(
+            app_id=config['app_id'],
+            key=config['key'],
+            secret=config['secret'],
+            port=443,
+            )
     return None
+
+
+
+class Client(object):
+    """
+    Pusher REST API client that keeps HTTP connections alive for reuse.
+
+    Safe to share between threads (see ``httppool.ConnectionPool``).
+
+    ``connections_opened`` and ``requests_sent`` count (for this client) new
+    connections made and API requests sent.
+
+    """
+    def __init__(self, config, max_idle=MAX_IDLE_CONNECTIONS):
+        self.config = config
+        self.pool = httppool.ConnectionPool(
+            config['host'],
+            config['port'],
+            secure=config['port'] == 443,
+            timeout=TIMEOUT,
+            max_idle=max_idle,
+            )
+
+
+    @property
+    def connections_opened(self):
+        return self.pool.connections_opened
+
+
+    @property
+    def requests_sent(self):
+        return self.pool.requests_sent
+
+
+    def send_event(self, channels, event, data):
+        """
+        Send ``event`` with ``data`` to all ``channels`` in one API request.
+
+        ``channels`` must be a list of no more than ``MAX_CHANNELS_PER_EVENT``
+        full channel names.
+
+        Raise ``PusherError`` if Pusher returns an error response.
+
+        """
+        if len(channels) > MAX_CHANNELS_PER_EVENT:
+            raise ValueError(
+                "Cannot send an event to more than %s channels at once."
+                % MAX_CHANNELS_PER_EVENT
+                )
+
+        path = '/apps/%s/events' % self.config['app_id']
+        body = json.dumps(
+            {'name': event, 'channels': channels, 'data': json.dumps(data)})
+        signed_path = '%s?%s' % (
+            path, sign_query(self.config, 'POST', path, body))
+
+        status, content = self.pool.request(
+            'POST', signed_path, body, {'Content-Type': 'application/json'})
+        if status != 200:
+            raise PusherError(
+                "Unexpected return status %s: %s" % (status, content))
+        return True
+
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+
+def get_client():
+    """
+    Return the process-wide Pusher ``Client`` if configured, or None.
+
+    A new client is created if Pusher settings change, or in a newly forked
+    process (so worker processes never share sockets).
+
+    """
+    global _client, _client_pid
+    config = get_config()
+    if config is None:
+        return None
+    with _client_lock:
+        pid = os.getpid()
+        if _client is None or _client.config != config or _client_pid != pid:
+            _client = Client(config)
+            _client_pid = pid
+        return _client
+
+
+
+def send_event(channels, event, data):
+    """
+    Send ``event`` with ``data`` to all ``channels`` in one API request.
+
+    Uses the process-wide client (see ``Client.send_event``). Return ``False``
+    if Pusher is not configured, ``True`` if the event was sent.
+
+    """
+    client = get_client()
+    if client is None:
+        return False
+    return client.send_event(channels, event, data)
+
+
+
+def sign_query(config, method, path, body):
+    """Return signed query string for a Pusher REST API request."""
+    params = {
+        'auth_key': config['key'],
+        'auth_timestamp': str(int(time.time())),
+        'auth_version': '1.0',
+        'body_md5': hashlib.md5(body).hexdigest(),
+        }
+    query = '&'.join('%s=%s' % (k, params[k]) for k in sorted(params))
+    signature = hmac.new(
+        str(config['secret']),
+        '\n'.join([method, path, query]),
+        hashlib.sha256,
+        ).hexdigest()
+    return '%s&auth_signature=%s' % (query, signature)
@@ -1,14 +1,24 @@
 """Pusher events."""
+import json
 import logging
 
+from django.core.urlresolvers import reverse
+
 from portfoliyo.api import resources
 from portfoliyo import model, serializers
-from portfoliyo.pusher import get_pusher
+from portfoliyo.pusher import send_event, MAX_CHANNELS_PER_EVENT
 
 
 logger = logging.getLogger(__name__)
 
 
+# Pusher rejects events whose (serialized) data is over 10KB
+MAX_EVENT_BYTES = 10 * 1024
+
+# most objects sent in one event, however small
+MAX_OBJECTS_PER_EVENT = 10
+
+
 
 def posted(post_id, **extra_data):
     """Send ``message_posted`` event for ``post_id`` with ``extra_data``."""
@@ -17,8 +27,139 @@ def posted(post_id, **extra_data):
 
 
 def bulk_posted(bulk_post_id, **extra_data):
-    """Send ``message_posted`` event for ``post_id`` with ``extra_data``."""
-    posted_event(model.BulkPost.objects.get(pk=bulk_post_id), **extra_data)
+    """
+    Send ``message_posted`` events for ``bulk_post_id`` and its sub-posts.
+
+    All sub-posts are loaded in a single query and serialized once; each
+    teacher then gets the bulk post plus the sub-posts in their own villages,
+    batched as in ``batch_objects``. ``extra_data`` is included in every
+    serialized post.
+
+    """
+    bulk_post = model.BulkPost.objects.select_related(
+        'author__user').get(pk=bulk_post_id)
+    subs = bulk_post.triggered.select_related(
+        'author__user', 'relationship').prefetch_related('attachments')
+
+    sub_data_by_student_id = {}
+    for sub in subs:
+        sub_data_by_student_id[sub.student_id] = serializers.post2dict(
+            sub,
+            mark_read_url=reverse(
+                'mark_post_read', kwargs={'post_id': sub.id}),
+            **extra_data
+            )
+
+    objects_by_teacher_id = {}
+    teacher_student_ids = model.Relationship.objects.filter(
+        to_profile__in=sub_data_by_student_id.keys(),
+        from_profile__school_staff=True,
+        ).values_list('from_profile', 'to_profile')
+    for teacher_id, student_id in teacher_student_ids:
+        objects_by_teacher_id.setdefault(teacher_id, []).append(
+            sub_data_by_student_id[student_id])
+
+    bulk_data = serializers.post2dict(bulk_post, **extra_data)
+    teacher_ids = bulk_post.elders_in_context.filter(
+        school_staff=True).values_list('pk', flat=True)
+    for teacher_id in teacher_ids:
+        objects_by_teacher_id.setdefault(teacher_id, []).append(bulk_data)
+
+    send_posts(objects_by_teacher_id)
+
+
+
+def posted_many(post_ids, **extra_data):
+    """
+    Send ``message_posted`` events for ``post_ids``, in various villages.
+
+    All posts are loaded in a single query; each teacher gets the posts in
+    their own villages, batched as in ``bulk_posted``.
+
+    """
+    posts = model.Post.objects.filter(pk__in=post_ids).select_related(
+        'author__user', 'relationship').prefetch_related('attachments')
+
+    data_by_student_id = {}
+    for post in posts:
+        data_by_student_id.setdefault(post.student_id, []).append(
+            serializers.post2dict(
+                post,
+                mark_read_url=reverse(
+                    'mark_post_read', kwargs={'post_id': post.id}),
+                **extra_data
+                )
+            )
+
+    objects_by_teacher_id = {}
+    teacher_student_ids = model.Relationship.objects.filter(
+        to_profile__in=data_by_student_id.keys(),
+        from_profile__school_staff=True,
+        ).values_list('from_profile', 'to_profile')
+    for teacher_id, student_id in teacher_student_ids:
+        objects_by_teacher_id.setdefault(teacher_id, []).extend(
+            data_by_student_id[student_id])
+
+    send_posts(objects_by_teacher_id)
+
+
+
+def send_posts(objects_by_teacher_id):
+    """
+    Send ``message_posted`` events given map of teacher ID to post data.
+
+    Teachers who see the same posts (with the same "mine" flags) share events;
+    posts are split between events by ``batch_objects``.
+
+    """
+    channels_by_objects = {}
+    for teacher_id, objects in objects_by_teacher_id.items():
+        key = tuple(
+            (
+                data['post_id'],
+                'group_id' in data,
+                data['author_id'] == teacher_id,
+                )
+            for data in objects
+            )
+        channels_by_objects.setdefault(key, ([], objects))[0].append(
+            'user_%s' % teacher_id)
+
+    for key, (channels, objects) in channels_by_objects.items():
+        objects = [
+            dict(data, mine=mine) for data, (_, _, mine) in zip(objects, key)]
+        for batch in batch_objects(objects):
+            trigger_many(channels, 'message_posted', {'objects': batch})
+
+
+
+def batch_objects(objects):
+    """
+    Split ``objects`` into lists to send as the data of one event apiece.
+
+    Each list has at most ``MAX_OBJECTS_PER_EVENT`` objects, and serializes
+    (as ``{'objects': [...]}``) to at most ``MAX_EVENT_BYTES``, unless it's a
+    single object too large on its own.
+
+    """
+    empty_size = len(json.dumps({'objects': []}))
+    batches = []
+    batch = []
+    size = empty_size
+    for data in objects:
+        # allow for the separator between objects
+        data_size = len(json.dumps(data)) + 2
+        if batch and (
+                len(batch) >= MAX_OBJECTS_PER_EVENT or
+                size + data_size > MAX_EVENT_BYTES):
+            batches.append(batch)
+            batch = []
+            size = empty_size
+        batch.append(data)
+        size += data_size
+    if batch:
+        batches.append(batch)
+    return batches
 
 
 
@@ -26,11 +167,14 @@ def posted_event(post, **extra_data):
     data = serializers.post2dict(post, **extra_data)
     teacher_ids = post.elders_in_context.filter(
         school_staff=True).values_list('pk', flat=True)
+    # payload differs only in "mine", so batch author and others separately
+    channels_by_mine = {}
     for teacher_id in teacher_ids:
-        channel = 'user_%s' % teacher_id
-        my_data = {
-            'objects': [dict(data, mine=data['author_id'] == teacher_id)]}
-        trigger(channel, 'message_posted', my_data)
+        channels_by_mine.setdefault(
+            data['author_id'] == teacher_id, []).append('user_%s' % teacher_id)
+    for mine, channels in channels_by_mine.items():
+        trigger_many(
+            channels, 'message_posted', {'objects': [dict(data, mine=mine)]})
 
 
 
@@ -72,8 +216,11 @@ def student_event(event, student_id, elder_ids=None, full_data=True):
     if elder_ids is None:
         elder_ids = model.Relationship.objects.filter(
             to_profile=student_id).values_list('from_profile', flat=True)
-    for elder_id in elder_ids:
-        trigger('user_%s' % elder_id, event, {'objects': [data]})
+    trigger_many(
+        ['user_%s' % elder_id for elder_id in elder_ids],
+        event,
+        {'objects': [data]},
+        )
 
 
 
@@ -153,14 +300,25 @@ def trigger(channel, event, data):
     Log failures, but never blow up.
 
     """
-    pusher = get_pusher()
-    if pusher is None:
-        return
-    try:
-        pusher['private-%s' % channel].trigger(event, data)
-    except Exception as e:
-        logger.warning(
-            "Pusher exception: %s" % str(e),
-            exc_info=True,
-            extra={'stack': True},
-            )
+    trigger_many([channel], event, data)
+
+
+
+def trigger_many(channels, event, data):
+    """
+    Fire ``event`` on all ``channels`` with ``data`` if Pusher is configured.
+
+    Sends one API request per ``MAX_CHANNELS_PER_EVENT`` channels. Log
+    failures, but never blow up.
+
+    """
+    channels = ['private-%s' % channel for channel in channels]
+    for i in range(0, len(channels), MAX_CHANNELS_PER_EVENT):
+        try:
+            send_event(channels[i:i+MAX_CHANNELS_PER_EVENT], event, data)
+        except Exception as e:
+            logger.warning(
+                "Pusher exception: %s" % str(e),
+                exc_info=True,
+                extra={'stack': True},
+                )
@@ -1,10 +1,14 @@
 from __future__ import absolute_import
 
+import fnmatch
+import hashlib
 import time
+import uuid
+import zlib
 
 from django.conf import settings
 import redis
-from redis.exceptions import ResponseError
+from redis.exceptions import NoScriptError, ResponseError
 
 
 
@@ -47,6 +51,34 @@ class InMemoryRedis(object):
         self.expiry[key] = timestamp
 
 
+    def ttl(self, key):
+        if self._get(key) is None:
+            return -2
+        expiry = self.expiry.get(key)
+        if expiry is None:
+            return -1
+        return int(expiry - time.time())
+
+
+    def expire(self, key, seconds):
+        if key not in self.data:
+            return False
+        self.expiry[key] = time.time() + seconds
+        return True
+
+
+    def get(self, key):
+        val = self._get(key)
+        return None if val is None else str(val)
+
+
+    def setnx(self, key, val):
+        if self._get(key) is not None:
+            return False
+        self.data[key] = str(val)
+        return True
+
+
     def smembers(self, key):
         return self._get(key, set())
 
@@ -74,6 +106,44 @@ class InMemoryRedis(object):
         return False
 
 
+    def sscan(self, key, cursor=0, count=None):
+        return self._scan(self._get(key, set()), cursor, count)
+
+
+    def scan(self, cursor=0, match=None, count=None):
+        self.num_calls += 1
+        now = time.time()
+        keys = [
+            k for k in self.data
+            if not (self.expiry.get(k) and now > self.expiry[k])
+            ]
+        if match is not None:
+            keys = fnmatch.filter(keys, match)
+        return self._scan(keys, cursor, count)
+
+
+    def _scan(self, items, cursor, count):
+        # Like Redis, walk items in hash-bucket order (the cursor is the next
+        # bucket), so items removed mid-scan don't cause others to be skipped.
+        count = count or 10
+        found = []
+        last_bucket = None
+        for bucket, item in sorted(
+                (zlib.crc32(i) & 0xffff, i) for i in items):
+            if bucket < cursor:
+                continue
+            if len(found) >= count and bucket != last_bucket:
+                return bucket, found
+            found.append(item)
+            last_bucket = bucket
+        return 0, found
+
+
+    def debug_object(self, key):
+        # a rough stand-in for the serialized length Redis reports
+        return {'serializedlength': len(repr(self._get(key)))}
+
+
     def scard(self, key):
         s = self._setdefault(key, set())
         return len(s)
@@ -92,12 +162,87 @@ class InMemoryRedis(object):
         return val
 
 
+    def incrby(self, key, amount=1):
+        val = self._get(key, 0)
+        val += amount
+        self.data[key] = val
+        return val
+
+
+    def rpush(self, key, *values):
+        l = self._setdefault(key, [])
+        l.extend(str(v) for v in values)
+        return len(l)
+
+
+    def lpop(self, key):
+        l = self._get(key)
+        if not l:
+            return None
+        val = l.pop(0)
+        if not l:
+            del self.data[key]
+        return val
+
+
+    def llen(self, key):
+        return len(self._get(key, []))
+
+
+    def lindex(self, key, index):
+        l = self._get(key, [])
+        try:
+            return l[index]
+        except IndexError:
+            return None
+
+
+    def lrange(self, key, start, end):
+        l = self._get(key, [])
+        return l[start:] if end == -1 else l[start:end + 1]
+
+
+    def hincrby(self, key, field, amount=1):
+        d = self._setdefault(key, {})
+        val = int(d.get(field, 0)) + amount
+        d[field] = str(val)
+        return val
+
+
     def hmset(self, key, mapping):
         d = self._setdefault(key, {})
         d.update((k, str(v)) for k, v in mapping.items())
         return True
 
 
+    def hset(self, key, field, val):
+        field = str(field)
+        d = self._setdefault(key, {})
+        ret = 0 if field in d else 1
+        d[field] = str(val)
+        return ret
+
+
+    def hget(self, key, field):
+        return self._get(key, {}).get(str(field))
+
+
+    def hmget(self, key, fields):
+        d = self._get(key, {})
+        return [d.get(str(f)) for f in fields]
+
+
+    def hdel(self, key, *fields):
+        d = self._get(key, {})
+        deleted = 0
+        for field in fields:
+            if d.pop(str(field), None) is not None:
+                deleted += 1
+        if not d and key in self.data:
+            del self.data[key]
+        return deleted
+
+
     def hgetall(self, key):
         return self._get(key, {}).copy()
 
@@ -121,13 +266,36 @@ class InMemoryRedis(object):
         return 1
 
 
+    def zrange(self, key, start, end):
+        l = [val for score, val in self._get(key, [])]
+        return l[start:] if end == -1 else l[start:end + 1]
+
+
     def zrangebyscore(self, key, min, max):
-        min = float(min)
-        max = float(max)
-        ret = []
-        for score, val in self._get(key, []):
-            if score >= min and score <= max:
-                ret.append(val)
+        in_range = _score_range(min, max)
+        return [val for score, val in self._get(key, []) if in_range(score)]
+
+
+    def zremrangebyscore(self, key, min, max):
+        in_range = _score_range(min, max)
+        l = self._get(key, [])
+        keep = [(score, val) for score, val in l if not in_range(score)]
+        if keep:
+            self.data[key] = keep
+        elif key in self.data:
+            del self.data[key]
+        return len(l) - len(keep)
+
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        script = _scripts.get(sha)
+        if script is None:
+            raise NoScriptError("No matching script.")
+        start_calls = self.num_calls
+        ret = script.implementation(
+            self, keys_and_args[:numkeys], keys_and_args[numkeys:])
+        # a script runs in a single call to Redis
+        self.num_calls = start_calls + 1
         return ret
 
 
@@ -136,6 +304,27 @@ class InMemoryRedis(object):
 
 
 
+def _score_range(min, max):
+    """Return a function testing if a score is between ``min`` and ``max``."""
+    min, min_exclusive = _parse_score_bound(min)
+    max, max_exclusive = _parse_score_bound(max)
+    def _in_range(score):
+        above_min = score > min if min_exclusive else score >= min
+        below_max = score < max if max_exclusive else score <= max
+        return above_min and below_max
+    return _in_range
+
+
+
+def _parse_score_bound(bound):
+    """Parse a sorted-set score bound like '5', '(5' or '-inf'."""
+    bound = str(bound)
+    if bound.startswith('('):
+        return float(bound[1:]), True
+    return float(bound), False
+
+
+
 class Pipeline(object):
     def __init__(self, client):
         self.client = client
@@ -152,6 +341,190 @@ class Pipeline(object):
         return results
 
 
+# all Scripts, by SHA1 of their Lua source
+_scripts = {}
+
+
+
+class Script(object):
+    """
+    A Lua script, run atomically by Redis in a single round-trip.
+
+    ``InMemoryRedis`` can't run Lua, so each script also has a Python
+    ``implementation``, taking the client, a list of keys and a list of args;
+    it must do the same as the Lua script.
+
+    Scripts are run via EVALSHA, falling back to EVAL (which also caches the
+    script in Redis) if Redis doesn't have the script yet.
+
+    """
+    def __init__(self, lua, implementation):
+        self.lua = lua
+        self.sha = hashlib.sha1(lua).hexdigest()
+        self.implementation = implementation
+        _scripts[self.sha] = self
+
+
+    def __call__(self, keys=(), args=()):
+        keys_and_args = tuple(keys) + tuple(args)
+        try:
+            return client.evalsha(self.sha, len(keys), *keys_and_args)
+        except NoScriptError:
+            return client.eval(self.lua, len(keys), *keys_and_args)
+
+
+
+# Take a lease: set the lease key to a token, unless already set, with an
+# expiry. Return 1 if taken, else 0.
+#
+# KEYS: lease key
+# ARGV: token, expiry (seconds)
+_TAKE_LEASE_LUA = """
+if redis.call('SETNX', KEYS[1], ARGV[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+
+def _take_lease_in_memory(client, keys, args):
+    """Python implementation of ``_TAKE_LEASE_LUA``, for ``InMemoryRedis``."""
+    if client.setnx(keys[0], args[0]):
+        client.expire(keys[0], int(args[1]))
+        return 1
+    return 0
+
+
+
+# Delete a lease, if it is still ours (it may have lapsed and been retaken).
+#
+# KEYS: lease key
+# ARGV: token
+_RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+
+def _release_lease_in_memory(client, keys, args):
+    """Python version of ``_RELEASE_LEASE_LUA``, for ``InMemoryRedis``."""
+    if client.get(keys[0]) == args[0]:
+        return int(client.delete(keys[0]))
+    return 0
+
+
+
+# Reset a lease's expiry, if it is still ours. Return 1 if renewed, else 0.
+#
+# KEYS: lease key
+# ARGV: token, expiry (seconds)
+_RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+
+def _renew_lease_in_memory(client, keys, args):
+    """Python implementation of ``_RENEW_LEASE_LUA``, for ``InMemoryRedis``."""
+    if client.get(keys[0]) == args[0]:
+        return int(client.expire(keys[0], int(args[1])))
+    return 0
+
+
+
+_take_lease_script = Script(_TAKE_LEASE_LUA, _take_lease_in_memory)
+_release_lease_script = Script(_RELEASE_LEASE_LUA, _release_lease_in_memory)
+_renew_lease_script = Script(_RENEW_LEASE_LUA, _renew_lease_in_memory)
+
+
+
+def take_lease(key, seconds):
+    """
+    Try to take the lease (a lock with an expiry) stored at ``key``.
+
+    Return the lease token (needed to release it) if taken, else ``None``. The
+    lease is taken atomically along with its expiry, so it always lapses after
+    ``seconds`` even if its holder dies without releasing it.
+
+    """
+    token = uuid.uuid4().hex
+    if _take_lease_script(keys=[key], args=[token, seconds]):
+        return token
+    return None
+
+
+
+def release_lease(key, token):
+    """
+    Release the lease stored at ``key``, if ``token`` still holds it.
+
+    Return ``True`` if released, ``False`` if the lease had lapsed (and
+    perhaps been taken by someone else, whose lease is left alone).
+
+    """
+    return bool(_release_lease_script(keys=[key], args=[token]))
+
+
+
+def renew_lease(key, token, seconds):
+    """
+    Make the lease stored at ``key`` lapse ``seconds`` from now instead.
+
+    Return ``True`` if renewed, ``False`` if ``token`` no longer holds it.
+
+    """
+    return bool(_renew_lease_script(keys=[key], args=[token, seconds]))
+
+
+
+def sscan(key, cursor=0, count=None):
+    """
+    Take one step of an SSCAN of set ``key``; return (next cursor, members).
+
+    A next cursor of 0 means the scan is complete. ``count`` is a hint for how
+    many members to return. Our redis-py predates SSCAN, so if the client has
+    no ``sscan`` method we send the command ourselves.
+
+    """
+    if hasattr(client, 'sscan'):
+        return client.sscan(key, cursor=cursor, count=count)
+    args = [key, cursor]
+    if count:
+        args.extend(['COUNT', count])
+    next_cursor, members = client.execute_command('SSCAN', *args)
+    return int(next_cursor), members
+
+
+
+def scan(cursor=0, match=None, count=None):
+    """
+    Take one step of a SCAN of all keys; return (next cursor, keys).
+
+    A next cursor of 0 means the scan is complete. ``match`` is an optional
+    glob-style pattern keys must match; ``count`` is a hint for how many keys
+    to examine. As with ``sscan``, we send the command ourselves if need be.
+
+    """
+    if hasattr(client, 'scan'):
+        return client.scan(cursor=cursor, match=match, count=count)
+    args = [cursor]
+    if match is not None:
+        args.extend(['MATCH', match])
+    if count:
+        args.extend(['COUNT', count])
+    next_cursor, keys = client.execute_command('SCAN', *args)
+    return int(next_cursor), keys
+
+
+
 def _make_pipelined_method(name):
     def _pipelined_method(self, *args, **kwargs):
         self.calls.append((name, args, kwargs))
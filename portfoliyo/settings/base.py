@@ -154,6 +154,7 @@ INSTALLED_APPS = [
     'portfoliyo.landing',
     'portfoliyo.model.users',
     'portfoliyo.model.village',
+    'portfoliyo.notifications',
     'portfoliyo.view',
 ]
 
@@ -253,6 +254,8 @@ PORTFOLIYO_NUMBERS = {
     'ca': '+15555555555',
     }
 DEFAULT_NUMBER = '+15555555555'
+# process incoming SMS in a task, acknowledging Twilio's webhook right away
+TWILIO_ASYNC_RECEIVE = False
 
 REDIS_URL = None
 CELERY_ALWAYS_EAGER = True
@@ -262,6 +265,10 @@ PORTFOLIYO_BASE_URL = 'http://localhost:8000'
 NOTIFICATION_EMAILS = True
 # notifications last 48 hours by default
 NOTIFICATION_EXPIRY_SECONDS = 48 * 60 * 60
+# notification emails wait this long for more notifications (0: send now)
+NOTIFICATION_DEBOUNCE_SECONDS = 2 * 60
+# pending-notification sweeps send at most this many emails/minute (0: any)
+NOTIFICATION_EMAILS_PER_MINUTE = 0
 
 DEBUG_TOOLBAR = False
 DEBUG_URLS = DEBUG
@@ -108,6 +108,7 @@ EMAIL_HOST_PASSWORD = env('MAILGUN_SMTP_PASSWORD')
 PORTFOLIYO_SMS_BACKEND = env('PORTFOLIYO_SMS_BACKEND')
 TWILIO_ACCOUNT_SID = env('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = env('TWILIO_AUTH_TOKEN')
+TWILIO_ASYNC_RECEIVE = env('TWILIO_ASYNC_RECEIVE', bool)
 PORTFOLIYO_NUMBERS = {
     'us': env('US_NUMBER'),
     'ca': env('CA_NUMBER'),
@@ -178,6 +179,15 @@ PORTFOLIYO_BASE_URL = env('PORTFOLIYO_BASE_URL')
 
 NOTIFICATION_EMAILS = env('PORTFOLIYO_NOTIFICATION_EMAILS', bool)
 NOTIFICATION_EXPIRY_SECONDS = env('PORTFOLIYO_NOTIFICATION_EXPIRY_SECONDS', int)
+# fall back to the base setting if unset
+NOTIFICATION_DEBOUNCE_SECONDS = int(
+    os.environ.get('PORTFOLIYO_NOTIFICATION_DEBOUNCE_SECONDS') or
+    NOTIFICATION_DEBOUNCE_SECONDS
+    )
+NOTIFICATION_EMAILS_PER_MINUTE = int(
+    os.environ.get('PORTFOLIYO_NOTIFICATION_EMAILS_PER_MINUTE') or
+    NOTIFICATION_EMAILS_PER_MINUTE
+    )
 DEBUG_URLS = env('PORTFOLIYO_DEBUG_URLS', bool)
 
 STRIPE_PUBLIC_KEY = 'pk_JUTkGItjFgc2pg4ArykSVE1c0rJps'
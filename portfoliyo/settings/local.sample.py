@@ -63,6 +63,11 @@ Copy settings/local.sample.py to settings/local.py and modify as needed.
 #PORTFOLIYO_SMS_BACKEND = 'portfoliyo.sms.backends.twilio.TwilioSMSBackend'
 #TWILIO_ACCOUNT_SID = 'your account sid here'
 #TWILIO_AUTH_TOKEN = 'your auth token here'
+# Max messages per second from each of our numbers, and concurrent sends
+#TWILIO_SENDS_PER_SECOND = 1
+#TWILIO_SEND_THREADS = 4
+# Queue incoming SMS for a worker instead of handling them in the webhook
+#TWILIO_ASYNC_RECEIVE = True
 #PORTFOLIYO_NUMBERS = {
 #    'us': '+15555555555',
 #    'ca': '+15555555555',
@@ -1 +1 @@
-from .base import send
+from .base import send, send_many
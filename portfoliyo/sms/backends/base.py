@@ -1,5 +1,74 @@
+from collections import OrderedDict
+import Queue
+import sys
+import threading
+
+from .. import throttle
+
+
+
 class SMSBackend(object):
     """Base interface for an SMS backend."""
+    # max number of recipients ``send_many`` sends to concurrently
+    max_threads = 1
+    # max messages per second from any one source number (None is unlimited)
+    rate_limit = None
+
+
+    def __init__(self):
+        self.limiter = throttle.RateLimiter(self.rate_limit)
+
+
     def send(self, to, from_, body):
         """Send an SMS message."""
         raise NotImplementedError
+
+
+    def send_many(self, messages):
+        """
+        Send each (to, from_, body) message in ``messages``.
+
+        Up to ``max_threads`` recipients are sent to concurrently; messages
+        to any one recipient are sent in order. Sends from each source number
+        are limited to ``rate_limit`` per second.
+
+        Failure to send one message doesn't stop sending of the rest; return
+        list of (message, exc_info) tuples for messages that failed, where
+        ``exc_info`` is the ``sys.exc_info()`` triple for the failure.
+
+        """
+        by_recipient = OrderedDict()
+        for message in messages:
+            by_recipient.setdefault(message[0], []).append(message)
+        work = Queue.Queue()
+        for recipient_messages in by_recipient.values():
+            work.put(recipient_messages)
+
+        failures = []
+
+        def worker():
+            while True:
+                try:
+                    recipient_messages = work.get_nowait()
+                except Queue.Empty:
+                    return
+                for message in recipient_messages:
+                    to, from_, body = message
+                    self.limiter.wait(from_)
+                    try:
+                        self.send(to, from_, body)
+                    except Exception:
+                        failures.append((message, sys.exc_info()))
+
+        num_threads = min(self.max_threads, len(by_recipient))
+        if num_threads <= 1:
+            worker()
+        else:
+            threads = [
+                threading.Thread(target=worker) for i in range(num_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return failures
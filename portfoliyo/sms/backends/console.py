@@ -9,6 +9,7 @@ class ConsoleSMSBackend(base.SMSBackend):
     def __init__(self, *args, **kwargs):
         self.stream = kwargs.pop('stream', sys.stdout)
         self._lock = threading.RLock()
+        super(ConsoleSMSBackend, self).__init__()
 
 
     def send(self, to, from_, body):
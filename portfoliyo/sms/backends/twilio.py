@@ -1,21 +1,65 @@
 """Twilio SMS backend."""
 from __future__ import absolute_import
 
+import base64
+import json
+import urllib
+import urlparse
+
 from django.conf import settings
-from twilio import rest
 
+from portfoliyo import httppool
 from . import base
 
 
+DEFAULT_API_URL = 'https://api.twilio.com'
+
+MESSAGES_PATH = '/2010-04-01/Accounts/%s/SMS/Messages.json'
+
+
+
+class TwilioError(Exception):
+    """The Twilio API returned an error response."""
+    pass
+
+
+
 class TwilioSMSBackend(base.SMSBackend):
     def __init__(self):
-        """Instantiate a TwilioRestClient based on settings."""
-        self.client = rest.TwilioRestClient(
-            settings.TWILIO_ACCOUNT_SID,
-            settings.TWILIO_AUTH_TOKEN,
+        """Set up pooled keep-alive connections to Twilio based on settings."""
+        self.account_sid = settings.TWILIO_ACCOUNT_SID
+        self.auth_token = settings.TWILIO_AUTH_TOKEN
+        # each long code can send one message per second
+        self.rate_limit = getattr(settings, 'TWILIO_SENDS_PER_SECOND', 1)
+        self.max_threads = getattr(settings, 'TWILIO_SEND_THREADS', 4)
+
+        url = urlparse.urlparse(
+            getattr(settings, 'TWILIO_API_URL', DEFAULT_API_URL))
+        secure = url.scheme == 'https'
+        self.pool = httppool.ConnectionPool(
+            url.hostname,
+            url.port or (443 if secure else 80),
+            secure=secure,
+            max_idle=self.max_threads,
             )
+        super(TwilioSMSBackend, self).__init__()
 
 
     def send(self, to, from_, body):
-        """Send an SMS."""
-        return self.client.sms.messages.create(to=to, from_=from_, body=body)
+        """Send an SMS; return Twilio's data about the created message."""
+        params = urllib.urlencode(
+            {'To': to, 'From': from_, 'Body': body.encode('utf-8')})
+        credentials = base64.b64encode(
+            '%s:%s' % (self.account_sid, self.auth_token))
+        headers = {
+            'Authorization': 'Basic %s' % credentials,
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            }
+
+        status, content = self.pool.request(
+            'POST', MESSAGES_PATH % self.account_sid, params, headers)
+        if status not in (200, 201):
+            raise TwilioError(
+                "Unexpected return status %s: %s" % (status, content))
+        return json.loads(content)
@@ -25,6 +25,24 @@ def send(phone, source, body):
         backend.send(phone, source, chunk)
 
 
+def send_many(messages):
+    """
+    Send each (phone, source, body) SMS in ``messages``.
+
+    Long bodies are split as in ``send``. Sending is delegated to the backend,
+    which may send concurrently; return list of (message, exc_info) tuples
+    for (split) messages that failed to send.
+
+    """
+    return backend.send_many(
+        [
+            (phone, source, chunk)
+            for phone, source, body in messages
+            for chunk in split_sms(body)
+            ]
+        )
+
+
 def split_sms(text, joiner='...'):
     """
     Return iterable of chunks of ``text`` <=160 chars each.
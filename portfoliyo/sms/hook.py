@@ -25,19 +25,17 @@ def receive_sms(source, to, body):
     Return None if no reply should be sent, or text of reply.
 
     """
-    try:
-        profile = model.Profile.objects.select_related(
-            'user').get(phone=source)
-    except model.Profile.DoesNotExist:
+    context = SenderContext.load(source)
+    if context is None:
         return handle_unknown_source(source, to, body)
+    profile = context.profile
 
     if body.strip().lower() == 'stop':
         profile.declined = True
         profile.save()
         profile.user.is_active = False
         profile.user.save()
-        for student in profile.students:
-            model.Post.create(profile, student, body, from_sms=True)
+        model.Post.create_many(profile, profile.students, body, from_sms=True)
         return reply(
             source,
             profile.students,
@@ -54,29 +52,19 @@ def receive_sms(source, to, body):
         profile.save()
         activated = True
 
-    active_signups = profile.signups.exclude(state=model.TextSignup.STATE.done)
-
-    if active_signups:
-        if len(active_signups) > 1:
-            # shouldn't happen, since second signup sets first to done
-            logger.warning('User %s has multiple active signups!', source)
-            # not much we can do but just pick one arbitrarily
-        signup = active_signups[0]
-    else:
-        signup = None
+    signup = context.signup
 
     teacher, group, lang = parse_code(body)
     if teacher is not None:
-        return handle_subsequent_code(
-            profile, body, teacher, group, lang, signup)
+        return handle_subsequent_code(context, body, teacher, group, lang)
 
     if signup is not None:
         if signup.state == model.TextSignup.STATE.kidname:
-            return handle_new_student(signup, body)
+            return handle_new_student(context, body)
         elif signup.state == model.TextSignup.STATE.relationship:
-            return handle_role_update(signup, body)
+            return handle_role_update(context, body)
         elif signup.state == model.TextSignup.STATE.name:
-            return handle_name_update(signup, body)
+            return handle_name_update(context, body)
 
     students = profile.students
 
@@ -84,12 +72,9 @@ def receive_sms(source, to, body):
         track_sms('no students', source, body)
         return messages.get('NO_STUDENTS', profile.lang_code)
 
-    for student in students:
-        model.Post.create(profile, student, body, from_sms=True)
+    model.Post.create_many(profile, students, body, from_sms=True)
 
-    teachers = model.Profile.objects.filter(
-        school_staff=True, relationships_from__to_profile__in=students)
-    if not teachers.exists():
+    if not context.teachers:
         return messages.get('NO_TEACHERS', profile.lang_code)
 
     if activated:
@@ -97,11 +82,85 @@ def receive_sms(source, to, body):
             source,
             students,
             interpolate_teacher_names(
-                messages.get('ACTIVATED', profile.lang_code), profile)
+                messages.get('ACTIVATED', profile.lang_code),
+                profile,
+                context.teachers,
+                )
         )
 
 
 
+class SenderContext(object):
+    """
+    A known sender of an inbound SMS, and related data the handlers need.
+
+    Create with ``SenderContext.load(phone)``, which loads everything in three
+    queries (and returns ``None`` if no profile has that phone number):
+
+    ``profile``
+        The sender's Profile, with its ``user`` and ``student_relationships``
+        (and so ``students``) already loaded.
+
+    ``signup``
+        The sender's in-progress (not done) TextSignup, or ``None``.
+
+    ``teachers``
+        List of school-staff elders of the sender's students.
+
+    """
+    def __init__(self, profile, signup, teachers):
+        self.profile = profile
+        self.signup = signup
+        self.teachers = teachers
+
+
+    @classmethod
+    def load(cls, phone):
+        """Return context for sender with given phone, or ``None``."""
+        try:
+            profile = model.Profile.objects.select_related(
+                'user').get(phone=phone)
+        except model.Profile.DoesNotExist:
+            return None
+
+        # all elder relationships in the sender's villages, in one query:
+        # both the sender's own relationships and those of their teachers
+        village_rels = model.Relationship.objects.filter(
+            kind=model.Relationship.KIND.elder,
+            to_profile__relationships_to__from_profile=profile,
+            to_profile__relationships_to__kind=model.Relationship.KIND.elder,
+            ).select_related('from_profile__user', 'to_profile__user')
+        student_rels = []
+        teachers_by_id = {}
+        for rel in village_rels:
+            if rel.from_profile_id == profile.id:
+                rel.from_profile = profile
+                student_rels.append(rel)
+            if rel.elder.school_staff:
+                teachers_by_id[rel.from_profile_id] = rel.elder
+        qs = profile.student_relationships
+        qs._result_cache = sorted(student_rels, key=lambda sr: sr.student.name)
+        teachers = [teachers_by_id[pid] for pid in sorted(teachers_by_id)]
+
+        active_signups = list(
+            profile.signups.exclude(
+                state=model.TextSignup.STATE.done).select_related(
+                'teacher__school', 'group')
+            )
+        if active_signups:
+            if len(active_signups) > 1:
+                # shouldn't happen, since second signup sets first to done
+                logger.warning('User %s has multiple active signups!', phone)
+                # not much we can do but just pick one arbitrarily
+            signup = active_signups[0]
+            signup.family = profile
+        else:
+            signup = None
+
+        return cls(profile, signup, teachers)
+
+
+
 def handle_unknown_source(source, to, body):
     """Handle a text from an unknown user."""
     teacher, group, lang = parse_code(body)
@@ -129,15 +188,17 @@ def handle_unknown_source(source, to, body):
         return messages.get('UNKNOWN', settings.LANGUAGE_CODE)
 
 
-def handle_subsequent_code(profile, body, teacher, group, lang, signup):
+def handle_subsequent_code(context, body, teacher, group, lang):
     """
     Handle a second code from an already-signed-up parent.
 
-    If ``signup`` is not ``None``, it is an already-in-progress but
-    not-yet-finished signup. In that case, we mark it done and transfer its
-    state to the new signup so we still get answers to the questions.
+    If the sender has an already-in-progress but not-yet-finished signup, we
+    mark it done and transfer its state to the new signup so we still get
+    answers to the questions.
 
     """
+    profile = context.profile
+    signup = context.signup
     students = profile.students
     student = students[0] if students else None
 
@@ -201,8 +262,9 @@ def handle_subsequent_code(profile, body, teacher, group, lang, signup):
     return reply(profile.phone, [student] if student else [], msg)
 
 
-def handle_new_student(signup, body):
+def handle_new_student(context, body):
     """Handle addition of a student to a just-signing-up parent's account."""
+    signup = context.signup
     student_name = get_answer(body, signup.family.phone)
 
     possible_dupes = model.Profile.objects.filter(
@@ -250,8 +312,9 @@ def handle_new_student(signup, body):
         )
 
 
-def handle_role_update(signup, body):
+def handle_role_update(context, body):
     """Handle defining role of parent in relation to student."""
+    signup = context.signup
     role = get_answer(body, signup.family.phone)
 
     parent = signup.family
@@ -262,10 +325,8 @@ def handle_role_update(signup, body):
     signup.state = model.TextSignup.STATE.name
     signup.save()
     teacher = signup.teacher
-    student_rels = parent.student_relationships
-    for rel in student_rels:
-        model.Post.create(
-            parent, rel.student, body, from_sms=True, notifications=False)
+    model.Post.create_many(
+        parent, parent.students, body, from_sms=True, notifications=False)
     return reply(
         parent.phone,
         parent.students,
@@ -273,8 +334,9 @@ def handle_role_update(signup, body):
         )
 
 
-def handle_name_update(signup, body):
+def handle_name_update(context, body):
     """Handle defining name of parent."""
+    signup = context.signup
     name = get_answer(body, signup.family.phone)
 
     parent = signup.family
@@ -282,10 +344,8 @@ def handle_name_update(signup, body):
     parent.save()
     signup.state = model.TextSignup.STATE.done
     signup.save()
-    student_rels = parent.student_relationships
-    for rel in student_rels:
-        model.Post.create(
-            parent, rel.student, body, from_sms=True, notifications=False)
+    model.Post.create_many(
+        parent, parent.students, body, from_sms=True, notifications=False)
     tasks.record_notification.delay('new_parent', signup.teacher, signup)
     return reply(
         parent.phone,
@@ -293,6 +353,7 @@ def handle_name_update(signup, body):
         interpolate_teacher_names(
             messages.get('ALL_DONE', parent.lang_code),
             parent,
+            context.teachers,
             )
         )
 
@@ -319,6 +380,9 @@ def parse_code(body):
     else:
         lang = settings.LANGUAGE_CODE
     possible_code = bits[0].rstrip('.,:;').upper()
+    # most texts aren't codes; check the index before querying the database
+    if not model.codes.is_code(possible_code):
+        return (None, None, None)
     try:
         group = model.Group.objects.get(code=possible_code)
     except model.Group.DoesNotExist:
@@ -335,22 +399,24 @@ def parse_code(body):
 
 
 
-def interpolate_teacher_names(msg, parent):
+def interpolate_teacher_names(msg, parent, teachers=None):
     """
     Interpolate teachers of parent's students into msg's %s placeholder.
 
-    Avoids making the total message length over 160 if possible.
+    Avoids making the total message length over 160 if possible. Queries for
+    the teachers unless a list of them is given.
 
     """
     students = parent.students
     if not students:
         return msg % u"teachers"
-    teachers = list(
-        model.Profile.objects.filter(
-            school_staff=True,
-            relationships_from__to_profile__in=students
-            ).distinct()
-        )
+    if teachers is None:
+        teachers = list(
+            model.Profile.objects.filter(
+                school_staff=True,
+                relationships_from__to_profile__in=students
+                ).distinct()
+            )
 
     if len(students) > 2:
         student_possessive = u"your students'"
@@ -385,9 +451,8 @@ def interpolate_teacher_names(msg, parent):
 
 def reply(phone, students, body):
     """Save given reply to given students' villages before returning it."""
-    for student in students:
-        model.Post.create(
-            None, student, body, in_reply_to=phone, notifications=False)
+    model.Post.create_many(
+        None, students, body, in_reply_to=phone, notifications=False)
     return body
 
 
@@ -0,0 +1,166 @@
+"""
+Queue of incoming SMS awaiting processing.
+
+If ``settings.TWILIO_ASYNC_RECEIVE`` is set, the Twilio webhook doesn't run
+the SMS hook itself; it queues the message here (in Redis, one list per
+sending phone number) and a task processes it. Only one task at a time may
+process a given phone's messages (see ``lock``), taking them in the order they
+arrived; so e.g. a parent's answers to signup questions are never handled out
+of order. A message stays queued until it has been processed (see ``peek``);
+messages that fail to process are parked in a dead-letter list.
+
+"""
+import json
+import time
+
+from portfoliyo import redis
+
+
+# seconds before a phone's processing lock lapses (if its holder died)
+LOCK_TIMEOUT = 60
+
+
+
+def enqueue(source, to, body):
+    """Queue SMS ``body`` from ``source`` to ``to``; return queue length."""
+    return redis.client.rpush(
+        make_queue_key(source), json.dumps([to, body, time.time()]))
+
+
+
+def peek(source):
+    """
+    Return the oldest queued SMS from ``source``, leaving it queued.
+
+    Returns an (item, to, body) tuple, or ``None`` if nothing is queued. Once
+    the message is processed, pass ``item`` to ``done`` (or, if it couldn't be
+    processed, to ``fail``) to remove it from the queue. So a message is only
+    removed once it has been dealt with; if its processor dies first, the
+    next to take the lock processes it again.
+
+    """
+    item = redis.client.lindex(make_queue_key(source), 0)
+    if item is None:
+        return None
+    to, body, queued = json.loads(item)
+    return item, to, body
+
+
+
+# Remove the given item from the head of a queue, if it's still there; if a
+# dead-letter key is given, park the item there. Return 1 if removed, else 0.
+#
+# KEYS: queue key, optionally dead-letter key
+# ARGV: item
+_REMOVE_LUA = """
+if redis.call('LINDEX', KEYS[1], 0) ~= ARGV[1] then
+    return 0
+end
+redis.call('LPOP', KEYS[1])
+if KEYS[2] then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+
+def _remove_in_memory(client, keys, args):
+    """Python implementation of ``_REMOVE_LUA``, for ``InMemoryRedis``."""
+    if client.lindex(keys[0], 0) != args[0]:
+        return 0
+    client.lpop(keys[0])
+    if len(keys) > 1:
+        client.rpush(keys[1], args[0])
+    return 1
+
+
+
+_remove_script = redis.Script(_REMOVE_LUA, _remove_in_memory)
+
+
+
+def done(source, item):
+    """
+    Remove processed ``item`` (from ``peek``) from ``source``'s queue.
+
+    Return ``True`` if removed, ``False`` if it was no longer at the head of
+    the queue (another processor took over and already removed it).
+
+    """
+    return bool(_remove_script(keys=[make_queue_key(source)], args=[item]))
+
+
+
+def fail(source, item):
+    """
+    Move ``item`` (from ``peek``), which failed to process, to dead letters.
+
+    Return value as for ``done``. Dead letters from ``source`` are kept (see
+    ``dead_letters``) for inspection and manual reprocessing.
+
+    """
+    return bool(
+        _remove_script(
+            keys=[make_queue_key(source), make_dead_letter_key(source)],
+            args=[item],
+            )
+        )
+
+
+
+def dead_letters(source):
+    """Return list of (to, body) SMS from ``source`` that failed to process."""
+    items = redis.client.lrange(make_dead_letter_key(source), 0, -1)
+    return [tuple(json.loads(item)[:2]) for item in items]
+
+
+
+def pending(source):
+    """Return number of SMS from ``source`` awaiting processing."""
+    return redis.client.llen(make_queue_key(source))
+
+
+
+def lock(source):
+    """
+    Try to take the processing lock for ``source``.
+
+    Return the lock token (needed to unlock) if taken, else ``None``. The
+    lock lapses after ``LOCK_TIMEOUT`` seconds even if not released.
+
+    """
+    return redis.take_lease(make_lock_key(source), LOCK_TIMEOUT)
+
+
+
+def renew(source, token):
+    """
+    Extend the processing lock for ``source`` to ``LOCK_TIMEOUT`` from now.
+
+    Return ``True`` if renewed, ``False`` if ``token`` no longer holds it.
+
+    """
+    return redis.renew_lease(make_lock_key(source), token, LOCK_TIMEOUT)
+
+
+
+def unlock(source, token):
+    """Release the processing lock for ``source``, if ``token`` holds it."""
+    redis.release_lease(make_lock_key(source), token)
+
+
+
+def make_queue_key(source):
+    """Construct Redis key for queue of incoming SMS from ``source``."""
+    return 'sms:inbox:%s' % source
+
+
+def make_dead_letter_key(source):
+    """Construct Redis key for SMS from ``source`` that failed to process."""
+    return 'sms:inbox-dead:%s' % source
+
+
+def make_lock_key(source):
+    """Construct Redis key for the processing lock for ``source``."""
+    return 'sms:inbox-lock:%s' % source
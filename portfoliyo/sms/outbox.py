@@ -0,0 +1,269 @@
+"""
+Fair, prioritized scheduling of outbound SMS.
+
+Outbound messages are queued in Redis per source number, in lanes: messages
+from a source number in the ``PRIORITY`` lane are all sent before any in the
+``BULK`` lane. Within a lane, each sender (e.g. post author) has their own
+queue and senders are served round-robin, one message at a time, so a single
+sender's large fan-out doesn't hold up everyone else's messages.
+
+Messages taken for sending are kept in an in-flight list until sent, and
+only one drainer at a time sends a given source number's messages (see
+``lock``). Queue depth and wait times are tracked per lane; see ``stats``.
+
+"""
+import json
+import time
+
+from portfoliyo import redis
+
+
+# single-village messages, invites and other messages to one family
+PRIORITY = 'priority'
+# group and all-students posts
+BULK = 'bulk'
+
+# lanes, in the order they are served
+LANES = [PRIORITY, BULK]
+
+# seconds before a source's drain lease lapses (if its holder died); must
+# comfortably exceed the time to send one rate-limited batch
+DRAIN_LEASE_SECONDS = 5 * 60
+
+
+
+def enqueue(recipients, body, sender=None, lane=PRIORITY):
+    """
+    Queue SMS ``body`` to each (phone, source) pair in ``recipients``.
+
+    ``sender`` identifies who the messages are from, for fair scheduling among
+    senders; ``lane`` is one of ``LANES``.
+
+    Return list of source numbers that messages were queued for.
+
+    """
+    now = time.time()
+    by_source = {}
+    for phone, source in recipients:
+        by_source.setdefault(source, []).append(json.dumps([phone, body, now]))
+    if not by_source:
+        return []
+    sources = by_source.keys()
+
+    p = redis.client.pipeline()
+    for source in sources:
+        p.rpush(make_queue_key(lane, source, sender), *by_source[source])
+    lengths = p.execute()
+
+    p = redis.client.pipeline()
+    for source, length in zip(sources, lengths):
+        # a sender whose queue was empty joins the back of the rotation
+        if length == len(by_source[source]):
+            p.rpush(make_rotation_key(lane, source), sender)
+    p.hincrby(make_stats_key(lane), 'depth', len(recipients))
+    p.execute()
+
+    return sources
+
+
+
+# Take up to ARGV[1] messages from lanes in order, round-robin among senders,
+# moving them to the in-flight list; return flat list of lane, message pairs.
+# If the in-flight list isn't empty (a drainer died before sending it), return
+# its messages again instead, with an empty lane.
+#
+# KEYS: in-flight key, then rotation key per lane
+# ARGV: count, then lane and sender queue key prefix per lane
+_POP_LUA = """
+local ret = {}
+local inflight = redis.call('LRANGE', KEYS[1], 0, -1)
+if #inflight > 0 then
+    for _, item in ipairs(inflight) do
+        ret[#ret + 1] = ''
+        ret[#ret + 1] = item
+    end
+    return ret
+end
+local count = tonumber(ARGV[1])
+local taken = 0
+for k = 2, #KEYS do
+    local lane = ARGV[2 * k - 2]
+    local prefix = ARGV[2 * k - 1]
+    while taken < count do
+        local sender = redis.call('LPOP', KEYS[k])
+        if not sender then
+            break
+        end
+        local queue = prefix .. sender
+        local item = redis.call('LPOP', queue)
+        if redis.call('LLEN', queue) > 0 then
+            redis.call('RPUSH', KEYS[k], sender)
+        end
+        if item then
+            redis.call('RPUSH', KEYS[1], item)
+            ret[#ret + 1] = lane
+            ret[#ret + 1] = item
+            taken = taken + 1
+        end
+    end
+end
+return ret
+"""
+
+
+
+def _pop_in_memory(client, keys, args):
+    """Python implementation of ``_POP_LUA``, for ``InMemoryRedis``."""
+    inflight = client.lrange(keys[0], 0, -1)
+    if inflight:
+        return [x for item in inflight for x in ['', item]]
+    ret = []
+    count = int(args[0])
+    taken = 0
+    for rotation, lane, prefix in zip(keys[1:], args[1::2], args[2::2]):
+        while taken < count:
+            sender = client.lpop(rotation)
+            if sender is None:
+                break
+            queue = prefix + sender
+            item = client.lpop(queue)
+            if client.llen(queue):
+                client.rpush(rotation, sender)
+            if item is not None:
+                client.rpush(keys[0], item)
+                ret.extend([lane, item])
+                taken += 1
+    return ret
+
+
+
+_pop_script = redis.Script(_POP_LUA, _pop_in_memory)
+
+
+
+def pop(source, count):
+    """
+    Take up to ``count`` messages queued from ``source`` for sending.
+
+    Returns a list of (phone, source, body) tuples, taken from lanes in
+    priority order and round-robin among senders within each lane, in one
+    atomic Redis call. Taken messages are kept in an in-flight list until
+    ``done`` is called once they are sent; if the caller dies before then,
+    the next ``pop`` returns the same messages again. So only one caller at a
+    time should pop from a given source (see ``lock``).
+
+    """
+    now = time.time()
+    args = [count]
+    for lane in LANES:
+        args.extend([lane, make_queue_key(lane, source, '')])
+    popped = _pop_script(
+        keys=[make_inflight_key(source)] + [
+            make_rotation_key(lane, source) for lane in LANES],
+        args=args,
+        )
+
+    messages = []
+    waits = {}
+    for lane, item in zip(popped[::2], popped[1::2]):
+        phone, body, queued = json.loads(item)
+        messages.append((phone, source, body))
+        # messages returned again were already counted when first taken
+        if lane:
+            waits.setdefault(lane, []).append(now - queued)
+
+    if waits:
+        p = redis.client.pipeline()
+        for lane, lane_waits in waits.items():
+            key = make_stats_key(lane)
+            p.hincrby(key, 'depth', -len(lane_waits))
+            p.hincrby(key, 'sent', len(lane_waits))
+            p.hincrby(key, 'wait_ms', int(sum(lane_waits) * 1000))
+        p.execute()
+
+    return messages
+
+
+
+def done(source):
+    """Clear the in-flight messages from ``source``, now they've been sent."""
+    redis.client.delete(make_inflight_key(source))
+
+
+
+def pending(source):
+    """Return ``True`` if any messages from ``source`` await sending."""
+    p = redis.client.pipeline()
+    p.llen(make_inflight_key(source))
+    for lane in LANES:
+        p.llen(make_rotation_key(lane, source))
+    return any(p.execute())
+
+
+
+def lock(source):
+    """
+    Try to take the drain lease for ``source``.
+
+    Return the lease token (needed to unlock) if taken, else ``None``. The
+    lease lapses after ``DRAIN_LEASE_SECONDS`` even if not released.
+
+    """
+    return redis.take_lease(make_lock_key(source), DRAIN_LEASE_SECONDS)
+
+
+
+def unlock(source, token):
+    """Release the drain lease for ``source``, if ``token`` holds it."""
+    redis.release_lease(make_lock_key(source), token)
+
+
+
+def stats():
+    """
+    Return dictionary mapping each lane to a dictionary of stats.
+
+    Stats are ``depth`` (number of messages queued), ``sent`` (number of
+    messages taken from the queue for sending so far) and ``mean_wait``
+    (average seconds messages spent queued).
+
+    """
+    p = redis.client.pipeline()
+    for lane in LANES:
+        p.hgetall(make_stats_key(lane))
+    ret = {}
+    for lane, data in zip(LANES, p.execute()):
+        sent = int(data.get('sent', 0))
+        wait_ms = int(data.get('wait_ms', 0))
+        ret[lane] = {
+            'depth': int(data.get('depth', 0)),
+            'sent': sent,
+            'mean_wait': (wait_ms / 1000.0 / sent) if sent else 0.0,
+            }
+    return ret
+
+
+
+def make_queue_key(lane, source, sender):
+    """Construct Redis key for a sender's queue in a lane."""
+    return 'sms:queue:%s:%s:%s' % (lane, source, sender)
+
+
+def make_rotation_key(lane, source):
+    """Construct Redis key for the round-robin list of senders in a lane."""
+    return 'sms:senders:%s:%s' % (lane, source)
+
+
+def make_inflight_key(source):
+    """Construct Redis key for messages from ``source`` being sent."""
+    return 'sms:inflight:%s' % source
+
+
+def make_lock_key(source):
+    """Construct Redis key for the drain lease for ``source``."""
+    return 'sms:drain-lock:%s' % source
+
+
+def make_stats_key(lane):
+    """Construct Redis key for a lane's stats hash."""
+    return 'sms:stats:%s' % lane
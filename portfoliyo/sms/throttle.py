@@ -0,0 +1,33 @@
+"""Throttling of outbound SMS."""
+import threading
+import time
+
+
+
+class RateLimiter(object):
+    """
+    Limits the rate of events per key (e.g. per source phone number).
+
+    Thread-safe: concurrent callers waiting on the same key are given
+    successive time slots ``1/rate`` seconds apart. Only limits within a
+    single process.
+
+    If ``rate`` is ``None``, never waits.
+
+    """
+    def __init__(self, rate=None):
+        self.interval = (1.0 / rate) if rate else 0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+
+    def wait(self, key):
+        """Block until an event for ``key`` is allowed; claim that slot."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.get(key, now))
+            self._next_slot[key] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
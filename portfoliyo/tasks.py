@@ -13,21 +13,243 @@ logger = get_task_logger(__name__)
 # set acks_late=True for tasks that are better executed twice than not at all
 
 
+# maximum number of messages a single drain_sms_queue run sends
+SMS_BATCH_SIZE = 50
+
+# maximum number of notification emails a single send_notification_emails
+# run (and thus a single SMTP connection) sends
+NOTIFICATION_BATCH_SIZE = 25
+
+# roughly how many pending profiles one check_for_pending_notifications run
+# takes from the pending set before handing on to the next run
+NOTIFICATION_SWEEP_SIZE = 500
+
+# seconds a pending-notification sweep's lease outlives its next run's due
+# time (so a sweep whose next run is lost doesn't block sweeps for good)
+NOTIFICATION_SWEEP_LEASE_SECONDS = 10 * 60
+
+
 
 @celery.task(ignore_result=True, acks_late=True)
 def send_sms(phone, source, body):
-    """Send an SMS message."""
+    """Send an SMS message, ahead of any bulk traffic."""
+    send_sms_batch([(phone, source)], body)
+
+
+
+@celery.task(ignore_result=True, acks_late=True)
+def send_sms_batch(recipients, body, sender=None, lane=None):
+    """
+    Send an SMS message to each (phone, source) pair in ``recipients``.
+
+    Messages are queued in the outbound SMS scheduler (see ``sms.outbox``)
+    under ``sender``, in the given ``lane`` (default priority), and a drain
+    task is started for each source number involved.
+
+    """
+    from portfoliyo.sms import outbox
+    sources = outbox.enqueue(
+        recipients, body, sender, lane or outbox.PRIORITY)
+    for source in sources:
+        drain_sms_queue.delay(source)
+
+
+
+@celery.task(ignore_result=True, acks_late=True)
+def drain_sms_queue(source):
+    """
+    Send the next batch of SMS messages queued from ``source``.
+
+    Sends at most ``SMS_BATCH_SIZE`` messages, chosen by the outbound
+    scheduler, then starts another drain task if more are queued; so priority
+    messages queued meanwhile go out in the next batch. Only one drain task
+    at a time sends from a given source (so its rate limit holds); others
+    leave the messages to it. Failure to send to one recipient is logged and
+    doesn't stop sending to the rest.
+
+    """
     from portfoliyo import sms
-    sms.send(phone, source, body)
+    from portfoliyo.sms import outbox
+    token = outbox.lock(source)
+    if token is None:
+        return
+    try:
+        messages = outbox.pop(source, SMS_BATCH_SIZE)
+        if messages:
+            failures = sms.send_many(messages)
+            outbox.done(source)
+            for (phone, from_, chunk), exc_info in failures:
+                logger.warning(
+                    "SMS to %s failed: %s" % (phone, str(exc_info[1])),
+                    exc_info=exc_info,
+                    extra={'stack': True},
+                    )
+
+            for lane, lane_stats in outbox.stats().items():
+                logger.info(
+                    "SMS %s lane: %s queued, mean wait %.1fs" % (
+                        lane, lane_stats['depth'], lane_stats['mean_wait'])
+                    )
+    finally:
+        outbox.unlock(source, token)
+
+    # more may be queued, including by a batch whose drain found us busy
+    if outbox.pending(source):
+        drain_sms_queue.delay(source)
+
+
+
+@celery.task(ignore_result=True, acks_late=True)
+def receive_sms(source):
+    """
+    Process incoming SMS queued from phone ``source``, in order of arrival.
+
+    Each message is run through the SMS hook in its own transaction, and any
+    reply is sent via the outbound SMS queue. If another task is already
+    processing messages from ``source``, leaves them to it; the holder of the
+    lock (renewed before each message) starts a fresh task if more arrive as
+    it finishes. Messages are only removed from the queue once processed, so
+    if this task dies they are processed by the next. A message that fails to
+    process is logged and moved to the dead-letter list (see
+    ``sms.inbox.fail``).
+
+    """
+    from portfoliyo import xact
+    from portfoliyo.sms import hook, inbox
+    token = inbox.lock(source)
+    if token is None:
+        return
+    try:
+        # if our lock lapsed and another task took over, leave it to that
+        while inbox.renew(source, token):
+            message = inbox.peek(source)
+            if message is None:
+                break
+            item, to, body = message
+            try:
+                with xact.xact():
+                    reply = hook.receive_sms(source, to, body)
+            except Exception as e:
+                logger.warning(
+                    "Processing SMS from %s failed: %s" % (source, str(e)),
+                    exc_info=True,
+                    extra={'stack': True},
+                    )
+                if not inbox.fail(source, item):
+                    break
+                continue
+            removed = inbox.done(source, item)
+            # the reply is committed, so send it even if we've lost the lock
+            if reply:
+                send_sms_batch([(source, to)], reply)
+            if not removed:
+                break
+    finally:
+        inbox.unlock(source, token)
+
+    # a message may have been queued after our last peek but before unlock
+    if inbox.pending(source):
+        receive_sms.delay(source)
 
 
 
 @celery.task(ignore_result=True)
-def check_for_pending_notifications():
-    """Trigger notifications to all users with pending notifications."""
+def check_for_pending_notifications(cursor=0, lease=None):
+    """
+    Trigger notifications to all users with pending notifications.
+
+    Scans the pending profiles a step at a time (about
+    ``NOTIFICATION_SWEEP_SIZE`` profiles per run, then continues in a new run
+    from ``cursor``), so the whole set is never loaded at once. Profiles are
+    sent to in batches of ``NOTIFICATION_BATCH_SIZE``, each batch over a
+    single email connection.
+
+    Only one sweep runs at a time: the first run takes the sweep ``lease``
+    and hands it on to each next run; a sweep started meanwhile does nothing.
+
+    If ``NOTIFICATION_EMAILS_PER_MINUTE`` is set, batches are spread out (and
+    the next run delayed until its batches are due) to stay within it. The
+    lease is held until the last batch is due, so one sweep's budget doesn't
+    overlap the next's. The budget covers only emails sent by sweeps, not
+    debounced sends (see ``notifications.schedule``).
+
+    """
+    from django.conf import settings
+    from portfoliyo import redis
+    from portfoliyo.notifications import render, store
+    if lease is None:
+        lease = redis.take_lease(
+            store.SWEEP_LEASE_KEY, NOTIFICATION_SWEEP_LEASE_SECONDS)
+        if lease is None:
+            return
+    cursor, profile_ids = store.scan_pending_profile_ids(
+        cursor, NOTIFICATION_SWEEP_SIZE)
+    per_minute = settings.NOTIFICATION_EMAILS_PER_MINUTE
+    countdown = 0
+    for i in range(0, len(profile_ids), NOTIFICATION_BATCH_SIZE):
+        batch = profile_ids[i:i + NOTIFICATION_BATCH_SIZE]
+        send_notification_emails.apply_async((batch,), countdown=countdown)
+        if per_minute:
+            countdown += len(batch) * 60.0 / per_minute
+
+    if cursor:
+        # hold the lease for the next run (or a while longer, if it's lost)
+        if redis.renew_lease(
+                store.SWEEP_LEASE_KEY,
+                lease,
+                int(countdown) + NOTIFICATION_SWEEP_LEASE_SECONDS,
+                ):
+            check_for_pending_notifications.apply_async(
+                (cursor, lease), countdown=countdown)
+        return
+
+    if countdown:
+        redis.renew_lease(store.SWEEP_LEASE_KEY, lease, int(countdown) + 1)
+    else:
+        redis.release_lease(store.SWEEP_LEASE_KEY, lease)
+    logger.info(
+        "Notification sends skipped (render in progress): %s" % (
+            render.skipped_renders())
+        )
+
+
+
+@celery.task(ignore_result=True)
+def sweep_expired_notifications(cursor=0):
+    """
+    Remove expired notifications from all profiles' pending notifications.
+
+    Works through profiles a step at a time (about ``NOTIFICATION_SWEEP_SIZE``
+    per run, then continues in a new run from ``cursor``). Run hourly by
+    Celery beat (see ``CELERYBEAT_SCHEDULE`` in ``portfoliyo.celery``).
+
+    """
     from portfoliyo.notifications import store
-    for profile_id in store.pending_profile_ids():
-        send_notification_email.delay(profile_id)
+    cursor, removed = store.trim_expired(cursor, NOTIFICATION_SWEEP_SIZE)
+    if removed:
+        logger.info("Removed %s expired notifications." % removed)
+    if cursor:
+        sweep_expired_notifications.delay(cursor)
+
+
+
+@celery.task(ignore_result=True)
+def migrate_legacy_notifications(cursor=0):
+    """
+    Move all notifications stored in the legacy layout to the compact one.
+
+    Works a step at a time (about ``NOTIFICATION_SWEEP_SIZE`` notifications
+    per run, then continues in a new run from ``cursor``). Not periodic: run
+    it once after deploying the compact layout, e.g. with
+    ``migrate_legacy_notifications.delay()`` from ``./manage.py shell``.
+
+    """
+    from portfoliyo.notifications import store
+    cursor, moved = store.migrate_legacy(cursor, NOTIFICATION_SWEEP_SIZE)
+    if moved:
+        logger.info("Migrated %s legacy notifications." % moved)
+    if cursor:
+        migrate_legacy_notifications.delay(cursor)
 
 
 
@@ -39,6 +261,33 @@ def send_notification_email(profile_id):
 
 
 
+@celery.task(ignore_result=True)
+def send_notification_emails(profile_ids):
+    """
+    Send notification emails to users with the given profile IDs.
+
+    All emails are sent over one (shared) email connection. Failure to send
+    to one user is logged and doesn't stop sending to the rest.
+
+    """
+    from portfoliyo import email
+    from portfoliyo.notifications import render, schedule
+    # triggers from here on need a new send; this one may have rendered them
+    schedule.disarm(profile_ids)
+    with email.shared_connection():
+        for profile_id in profile_ids:
+            try:
+                render.send(profile_id)
+            except Exception as e:
+                logger.warning(
+                    "Notification email to profile %s failed: %s" % (
+                        profile_id, str(e)),
+                    exc_info=True,
+                    extra={'stack': True},
+                    )
+
+
+
 @celery.task(base=ModelTask, ignore_result=True)
 def record_notification(name, *args, **kw):
     """Record a notification (to later be incorporated in an email)."""
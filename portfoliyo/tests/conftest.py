@@ -1,4 +1,12 @@
 """Test hooks and fixture resources."""
+import asyncore
+import BaseHTTPServer
+import json
+import smtpd
+import SocketServer
+import threading
+import urlparse
+
 import pytest
 
 
@@ -44,8 +52,13 @@ class FakeSMSMessage(object):
 
 
 @pytest.fixture
-def sms(request, monkeypatch):
-    """Monkeypatch SMS backend to collect messages for test inspection."""
+def sms(request, monkeypatch, redis):
+    """
+    Monkeypatch SMS backend to collect messages for test inspection.
+
+    Also uses the ``redis`` fixture, since outbound SMS are queued in Redis.
+
+    """
     from portfoliyo.sms import base
     base.backend.outbox = []
     def replacement_send(*a, **kw):
@@ -54,6 +67,183 @@ def sms(request, monkeypatch):
     return base.backend
 
 
+class FakeAPIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Records requests to a ``FakeAPIServer``; responds with its status."""
+    protocol_version = 'HTTP/1.1'
+
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        body = self.rfile.read(length)
+        if self.headers.getheader('content-type') == 'application/json':
+            data = json.loads(body)
+        else:
+            data = dict(urlparse.parse_qsl(body))
+        self.server.requests.append((self.path, data))
+        self.server.request_headers.append(self.headers)
+        content = json.dumps(self.server.response_data)
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if not self.server.keep_alive:
+            self.send_header('Connection', 'close')
+            self.close_connection = 1
+        elif self.server.drop_idle:
+            # close the connection anyway, without telling the client
+            self.close_connection = 1
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def log_message(self, *a, **kw):
+        pass
+
+
+
+class FakeAPIServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A local stand-in for a third-party HTTP API; records requests."""
+    daemon_threads = True
+
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), FakeAPIHandler)
+        self.requests = []
+        self.request_headers = []
+        self.connections = 0
+        self.status = 200
+        self.response_data = {}
+        self.keep_alive = True
+        self.drop_idle = False
+        self.connection_closed = threading.Event()
+
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        return SocketServer.ThreadingMixIn.process_request(
+            self, request, client_address)
+
+
+    def shutdown_request(self, request):
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+        self.connection_closed.set()
+
+
+
+@pytest.fixture
+def http_server(request):
+    """Run a local fake HTTP API server in a thread."""
+    server = FakeAPIServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def _stop_server():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(_stop_server)
+
+    return server
+
+
+
+@pytest.fixture
+def pusher_server(request, http_server):
+    """Run a local fake Pusher API server and point Pusher settings at it."""
+    from django.test.utils import override_settings
+    override = override_settings(
+        PUSHER_APPID='app',
+        PUSHER_KEY='key',
+        PUSHER_SECRET='secret',
+        PUSHER_HOST='127.0.0.1',
+        PUSHER_PORT=http_server.server_address[1],
+        )
+    override.enable()
+    request.addfinalizer(override.disable)
+
+    return http_server
+
+
+
+@pytest.fixture
+def twilio_server(request, http_server):
+    """Run a local fake Twilio API server and point Twilio settings at it."""
+    from django.test.utils import override_settings
+    override = override_settings(
+        TWILIO_ACCOUNT_SID='sid',
+        TWILIO_AUTH_TOKEN='token',
+        TWILIO_API_URL='http://127.0.0.1:%s' % http_server.server_address[1],
+        )
+    override.enable()
+    request.addfinalizer(override.disable)
+    http_server.status = 201
+
+    return http_server
+
+
+class FakeSMTPServer(smtpd.SMTPServer):
+    """A local stand-in for an SMTP server; records messages it receives."""
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+        # messages to these recipients are refused
+        self.reject = set()
+        self._running = True
+
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        if self.reject.intersection(rcpttos):
+            return '550 Recipient rejected'
+        self.messages.append((mailfrom, rcpttos, data))
+
+
+    def serve(self):
+        while self._running:
+            asyncore.loop(timeout=0.05, count=1)
+
+
+    def stop(self):
+        self._running = False
+
+
+
+@pytest.fixture
+def smtp_server(request):
+    """Run a local fake SMTP server in a thread; point email settings at it."""
+    from django.test.utils import override_settings
+    server = FakeSMTPServer()
+    thread = threading.Thread(target=server.serve)
+    thread.daemon = True
+    thread.start()
+
+    override = override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='127.0.0.1',
+        EMAIL_PORT=server.port,
+        EMAIL_HOST_USER='',
+        EMAIL_HOST_PASSWORD='',
+        EMAIL_USE_TLS=False,
+        )
+    override.enable()
+
+    def _stop_server():
+        override.disable()
+        server.stop()
+        thread.join()
+        asyncore.close_all()
+    request.addfinalizer(_stop_server)
+
+    return server
+
+
+
 def pytest_addoption(parser):
     parser.addoption(
         '--clobber-redis',
@@ -230,6 +420,22 @@ def _disable_cache(request):
 
 
 
+@pytest.fixture(autouse=True)
+def _signup_code_index_helper(request):
+    """
+    Discard signup codes left pending by a test run in a DB transaction.
+
+    Tests using the `db` fixture are rolled back without signalling it, so
+    codes pending addition to the signup-code index would otherwise be added
+    (to whatever Redis is in use) on some later test's commit.
+
+    """
+    if 'db' in request.funcargnames:
+        from portfoliyo.model.users import codes
+        request.addfinalizer(codes._discard_pending_codes)
+
+
+
 @pytest.fixture(autouse=True)
 def _celery_transaction_task_helper(request):
     """
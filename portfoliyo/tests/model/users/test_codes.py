@@ -0,0 +1,86 @@
+"""Tests for signup-code index."""
+import mock
+
+from portfoliyo import model
+from portfoliyo.model.users import codes
+
+from portfoliyo.tests import factories, utils
+
+
+
+def test_is_code_builds_index(db, redis):
+    """If the index doesn't exist yet, it is built from the database."""
+    factories.ProfileFactory.create(code='ABCDEF')
+    factories.GroupFactory.create(code='ABCDEFG')
+
+    assert codes.is_code('ABCDEF')
+    assert codes.is_code('ABCDEFG')
+    assert not codes.is_code('HELLO')
+
+
+
+def test_is_code_no_queries(db, redis):
+    """Once the index is built, lookups don't touch the database."""
+    factories.ProfileFactory.create(code='ABCDEF')
+    codes.rebuild()
+
+    with utils.assert_num_queries(0):
+        with utils.assert_num_calls(redis, 2):
+            assert codes.is_code('ABCDEF')
+            assert not codes.is_code('HELLO')
+
+
+
+def test_add_outside_transaction(redis):
+    """Outside a transaction, a code is added to the index immediately."""
+    with mock.patch('portfoliyo.model.users.codes.transaction') as mock_xact:
+        mock_xact.is_managed.return_value = False
+        codes.add('ABCDEF')
+
+    assert redis.sismember(codes.KEY, 'ABCDEF')
+
+
+
+def test_add_on_commit(redis):
+    """In a transaction, a code is added only once it commits."""
+    with mock.patch('portfoliyo.model.users.codes.transaction') as mock_xact:
+        mock_xact.is_managed.return_value = True
+        codes.add('ABCDEF')
+
+    assert not redis.sismember(codes.KEY, 'ABCDEF')
+
+    codes._add_pending_codes()
+
+    assert redis.sismember(codes.KEY, 'ABCDEF')
+
+
+
+def test_discard_on_rollback(redis):
+    """Codes from a rolled-back transaction are not added."""
+    with mock.patch('portfoliyo.model.users.codes.transaction') as mock_xact:
+        mock_xact.is_managed.return_value = True
+        codes.add('ABCDEF')
+
+    codes._discard_pending_codes()
+    codes._add_pending_codes()
+
+    assert not redis.sismember(codes.KEY, 'ABCDEF')
+
+
+
+def test_create_with_user_adds_code(db):
+    """Profile.create_with_user adds a new teacher's code to the index."""
+    school = factories.SchoolFactory.create()
+    with mock.patch('portfoliyo.model.users.models.codes.add') as mock_add:
+        p = model.Profile.create_with_user(school, school_staff=True)
+
+    mock_add.assert_called_once_with(p.code)
+
+
+
+def test_group_save_adds_code(db):
+    """Saving a group adds its code to the index."""
+    with mock.patch('portfoliyo.model.users.models.codes.add') as mock_add:
+        g = factories.GroupFactory.create()
+
+    mock_add.assert_called_once_with(g.code)
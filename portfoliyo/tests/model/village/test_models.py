@@ -96,7 +96,7 @@ class TestPostCreate(object):
         rel = factories.RelationshipFactory.create(
             from_profile__school_staff=True)
 
-        target = 'portfoliyo.pusher.events.trigger'
+        target = 'portfoliyo.pusher.events.trigger_many'
         with mock.patch(target) as mock_trigger:
             post = models.Post.create(
                 rel.elder, rel.student, 'Foo\n', sequence_id='33')
@@ -104,7 +104,7 @@ class TestPostCreate(object):
         args = mock_trigger.call_args[0]
         post_data = args[2]['objects'][0]
 
-        assert args[0] == 'user_%s' % rel.from_profile_id
+        assert args[0] == ['user_%s' % rel.from_profile_id]
         assert args[1] == 'message_posted'
         assert post_data['author_sequence_id'] == '33'
         assert post_data['author_id'] == rel.from_profile_id
@@ -128,7 +128,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -138,7 +138,11 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000")],
+            "Hey dad --John Doe",
+            sender=rel1.elder.id,
+            lane='priority',
+            )
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -165,7 +169,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -193,7 +197,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -203,7 +207,11 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000")],
+            "Hey dad --John Doe",
+            sender=rel1.elder.id,
+            lane='priority',
+            )
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -234,7 +242,7 @@ class TestPostCreate(object):
             state='kidname',
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             models.Post.create(
                 rel1.elder,
@@ -244,7 +252,11 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+1333666000", "Hey dad --John Doe")
+            [("+13216540987", "+1333666000")],
+            "Hey dad --John Doe",
+            sender=rel1.elder.id,
+            lane='priority',
+            )
         assert utils.refresh(signup).state == 'done'
 
 
@@ -259,7 +271,7 @@ class TestPostCreate(object):
             from_profile__user__is_active=False,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -283,7 +295,7 @@ class TestPostCreate(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -305,7 +317,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 None,
@@ -436,6 +448,145 @@ class TestPostCreate(object):
 
 
 
+class TestPostCreateMany(object):
+    def test_creates_posts(self, db):
+        """Creates and returns a Post in each student's village."""
+        rel1 = factories.RelationshipFactory.create()
+        rel2 = factories.RelationshipFactory.create(from_profile=rel1.elder)
+
+        posts = models.Post.create_many(
+            rel1.elder, [rel1.student, rel2.student], 'Foo\n', from_sms=True)
+
+        assert [p.student for p in posts] == [rel1.student, rel2.student]
+        assert [p.relationship for p in posts] == [rel1, rel2]
+        assert [p.id for p in posts] == [
+            p.id for p in models.Post.objects.order_by('id')]
+        for post in posts:
+            assert post.author == rel1.elder
+            assert post.html_text == 'Foo<br>'
+            assert post.from_sms
+            assert not post.to_sms
+            assert post.meta == {'sms': []}
+        assert utils.refresh(rel1.elder).has_posted
+
+
+    def test_ids_of_created_posts(self, db):
+        """Returned posts have their own IDs, even if others look the same."""
+        rel = factories.RelationshipFactory.create()
+        timestamp = models.now()
+        with mock.patch('portfoliyo.model.village.models.now') as mock_now:
+            mock_now.return_value = timestamp
+            models.Post.create_many(None, [rel.student], 'Old')
+            posts = models.Post.create_many(None, [rel.student], 'New')
+
+        assert [p.id for p in posts] == list(
+            models.Post.objects.filter(original_text='New').values_list(
+                'id', flat=True)
+            )
+        assert utils.refresh(posts[0]).original_text == 'New'
+
+
+    def test_no_students(self, db):
+        """Creating posts in no villages is a no-op."""
+        rel = factories.RelationshipFactory.create()
+
+        assert models.Post.create_many(rel.elder, [], 'Foo') == []
+        assert not models.Post.objects.exists()
+
+
+    def test_in_reply_to(self, db):
+        """Records auto-reply as sent to the replied-to phone; no SMS sent."""
+        rel1 = factories.RelationshipFactory.create(
+            from_profile__phone="+13216540987",
+            from_profile__user__is_active=True,
+            )
+        rel2 = factories.RelationshipFactory.create(from_profile=rel1.elder)
+
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
+        with mock.patch(target) as mock_send_sms:
+            posts = models.Post.create_many(
+                None,
+                [rel1.student, rel2.student],
+                'Thank you!',
+                in_reply_to="+13216540987",
+                )
+
+        assert mock_send_sms.call_count == 0
+        for post in posts:
+            assert post.author is None
+            assert post.relationship is None
+            assert [r['id'] for r in post.meta['sms']] == [rel1.elder.id]
+            assert post.to_sms
+
+
+    def test_unread_for_web_users_in_one_redis_call(self, db, redis):
+        """Posts marked unread for non-author web users in one Redis call."""
+        rel1 = factories.RelationshipFactory.create(
+            from_profile__user__email='foo@example.com')
+        rel2 = factories.RelationshipFactory.create(from_profile=rel1.elder)
+        other = factories.RelationshipFactory.create(
+            from_profile__user__email='bar@example.com',
+            to_profile=rel2.student,
+            )
+
+        with mock.patch('portfoliyo.model.village.models.tasks'):
+            with utils.assert_num_calls(redis, 1):
+                post1, post2 = models.Post.create_many(
+                    rel1.elder, [rel1.student, rel2.student], 'Foo')
+
+        assert not unread.is_unread(post1, rel1.elder)
+        assert not unread.is_unread(post2, rel1.elder)
+        assert unread.is_unread(post2, other.elder)
+
+
+    def test_constant_queries(self, db):
+        """Number of queries doesn't depend on the number of villages."""
+        def queries_for_size(num_students):
+            parent = factories.ProfileFactory.create(has_posted=True)
+            students = []
+            for i in range(num_students):
+                rel = factories.RelationshipFactory.create(
+                    from_profile=parent)
+                factories.RelationshipFactory.create(
+                    to_profile=rel.student, from_profile__school_staff=True)
+                students.append(rel.student)
+            with mock.patch('portfoliyo.model.village.models.tasks'):
+                with utils.count_queries() as queries:
+                    models.Post.create_many(parent, students, "Hallo")
+            return len(queries)
+
+        assert queries_for_size(1) == queries_for_size(10)
+
+
+    def test_one_task_each(self, db):
+        """One Pusher task and one notification task for all posts."""
+        rel1 = factories.RelationshipFactory.create()
+        rel2 = factories.RelationshipFactory.create(from_profile=rel1.elder)
+
+        with mock.patch('portfoliyo.model.village.models.tasks') as mock_tasks:
+            posts = models.Post.create_many(
+                rel1.elder, [rel1.student, rel2.student], 'Foo')
+
+        mock_tasks.push_event.delay.assert_called_once_with(
+            'posted_many', [p.id for p in posts])
+        mock_tasks.record_notification.delay.assert_called_once_with(
+            'post_all_many', posts)
+
+
+    def test_can_prevent_notification(self, db):
+        """No notification if pass notifications=False."""
+        rel1 = factories.RelationshipFactory.create()
+        factories.RelationshipFactory.create(to_profile=rel1.student)
+
+        target = 'portfoliyo.notifications.record.post'
+        with mock.patch(target) as mock_notify_post:
+            models.Post.create_many(
+                rel1.elder, [rel1.student], "Hello", notifications=False)
+
+        assert mock_notify_post.call_count == 0
+
+
+
 class TestBulkPost(object):
     def test_create(self, db):
         """Creates a bulk post and posts in individual villages."""
@@ -453,6 +604,46 @@ class TestBulkPost(object):
         assert utils.refresh(rel.elder).has_posted
 
 
+    def test_create_constant_queries(self, db, redis):
+        """Number of queries to create a bulk post doesn't depend on size."""
+        def queries_for_size(num_students):
+            teacher = factories.ProfileFactory.create(school_staff=True)
+            group = factories.GroupFactory.create(owner=teacher)
+            for i in range(num_students):
+                rel = factories.RelationshipFactory.create(
+                    from_profile=teacher)
+                factories.RelationshipFactory.create(
+                    to_profile=rel.student,
+                    from_profile__user__email='parent-%s-%s@example.com' % (
+                        num_students, i),
+                    )
+                group.students.add(rel.student)
+            # isolate the request-side cost from eagerly-run tasks
+            with mock.patch('portfoliyo.model.village.models.tasks'):
+                with utils.count_queries() as queries:
+                    models.BulkPost.create(teacher, group, "Hallo")
+            return len(queries)
+
+        assert queries_for_size(1) == queries_for_size(10)
+
+
+    def test_create_one_redis_call(self, db, redis):
+        """Marking sub-posts unread for all elders is a single Redis call."""
+        teacher = factories.ProfileFactory.create(school_staff=True)
+        group = factories.GroupFactory.create(owner=teacher)
+        for i in range(3):
+            rel = factories.RelationshipFactory.create(from_profile=teacher)
+            factories.RelationshipFactory.create(
+                to_profile=rel.student,
+                from_profile__user__email='parent%s@example.com' % i,
+                )
+            group.students.add(rel.student)
+
+        with mock.patch('portfoliyo.model.village.models.tasks'):
+            with utils.assert_num_calls(redis, 1):
+                models.BulkPost.create(teacher, group, "Hallo")
+
+
     def test_create_no_author(self, db):
         """Can create an authorless (system) bulk post."""
         g = factories.GroupFactory()
@@ -466,18 +657,17 @@ class TestBulkPost(object):
         rel = factories.RelationshipFactory.create(
             from_profile__school_staff=True)
 
-        target = 'portfoliyo.pusher.events.trigger'
+        target = 'portfoliyo.pusher.events.trigger_many'
         with mock.patch(target) as mock_trigger:
             models.BulkPost.create(rel.elder, None, 'Foo\n', sequence_id='33')
 
-        student_args = mock_trigger.call_args_list[0][0]
-        student_post_data = student_args[2]['objects'][0]
-        group_args = mock_trigger.call_args_list[1][0]
-        group_post_data = group_args[2]['objects'][0]
+        # a single event carries both the sub-post and the bulk post
+        assert mock_trigger.call_count == 1
+        args = mock_trigger.call_args[0]
+        student_post_data, group_post_data = args[2]['objects']
 
-        assert student_args[0] == 'user_%s' % rel.from_profile_id
-        assert group_args[0] == 'user_%s' % rel.from_profile_id
-        assert student_args[1] == group_args[1] == 'message_posted'
+        assert args[0] == ['user_%s' % rel.from_profile_id]
+        assert args[1] == 'message_posted'
         assert student_post_data['author_sequence_id'] == '33'
         assert student_post_data['author_id'] == rel.from_profile_id
         assert group_post_data['author_sequence_id'] == '33'
@@ -544,13 +734,17 @@ class TestBulkPost(object):
         group = factories.GroupFactory.create()
         group.students.add(rel1.student)
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.BulkPost.create(
                 rel1.elder, group, 'Hey dad', profile_ids=[rel2.elder.id])
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000")],
+            "Hey dad --John Doe",
+            sender=rel1.elder.id,
+            lane='bulk',
+            )
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -579,13 +773,17 @@ class TestBulkPost(object):
         group = factories.GroupFactory.create()
         group.students.add(rel1.student)
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.BulkPost.create(
                 rel1.elder, group, 'Hey dad', profile_ids='all')
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000")],
+            "Hey dad --John Doe",
+            sender=rel1.elder.id,
+            lane='bulk',
+            )
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -1,7 +1,7 @@
 """Tests for unread-counts management."""
 from portfoliyo.model import unread
 
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 
 
@@ -36,6 +36,31 @@ def test_all_unread(db, redis):
 
 
 
+def test_mark_unread_many(db, redis):
+    """Can mark many posts unread by many profiles in one Redis call."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create()
+    profile1 = factories.ProfileFactory.create()
+    profile2 = factories.ProfileFactory.create()
+
+    with utils.assert_num_calls(redis, 1):
+        unread.mark_unread_many(
+            [(post1, profile1), (post1, profile2), (post2, profile2)])
+
+    assert unread.is_unread(post1, profile1)
+    assert unread.is_unread(post1, profile2)
+    assert unread.is_unread(post2, profile2)
+    assert not unread.is_unread(post2, profile1)
+
+
+
+def test_mark_unread_many_empty(redis):
+    """Marking no posts unread makes no Redis calls."""
+    with utils.assert_num_calls(redis, 0):
+        unread.mark_unread_many([])
+
+
+
 def test_mark_read(db, redis):
     """Can mark a post as read."""
     post = factories.PostFactory.create()
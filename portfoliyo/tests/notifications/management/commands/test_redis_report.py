@@ -0,0 +1,35 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+import mock
+from redis.exceptions import ResponseError
+
+
+
+def test_redis_report(redis):
+    """Reports key count and approximate size for each key family."""
+    redis.sadd('unread:1:2', 3)
+    redis.sadd('unread:1:4', 5)
+    redis.sadd('announcements:unread:1', 2)
+    stdout = StringIO()
+
+    call_command('redis_report', stdout=stdout)
+
+    lines = stdout.getvalue().splitlines()
+    assert lines[0].split() == ['family', 'keys', '~bytes']
+    assert [l.split()[:2] for l in lines[1:]] == [
+        ['announcements', '1'], ['unread', '2']]
+    assert all(int(l.split()[2]) > 0 for l in lines[1:])
+
+
+
+def test_redis_report_no_debug(redis):
+    """If sizes can't be measured, reports key counts only."""
+    redis.sadd('unread:1:2', 3)
+    stdout = StringIO()
+
+    with mock.patch.object(redis, 'debug_object') as mock_debug_object:
+        mock_debug_object.side_effect = ResponseError("unknown command")
+        call_command('redis_report', stdout=stdout)
+
+    assert stdout.getvalue().splitlines()[1].split() == ['unread', '1', '?']
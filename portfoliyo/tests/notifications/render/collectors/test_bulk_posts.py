@@ -1,8 +1,11 @@
 """Tests for BulkPostCollector and related classes."""
 import pytest
 
-from portfoliyo.notifications.render.collectors import bulk_posts
-from portfoliyo.tests import factories
+from portfoliyo import model
+from portfoliyo.notifications import types
+from portfoliyo.notifications.render import collect
+from portfoliyo.notifications.render.collectors import base, bulk_posts
+from portfoliyo.tests import factories, utils
 
 
 
@@ -14,3 +17,53 @@ def test_not_visible(db):
 
     with pytest.raises(bulk_posts.base.RehydrationFailed):
         bpc.hydrate({'bulk-post-id': bp.id})
+
+
+
+def _bulk_post_in_villages(teacher, num_villages):
+    """Create a bulk post triggering posts in ``num_villages`` of teacher's."""
+    bulk_post = factories.BulkPostFactory.create()
+    for i in range(num_villages):
+        rel = factories.RelationshipFactory.create(from_profile=teacher)
+        factories.PostFactory.create(
+            student=rel.student, from_bulk=bulk_post)
+    return bulk_post
+
+
+
+def test_visibility_one_query(db):
+    """Visible posts for all pre-loaded bulk posts are found in one query."""
+    teacher = factories.ProfileFactory.create()
+    bulk = [_bulk_post_in_villages(teacher, 2) for i in range(3)]
+    data = [{'bulk-post-id': bp.id, 'triggering': '1'} for bp in bulk]
+    objects = base.load_objects(
+        [dict(d, name=types.BULK_POST) for d in data],
+        {types.BULK_POST: bulk_posts.BulkPostCollector},
+        )
+    bpc = bulk_posts.BulkPostCollector(teacher, objects)
+
+    with utils.assert_num_queries(2):
+        hydrated = [bpc.hydrate(d) for d in data]
+
+    assert [len(h['students']) for h in hydrated] == [2, 2, 2]
+
+
+
+def test_single_visible_post_switches_type(db):
+    """If only one sub-post is visible, it's hydrated as a plain post."""
+    teacher = factories.ProfileFactory.create()
+    bp = _bulk_post_in_villages(teacher, 1)
+    objects = base.load_objects(
+        [{'name': types.BULK_POST, 'bulk-post-id': bp.id}],
+        {types.BULK_POST: bulk_posts.BulkPostCollector},
+        )
+    bpc = bulk_posts.BulkPostCollector(teacher, objects)
+
+    with pytest.raises(collect.SwitchType) as excinfo:
+        bpc.hydrate({'bulk-post-id': bp.id, 'triggering': '1'})
+
+    post = model.Post.objects.get(from_bulk=bp)
+    assert excinfo.value.new_type == types.POST
+    assert excinfo.value.new_data == {'post-id': post.id, 'triggering': '1'}
+    # the post is pre-loaded for the post collector
+    assert objects[model.Post][post.id] == post
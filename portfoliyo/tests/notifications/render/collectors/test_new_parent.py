@@ -2,7 +2,7 @@
 import mock
 import pytest
 
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 from portfoliyo.notifications.render.collectors import new_parent
 
@@ -16,6 +16,27 @@ class TestSignup(object):
         assert signup.role == 'Foo'
 
 
+    def test_given_relationships(self, db):
+        """Relationship is looked up in given relationships, not queried."""
+        rel = factories.RelationshipFactory.create(description='Mom')
+        ts = factories.TextSignupFactory.create(
+            family=rel.elder, student=rel.student)
+        relationships = {(rel.elder.id, rel.student.id): rel}
+        with utils.count_queries() as queries:
+            signup = new_parent.Signup.from_textsignup(ts, relationships)
+
+        assert signup.role == 'Mom'
+        assert not queries
+
+
+    def test_not_in_given_relationships(self, db):
+        """Signup missing from given relationships falls back to role."""
+        ts = factories.TextSignupFactory.create(family__role='Foo')
+        signup = new_parent.Signup.from_textsignup(ts, {})
+
+        assert signup.role == 'Foo'
+
+
 
 class TestNewParentCollector(object):
     def test_no_student(self, db):
@@ -0,0 +1,73 @@
+"""Tests for PostCollector and related classes."""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from portfoliyo.notifications.render.collectors import posts
+from portfoliyo.tests import factories, utils
+
+
+
+def _village_with_posts(num_posts, hours_ago=1):
+    """Return a Village whose newest post is new; plus older posts' IDs."""
+    student = factories.ProfileFactory.create()
+    now = timezone.now()
+    older = [
+        factories.PostFactory.create(
+            student=student,
+            timestamp=now - timedelta(hours=hours_ago, minutes=i),
+            )
+        for i in range(num_posts)
+        ]
+    new = factories.PostFactory.create(student=student, timestamp=now)
+    village = posts.Village(student)
+    village.add({'student': student, 'triggering': True, 'post': new})
+    return village, [p.id for p in older]
+
+
+
+class TestLoadContextPosts(object):
+    def test_matches_single_village(self, db):
+        """Same context posts as querying each village separately."""
+        villages = [
+            _village_with_posts(7)[0],
+            _village_with_posts(2)[0],
+            _village_with_posts(3, hours_ago=72)[0],
+            _village_with_posts(0)[0],
+            ]
+        expected = [
+            [p['post_id'] for p in v.context_posts] for v in villages]
+        for v in villages:
+            v._context_posts = None
+
+        posts.load_context_posts(villages)
+
+        assert [
+            [p['post_id'] for p in v._context_posts] for v in villages
+            ] == expected
+
+
+    def test_latest_recent_posts(self, db):
+        """Latest five recent posts, or the oldest of them if none recent."""
+        recent, recent_ids = _village_with_posts(7)
+        old, old_ids = _village_with_posts(7, hours_ago=72)
+
+        posts.load_context_posts([recent, old])
+
+        assert {p['post_id'] for p in recent.context_posts} == set(
+            recent_ids[:5])
+        assert [p['post_id'] for p in old.context_posts] == [old_ids[4]]
+
+
+    def test_constant_queries(self, db):
+        """Number of queries doesn't depend on the number of villages."""
+        def queries_for(num_villages):
+            villages = [
+                _village_with_posts(3)[0] for i in range(num_villages)]
+            with utils.count_queries() as queries:
+                posts.load_context_posts(villages)
+                for village in villages:
+                    village.context_posts
+            return len(queries)
+
+        assert queries_for(1) == queries_for(4)
@@ -33,9 +33,9 @@ def recip(request, db, redis):
         prefs = params.get('prefs', {})
         kw.update(prefs)
 
-    # Temporarily patch the ``send_notification_email`` task to do nothing; we
-    # want to trigger the actual email-sending ourselves in these tests.
-    patcher = mock.patch('portfoliyo.tasks.send_notification_email')
+    # Temporarily patch the ``send_notification_emails`` task to do nothing;
+    # we want to trigger the actual email-sending ourselves in these tests.
+    patcher = mock.patch('portfoliyo.tasks.send_notification_emails')
     patcher.start()
     request.addfinalizer(patcher.stop)
 
@@ -57,13 +57,13 @@ def recip(request, db, redis):
 
 
 class TestSend(object):
-    def test_send_only_if_email(self, db):
+    def test_send_only_if_email(self, db, redis):
         """If user has no email, notifications not queried or sent."""
         p = factories.ProfileFactory.create(user__email=None)
         assert not base.send(p.id)
 
 
-    def test_send_only_if_active(self, db):
+    def test_send_only_if_active(self, db, redis):
         """If user is inactive, notifications not queried or sent."""
         p = factories.ProfileFactory.create(
             user__email='foo@example.com', user__is_active=False)
@@ -77,6 +77,38 @@ class TestSend(object):
         assert not base.send(p.id)
 
 
+    def test_send_skipped_if_render_in_progress(self, recip):
+        """If another send to profile is in progress, skip and count it."""
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+        base.take_lease(recip.id)
+
+        assert not base.send(recip.id)
+        assert len(mail.outbox) == 0
+        assert base.skipped_renders() == 1
+
+
+    def test_send_releases_lease(self, recip):
+        """After a send, the next send to that profile isn't skipped."""
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+        assert base.send(recip.id)
+        record.added_to_village(recip, rel.elder, rel.student)
+
+        assert base.send(recip.id)
+        assert len(mail.outbox) == 2
+        assert base.skipped_renders() == 0
+
+
+    def test_send_no_clear_ignores_lease(self, recip):
+        """A send that doesn't clear notifications doesn't need the lease."""
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+        base.take_lease(recip.id)
+
+        assert base.send(recip.id, clear=False)
+
+
     def test_generic_subject_single_student(self, recip):
         """Generic subject if multiple notification types, single student."""
         rel = factories.RelationshipFactory.create(
@@ -1080,3 +1112,32 @@ class TestSend(object):
         assert base.send(recip.id)
         self.assert_multi_email(
             params['subject'], params['html'], params['text'], context)
+
+
+
+class TestLease(object):
+    def test_exclusive(self, redis):
+        """Only one holder of a profile's render lease at a time."""
+        token = base.take_lease(1)
+
+        assert token is not None
+        assert base.take_lease(1) is None
+        assert base.take_lease(2) is not None
+        base.release_lease(1, token)
+        assert base.take_lease(1) is not None
+
+
+    def test_release_only_own(self, redis):
+        """Releasing with a stale token doesn't release another's lease."""
+        base.take_lease(1)
+        base.release_lease(1, 'stale')
+
+        assert base.take_lease(1) is None
+
+
+    def test_expires(self, redis):
+        """A lease is always taken with an expiry."""
+        base.take_lease(1)
+
+        ttl = redis.ttl(base.make_render_lease_key(1))
+        assert 0 < ttl <= base.RENDER_LEASE_SECONDS
@@ -2,8 +2,9 @@ import contextlib
 
 import mock
 
-from portfoliyo.notifications import types
+from portfoliyo.notifications import record, types
 from portfoliyo.notifications.render import collect
+from portfoliyo.tests import factories, utils
 
 
 @contextlib.contextmanager
@@ -37,6 +38,63 @@ class TestNotificationCollection(object):
             assert not collection
 
 
+    def test_constant_queries(self, db, redis):
+        """Queries to hydrate don't depend on number of notifications."""
+        def queries_for(num):
+            recip = factories.ProfileFactory.create(
+                user__email='recip%s@example.com' % num)
+            for i in range(num):
+                rel = factories.RelationshipFactory.create(
+                    from_profile__school_staff=True)
+                post = factories.PostFactory.create(
+                    author=rel.elder, student=rel.student)
+                with mock.patch('portfoliyo.notifications.schedule.tasks'):
+                    record.added_to_village(recip, rel.elder, rel.student)
+                    record.post(recip, post)
+            collection = collect.NotificationCollection(recip)
+            with utils.count_queries() as queries:
+                assert len(collection.collectors) == 2
+            return len(queries)
+
+        assert queries_for(1) == queries_for(3)
+
+
+    def test_constant_queries_new_parent(self, db, redis):
+        """Queries for new-parent context don't depend on number of signups."""
+        def queries_for(num):
+            recip = factories.ProfileFactory.create(
+                user__email='recip%s@example.com' % num)
+            for i in range(num):
+                rel = factories.RelationshipFactory.create(
+                    description='Mom')
+                signup = factories.TextSignupFactory.create(
+                    family=rel.elder, student=rel.student, teacher=recip)
+                with mock.patch('portfoliyo.notifications.schedule.tasks'):
+                    record.new_parent(recip, signup)
+            collection = collect.NotificationCollection(recip)
+            with utils.count_queries() as queries:
+                signups = collection.context['signups']
+            assert [s.role for s in signups] == ['Mom'] * num
+            return len(queries)
+
+        assert queries_for(1) == queries_for(3)
+
+
+    def test_missing_objects(self, db):
+        """Notifications referring to deleted objects are skipped."""
+        rel = factories.RelationshipFactory.create()
+        collection = collect.NotificationCollection(rel.elder)
+        data = [
+            {
+                'name': types.ADDED_TO_VILLAGE,
+                'added-by-id': str(rel.elder.id),
+                'student-id': str(rel.student.id + 1000),
+                },
+            ]
+        with mock_store(data):
+            assert not collection
+
+
     def test_context(self):
         """Accessing context attr forces hydration."""
         def fake_hydrate(self_):
@@ -0,0 +1,106 @@
+"""Tests for cached CSS inlining."""
+import sys
+import threading
+
+from django.conf import settings
+import mock
+import premailer
+
+from portfoliyo.notifications.render import inline
+
+
+HTML = """<html>
+<head>
+<style>
+h1, h2 { color:red; }
+p { font-size:2px }
+p.footer { font-size: 1px }
+</style>
+</head>
+<body>
+<h1>Hi!</h1>
+<p>Yes!</p>
+<p class="footer" style="color:blue">Footer</p>
+<a href="/foo/">Link</a>
+</body>
+</html>"""
+
+
+
+def plain_transform(html):
+    """Inline ``html`` with uncached premailer."""
+    return premailer.Premailer(
+        html,
+        base_url=settings.PORTFOLIYO_BASE_URL,
+        output_xhtml=True,
+        ).transform()
+
+
+
+class TestTransform(object):
+    def test_same_as_premailer(self):
+        """Cached inlining output is identical to plain premailer's."""
+        expected = plain_transform(HTML)
+
+        assert inline.transform(HTML) == expected
+        # and again, now served from the caches
+        assert inline.transform(HTML) == expected
+
+
+    def test_stylesheet_parsed_once(self):
+        """Each distinct stylesheet is only parsed once."""
+        inline.transform(HTML)
+        key = [k for k in inline._style_rules if 'p.footer' in k[0]][0]
+        cached = inline._style_rules[key]
+        inline.transform(HTML)
+
+        assert inline._style_rules[key] is cached
+
+
+    def test_premailer_untouched(self):
+        """Plain premailer isn't affected by the cached inliner."""
+        inline.transform(HTML)
+        module = sys.modules[premailer.Premailer.__module__]
+
+        assert module.CSSSelector is inline.CSSSelector
+        assert (
+            premailer.Premailer._parse_style_rules.im_func is not
+            inline.CachedPremailer._parse_style_rules.im_func
+            )
+
+
+
+class TestChooseInliner(object):
+    def test_checked_version(self):
+        """Premailer version the cache was checked against gets the cache."""
+        assert inline.choose_inliner(inline.PREMAILER_VERSION) is (
+            inline.CachedPremailer)
+
+
+    def test_other_version(self):
+        """Other premailer versions fall back to plain premailer."""
+        target = 'portfoliyo.notifications.render.inline.logger.warning'
+        with mock.patch(target) as mock_warning:
+            inliner = inline.choose_inliner('0.0')
+
+        assert inliner is premailer.Premailer
+        assert mock_warning.call_count == 1
+
+
+
+class TestCompileSelector(object):
+    def test_cached(self):
+        """Compiled selectors are reused within a thread."""
+        assert inline.compile_selector('p') is inline.compile_selector('p')
+
+
+    def test_per_thread(self):
+        """Compiled selectors aren't shared between threads."""
+        mine = inline.compile_selector('p')
+        theirs = []
+        t = threading.Thread(
+            target=lambda: theirs.append(inline.compile_selector('p')))
+        t.start()
+        t.join()
+
+        assert theirs[0] is not mine
@@ -2,9 +2,9 @@
 import mock
 import pytest
 
-from portfoliyo.notifications import record
+from portfoliyo.notifications import record, store
 
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 
 
@@ -155,12 +155,12 @@ def test_record(mock_store):
 
 
 def test_record_triggering(mock_store):
-    """If triggering, triggers send_notification task."""
-    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email.delay'
-    with mock.patch(tgt) as mock_task_delay:
+    """If triggering, schedules notification email."""
+    tgt = 'portfoliyo.notifications.record.schedule.schedule'
+    with mock.patch(tgt) as mock_schedule:
         record._record(_profile(id=2), 'some', triggering=True)
 
-    mock_task_delay.assert_called_with(2)
+    mock_schedule.assert_called_with([2])
     mock_store.assert_called_with(
         2, 'some', triggering=True, data=None)
 
@@ -169,13 +169,13 @@ def test_record_triggering(mock_store):
 def test_record_triggering_disabled(mock_store):
     """If NOTIFICATION_EMAILS setting is ``False``, no email sent."""
     settings_tgt = 'portfoliyo.notifications.record.settings'
-    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email.delay'
+    tgt = 'portfoliyo.notifications.record.schedule.schedule'
     with mock.patch(settings_tgt) as mock_settings:
-        with mock.patch(tgt) as mock_task_delay:
+        with mock.patch(tgt) as mock_schedule:
             mock_settings.NOTIFICATION_EMAILS = False
             record._record(_profile(id=2), 'some', triggering=True)
 
-    assert mock_task_delay.call_count == 0
+    assert mock_schedule.call_count == 0
 
 
 
@@ -195,6 +195,64 @@ def test_record_doesnt_store_if_no_email(mock_store):
 
 
 
+def test_batch(mock_store):
+    """Notifications in a batch are stored at once; emails scheduled once."""
+    store_many_tgt = 'portfoliyo.notifications.record.store.store_many'
+    tgt = 'portfoliyo.notifications.record.schedule.schedule'
+    with mock.patch(store_many_tgt) as mock_store_many:
+        with mock.patch(tgt) as mock_schedule:
+            with record.batch():
+                record._record(_profile(id=2), 'some', triggering=True)
+                with record.batch():
+                    record._record(_profile(id=3), 'other')
+                record._record(_profile(id=2), 'more', triggering=True)
+                assert not mock_store_many.call_count
+
+    assert not mock_store.call_count
+    mock_store_many.assert_called_once_with([
+        (2, 'some', True, None),
+        (3, 'other', False, None),
+        (2, 'more', True, None),
+        ])
+    mock_schedule.assert_called_once_with([2])
+
+
+
+def test_batch_exception(mock_store):
+    """If a batch block raises, its notifications are discarded."""
+    store_many_tgt = 'portfoliyo.notifications.record.store.store_many'
+    with mock.patch(store_many_tgt) as mock_store_many:
+        with pytest.raises(ValueError):
+            with record.batch():
+                record._record(_profile(id=2), 'some')
+                raise ValueError()
+        record._record(_profile(id=3), 'other')
+
+    assert not mock_store_many.call_count
+    mock_store.assert_called_once_with(
+        3, 'other', triggering=False, data=None)
+
+
+
+def test_post_all_one_redis_call(db, redis):
+    """Notifying a whole village of a post takes one Redis call."""
+    rel = factories.RelationshipFactory.create()
+    for i in range(3):
+        factories.RelationshipFactory.create(
+            to_profile=rel.student,
+            from_profile__user__email='parent%s@example.com' % i,
+            )
+    post = factories.PostFactory.create(author=rel.elder, student=rel.student)
+
+    tgt = 'portfoliyo.notifications.schedule.tasks.send_notification_emails'
+    with mock.patch(tgt):
+        with utils.assert_num_calls(redis, 1):
+            record.post_all(post)
+
+    assert len(store.pending_profile_ids()) == 3
+
+
+
 def _profile(id, email="foo@example.com", is_active=True, **kwargs):
     return mock.Mock(
         id=id, user=mock.Mock(email=email, is_active=is_active), **kwargs)
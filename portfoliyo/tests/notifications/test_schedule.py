@@ -0,0 +1,88 @@
+"""Tests for debounced notification-email scheduling."""
+from django.test.utils import override_settings
+import mock
+import pytest
+
+from portfoliyo import tasks
+from portfoliyo.notifications import schedule
+from portfoliyo.tests import utils
+
+
+TASK = 'portfoliyo.notifications.schedule.tasks.send_notification_emails'
+
+
+
+@pytest.fixture
+def debounce(request):
+    """Set a 60-second notification email debounce window."""
+    override = override_settings(NOTIFICATION_DEBOUNCE_SECONDS=60)
+    override.enable()
+    request.addfinalizer(override.disable)
+
+
+
+def test_schedule_no_debounce():
+    """With no debounce window, notification emails are sent right away."""
+    with mock.patch(TASK) as mock_task:
+        schedule.schedule([1, 2])
+
+    mock_task.delay.assert_called_once_with([1, 2])
+
+
+
+def test_schedule(redis, debounce):
+    """Schedules send after debounce window; only for unarmed profiles."""
+    with mock.patch(TASK) as mock_task:
+        schedule.schedule([1, 2])
+        schedule.schedule([2])
+        schedule.schedule([2, 3])
+
+    assert mock_task.apply_async.call_args_list == [
+        mock.call(([1, 2],), countdown=60),
+        mock.call(([3],), countdown=60),
+        ]
+    assert not mock_task.delay.call_count
+
+
+
+def test_schedule_one_redis_call(redis, debounce):
+    """Scheduling any number of profiles takes one Redis call."""
+    with mock.patch(TASK):
+        with utils.assert_num_calls(redis, 1):
+            schedule.schedule([1, 2, 3])
+
+
+
+def test_arm_expires(redis):
+    """Armed marks lapse after given expiry."""
+    with mock.patch('portfoliyo.redis.time.time') as mock_time:
+        mock_time.return_value = 5
+        assert schedule.arm([1], 10) == [1]
+        assert schedule.arm([1], 10) == []
+        mock_time.return_value = 16
+
+        assert schedule.arm([1], 10) == [1]
+
+
+
+def test_disarm(redis, debounce):
+    """A disarmed profile's next trigger schedules a new send."""
+    with mock.patch(TASK) as mock_task:
+        schedule.schedule([1, 2])
+        schedule.disarm([1])
+        schedule.schedule([1, 2])
+
+    assert mock_task.apply_async.call_args_list == [
+        mock.call(([1, 2],), countdown=60),
+        mock.call(([1],), countdown=60),
+        ]
+
+
+
+def test_send_notification_emails_disarms(redis, debounce):
+    """Sending notification emails disarms those profiles' sends."""
+    schedule.arm([1, 2], 60)
+    with mock.patch('portfoliyo.notifications.render.send'):
+        tasks.send_notification_emails([1])
+
+    assert schedule.arm([1, 2], 60) == [1]
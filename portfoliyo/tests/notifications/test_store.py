@@ -1,8 +1,12 @@
 """Tests for notification storage/retrieval."""
+import time
+
 from django.conf import settings
 import mock
 
 from portfoliyo.notifications import store
+from portfoliyo.redis import scan
+from portfoliyo.tests import utils
 
 
 
@@ -17,6 +21,69 @@ def test_pending_profile_ids(redis):
 
 
 
+def test_scan_pending_profile_ids(redis):
+    """Scanning pending profile IDs step by step covers all of them."""
+    for profile_id in range(1, 8):
+        store.store(profile_id, 'some', triggering=True)
+    store.store(8, 'thing', triggering=False)
+    seen = []
+    cursor, profile_ids = store.scan_pending_profile_ids(count=3)
+    seen.extend(profile_ids)
+    while cursor:
+        cursor, profile_ids = store.scan_pending_profile_ids(cursor, 3)
+        seen.extend(profile_ids)
+
+    assert sorted(set(seen)) == range(1, 8)
+
+
+
+def test_store_one_redis_call(redis):
+    """Storing a notification takes a single call to Redis."""
+    with utils.assert_num_calls(redis, 1):
+        store.store(1, 'some', triggering=True, data={'foo': 'bar'})
+
+    assert list(store.get_all(1)) == [
+        {'name': 'some', 'triggering': '1', 'foo': 'bar'}]
+    assert store.pending_profile_ids() == {'1'}
+
+
+
+def test_store_compact(redis):
+    """A profile's notifications take a fixed number of keys."""
+    for i in range(5):
+        store.store(1, 'some', triggering=True, data={'post-id': i})
+
+    cursor, keys = scan(count=100)
+    assert not cursor
+    assert sorted(keys) == [
+        store.PENDING_PROFILES_KEY,
+        store.make_data_key(1),
+        store.NEXT_NOTIFICATION_ID_KEY_PATTERN % 1,
+        store.make_pending_notifications_key(1),
+        ]
+    assert [n['post-id'] for n in store.get_all(1)] == [
+        '0', '1', '2', '3', '4']
+
+
+
+def test_store_many(redis):
+    """Stores many notifications for many profiles in one Redis call."""
+    with utils.assert_num_calls(redis, 1):
+        store.store_many([
+            (1, 'some', False, {'foo': 'bar'}),
+            (2, 'other', True, None),
+            (1, 'more', True, {'baz': 'quux'}),
+            ])
+
+    assert list(store.get_all(1)) == [
+        {'name': 'some', 'triggering': '0', 'foo': 'bar'},
+        {'name': 'more', 'triggering': '1', 'baz': 'quux'},
+        ]
+    assert list(store.get_all(2)) == [{'name': 'other', 'triggering': '1'}]
+    assert store.pending_profile_ids() == {'1', '2'}
+
+
+
 def test_get_all(redis):
     """Gets all data from all pending notifications."""
     store.store(1, 'some', data={'foo': 'bar'})
@@ -36,6 +103,16 @@ def test_get_all(redis):
 
 
 
+def test_get_all_two_redis_calls(redis):
+    """Fetching any number of notifications takes two calls to Redis."""
+    for i in range(5):
+        store.store(1, 'some')
+
+    with utils.assert_num_calls(redis, 2):
+        assert len(list(store.get_all(1))) == 5
+
+
+
 def test_get_all_clear(redis):
     """Can also clear all pending notifications."""
     store.store(1, 'some', data={'foo': 'bar'})
@@ -55,6 +132,144 @@ def test_get_all_clear(redis):
 
 
 
+def test_trim_expired(redis):
+    """Removes expired notifications from all profiles' pending lists."""
+    initial_time = 123456.789
+    later_time = initial_time + 60
+    expired_time = initial_time + settings.NOTIFICATION_EXPIRY_SECONDS + 30
+
+    with mock.patch('portfoliyo.notifications.store.time.time') as mock_time:
+        mock_time.return_value = initial_time
+        store.store(1, 'some')
+        store.store(2, 'other')
+        mock_time.return_value = later_time
+        store.store(1, 'more')
+        mock_time.return_value = expired_time
+
+        removed = 0
+        cursor = 0
+        while True:
+            cursor, step_removed = store.trim_expired(cursor, 1)
+            removed += step_removed
+            if not cursor:
+                break
+
+    def pending(profile_id):
+        return redis.zrangebyscore(
+            store.make_pending_notifications_key(profile_id), '-inf', '+inf')
+
+    assert removed == 2
+    assert len(pending(1)) == 1
+    assert pending(2) == []
+    assert len(redis.hgetall(store.make_data_key(1))) == 1
+    assert redis.hgetall(store.make_data_key(2)) == {}
+
+
+
+def test_get_all_clear_removes_data(redis):
+    """Clearing notifications also removes their data."""
+    store.store(1, 'some', data={'foo': 'bar'})
+
+    list(store.get_all(1, clear=True))
+
+    assert redis.hgetall(store.make_data_key(1)) == {}
+
+
+
+def test_get_all_clear_removes_expired_data(redis):
+    """Clearing notifications also removes expired notifications' data."""
+    initial_time = 123456.789
+    expired_time = initial_time + settings.NOTIFICATION_EXPIRY_SECONDS + 30
+
+    with mock.patch('portfoliyo.notifications.store.time.time') as mock_time:
+        mock_time.return_value = initial_time
+        store.store(1, 'some')
+        store.store(1, 'other')
+        mock_time.return_value = expired_time
+
+        assert list(store.get_all(1, clear=True)) == []
+
+    assert redis.hgetall(store.make_data_key(1)) == {}
+
+
+
+def store_legacy(redis, profile_id, data):
+    """Store a notification in the legacy (hash per notification) layout."""
+    expiry = int(time.time()) + settings.NOTIFICATION_EXPIRY_SECONDS
+    notification_id = redis.incr(
+        store.NEXT_NOTIFICATION_ID_KEY_PATTERN % profile_id)
+    redis.zadd(
+        store.make_pending_notifications_key(profile_id),
+        expiry,
+        notification_id,
+        )
+    key = store.make_notification_key(profile_id, notification_id)
+    redis.hmset(key, data)
+    redis.expireat(key, expiry + 60)
+    return notification_id
+
+
+
+def test_get_all_legacy(redis):
+    """Notifications stored in the legacy layout are still read."""
+    store_legacy(redis, 1, {'name': 'old', 'triggering': '0'})
+    store.store(1, 'new')
+
+    assert list(store.get_all(1)) == [
+        {'name': 'old', 'triggering': '0'},
+        {'name': 'new', 'triggering': '0'},
+        ]
+
+
+
+def test_get_legacy(redis):
+    """A notification stored in the legacy layout can be got by id."""
+    notification_id = store_legacy(
+        redis, 1, {'name': 'old', 'triggering': '0'})
+
+    assert store.get(1, notification_id) == {
+        'name': 'old', 'triggering': '0'}
+
+
+
+def test_migrate_legacy(redis):
+    """Moves legacy notifications into the compact layout."""
+    notification_id = store_legacy(
+        redis, 1, {'name': 'old', 'triggering': '0'})
+    store.store(1, 'new')
+    legacy_key = store.make_notification_key(1, notification_id)
+
+    moved = 0
+    cursor = 0
+    while True:
+        cursor, step_moved = store.migrate_legacy(cursor, 10)
+        moved += step_moved
+        if not cursor:
+            break
+
+    assert moved == 1
+    assert redis.hgetall(legacy_key) == {}
+    assert 0 < redis.ttl(store.make_data_key(1))
+    assert list(store.get_all(1)) == [
+        {'name': 'old', 'triggering': '0'},
+        {'name': 'new', 'triggering': '0'},
+        ]
+
+
+
+def test_migrate_legacy_never_shortens_expiry(redis):
+    """Migrating a shorter-lived notification keeps the data hash's expiry."""
+    notification_id = store_legacy(
+        redis, 1, {'name': 'old', 'triggering': '0'})
+    redis.expire(store.make_notification_key(1, notification_id), 10)
+    store.store(1, 'new')
+
+    store.migrate_legacy(0, 10)
+
+    assert redis.ttl(store.make_data_key(1)) > 10
+
+
+
 def test_get_all_excludes_expired(redis):
     """Does not return expired notifications."""
     initial_time = 123456.789
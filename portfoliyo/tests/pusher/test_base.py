@@ -2,8 +2,10 @@
 from django.test.utils import override_settings
 
 import mock
+import pytest
 
 from portfoliyo import pusher
+from portfoliyo.pusher import base
 
 
 
@@ -20,3 +22,67 @@ def test_get_pusher(mock_Pusher):
 def test_get_pusher_none():
     """If settings are not configured, return None."""
     assert pusher.get_pusher() is None
+
+
+
+def test_send_event_not_configured():
+    """If settings are not configured, send nothing and return False."""
+    assert not pusher.send_event(['private-user_1'], 'event', {})
+
+
+
+def test_send_event_too_many_channels(pusher_server):
+    """Can't send one event to more channels than Pusher allows."""
+    channels = ['private-user_%s' % i for i in range(11)]
+    with pytest.raises(ValueError):
+        pusher.send_event(channels, 'event', {})
+
+    assert pusher_server.requests == []
+
+
+
+@mock.patch('portfoliyo.pusher.base.time.time', lambda: 1353088179)
+def test_sign_query():
+    """Signs query string as documented in the Pusher REST API docs."""
+    config = {
+        'key': '278d425bdf160c739803',
+        'secret': '7ad3773142a6692b25b8',
+        }
+    body = (
+        '{"name":"foo","channels":["project-3"],'
+        '"data":"{\\"some\\":\\"data\\"}"}'
+        )
+
+    query = base.sign_query(config, 'POST', '/apps/3/events', body)
+
+    assert query == (
+        'auth_key=278d425bdf160c739803&auth_timestamp=1353088179'
+        '&auth_version=1.0&body_md5=ec365a775a4cd0599faeb73354201b6f'
+        '&auth_signature='
+        'da454824c97ba181a32ccc17a72625ba02771f50b50e1e7430e47a1f3f457e6c'
+        )
+
+
+
+def test_get_client_none():
+    """If settings are not configured, there is no client."""
+    assert pusher.get_client() is None
+
+
+
+def test_get_client_shared(pusher_server):
+    """The same client is returned for every call in a process."""
+    assert pusher.get_client() is pusher.get_client()
+
+
+
+def test_client_reuses_connection(pusher_server):
+    """Sequential events are all sent over a single kept-alive connection."""
+    client = base.Client(base.get_config())
+    for i in range(5):
+        client.send_event(['private-user_1'], 'event', {'i': i})
+
+    assert client.requests_sent == 5
+    assert client.connections_opened == 1
+    assert pusher_server.connections == 1
+    assert len(pusher_server.requests) == 5
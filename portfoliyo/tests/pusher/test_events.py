@@ -1,4 +1,6 @@
 """Test pusher events."""
+import json
+
 from django.core.urlresolvers import reverse
 import mock
 
@@ -6,6 +8,18 @@ from portfoliyo.pusher import events
 from portfoliyo.tests import factories
 
 
+
+def sent_events(mock_send_event):
+    """Map channel names to lists of (event, data) sent via ``send_event``."""
+    sent = {}
+    for call in mock_send_event.call_args_list:
+        channels, event, data = call[0]
+        for channel in channels:
+            sent.setdefault(channel, []).append((event, data))
+    return sent
+
+
+
 def test_posted_event(db):
     """Pusher event for a post."""
     author_rel = factories.RelationshipFactory.create(
@@ -15,39 +29,166 @@ def test_posted_event(db):
     p = factories.PostFactory.create(
         author=author_rel.elder, student=author_rel.student)
 
-    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        author_channel = mock.Mock()
-        other_channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % author_rel.elder.id: author_channel,
-            'private-user_%s' % other_rel.elder.id: other_channel,
-            }
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
         events.posted_event(p, extra='foo')
 
-    author_args = author_channel.trigger.call_args[0]
-    other_args = other_channel.trigger.call_args[0]
-    assert author_args[0] == other_args[0] == 'message_posted'
-    author_data = author_args[1]['objects'][0]
-    other_data = other_args[1]['objects'][0]
+    sent = sent_events(mock_send_event)
+    [(author_event, author_data)] = sent[
+        'private-user_%s' % author_rel.elder.id]
+    [(other_event, other_data)] = sent['private-user_%s' % other_rel.elder.id]
+    assert author_event == other_event == 'message_posted'
+    author_data = author_data['objects'][0]
+    other_data = other_data['objects'][0]
     assert author_data['extra'] == other_data['extra'] == 'foo'
     assert author_data['mine']
     assert not other_data['mine']
 
 
+def test_posted_event_batches_channels(db):
+    """Non-author teachers all receive the same event in one API request."""
+    rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True)
+    for i in range(3):
+        factories.RelationshipFactory.create(
+            from_profile__school_staff=True, to_profile=rel.student)
+    p = factories.PostFactory.create(author=rel.elder, student=rel.student)
+
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.posted_event(p)
+
+    # one request for the author, one for the other three teachers
+    assert sorted(len(c[0][0]) for c in mock_send_event.call_args_list) == [
+        1, 3]
+
+
+def test_bulk_posted(db):
+    """Each teacher gets one event with bulk post and their own sub-posts."""
+    author = factories.ProfileFactory.create(school_staff=True)
+    rel1 = factories.RelationshipFactory.create(from_profile=author)
+    rel2 = factories.RelationshipFactory.create(from_profile=author)
+    other_rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True, to_profile=rel2.student)
+    bulk = factories.BulkPostFactory.create(author=author, group=None)
+    sub1 = factories.PostFactory.create(
+        author=author, student=rel1.student, from_bulk=bulk)
+    sub2 = factories.PostFactory.create(
+        author=author, student=rel2.student, from_bulk=bulk)
+
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.bulk_posted(bulk.id, author_sequence_id='5')
+
+    sent = sent_events(mock_send_event)
+    assert set(sent) == {
+        'private-user_%s' % author.id, 'private-user_%s' % other_rel.elder.id}
+    [(_, author_data)] = sent['private-user_%s' % author.id]
+    [(_, other_data)] = sent['private-user_%s' % other_rel.elder.id]
+    author_objects = author_data['objects']
+    other_objects = other_data['objects']
+    assert {o['post_id'] for o in author_objects} == {
+        sub1.id, sub2.id, bulk.id}
+    assert all(o['mine'] for o in author_objects)
+    # other teacher is in sub2's village only, but sees the group bulk post
+    assert [o['post_id'] for o in other_objects] == [sub2.id, bulk.id]
+    assert not any(o['mine'] for o in other_objects)
+    assert other_objects[0]['author_sequence_id'] == '5'
+    assert other_objects[0]['mark_read_url'] == reverse(
+        'mark_post_read', kwargs={'post_id': sub2.id})
+
+
+
+def test_bulk_posted_splits_large_events(db):
+    """Sub-posts for one teacher are split across events to limit size."""
+    author = factories.ProfileFactory.create(school_staff=True)
+    bulk = factories.BulkPostFactory.create(author=author, group=None)
+    for i in range(3):
+        rel = factories.RelationshipFactory.create(from_profile=author)
+        factories.PostFactory.create(
+            author=author, student=rel.student, from_bulk=bulk)
+
+    with mock.patch('portfoliyo.pusher.events.MAX_OBJECTS_PER_EVENT', 2):
+        with mock.patch(
+                'portfoliyo.pusher.events.send_event') as mock_send_event:
+            events.bulk_posted(bulk.id)
+
+    assert [
+        len(c[0][2]['objects']) for c in mock_send_event.call_args_list
+        ] == [2, 2]
+
+
+
+def test_bulk_posted_splits_events_by_size(db):
+    """Long sub-posts are split across events to stay within Pusher's limit."""
+    author = factories.ProfileFactory.create(school_staff=True)
+    bulk = factories.BulkPostFactory.create(author=author, group=None)
+    for i in range(5):
+        rel = factories.RelationshipFactory.create(from_profile=author)
+        factories.PostFactory.create(
+            author=author,
+            student=rel.student,
+            from_bulk=bulk,
+            html_text='x' * 3000,
+            )
+
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.bulk_posted(bulk.id)
+
+    data = [c[0][2] for c in mock_send_event.call_args_list]
+    assert sum(len(d['objects']) for d in data) == 6
+    assert len(data) > 1
+    assert all(len(json.dumps(d)) <= events.MAX_EVENT_BYTES for d in data)
+
+
+
+def test_batch_objects():
+    """Batches are limited by both object count and serialized size."""
+    small = {'text': 'x'}
+    large = {'text': 'x' * (events.MAX_EVENT_BYTES // 2)}
+
+    batches = events.batch_objects([small] * 12 + [large] * 3)
+
+    assert [len(b) for b in batches] == [10, 3, 1, 1]
+
+
+
+def test_posted_many(db):
+    """Each teacher gets one event with the posts in their own villages."""
+    parent = factories.ProfileFactory.create()
+    rel1 = factories.RelationshipFactory.create(from_profile=parent)
+    rel2 = factories.RelationshipFactory.create(from_profile=parent)
+    teacher1 = factories.RelationshipFactory.create(
+        from_profile__school_staff=True, to_profile=rel1.student).elder
+    teacher2 = factories.RelationshipFactory.create(
+        from_profile__school_staff=True, to_profile=rel2.student).elder
+    post1 = factories.PostFactory.create(author=parent, student=rel1.student)
+    post2 = factories.PostFactory.create(author=parent, student=rel2.student)
+
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.posted_many([post1.id, post2.id], author_sequence_id='5')
+
+    sent = sent_events(mock_send_event)
+    assert set(sent) == {
+        'private-user_%s' % teacher1.id, 'private-user_%s' % teacher2.id}
+    [(_, data1)] = sent['private-user_%s' % teacher1.id]
+    [(_, data2)] = sent['private-user_%s' % teacher2.id]
+    assert [o['post_id'] for o in data1['objects']] == [post1.id]
+    assert [o['post_id'] for o in data2['objects']] == [post2.id]
+    assert data1['objects'][0]['author_sequence_id'] == '5'
+    assert data1['objects'][0]['mark_read_url'] == reverse(
+        'mark_post_read', kwargs={'post_id': post1.id})
+
+
+
 def test_student_event(db):
     """Pusher event for adding/editing/removing a student."""
     rel = factories.RelationshipFactory.create()
-    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % rel.elder.id: channel,
-            }
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
         events.student_event('some_event', rel.student.id, [rel.elder.id])
 
-    args = channel.trigger.call_args[0]
-    assert args[0] == 'some_event'
-    assert len(args[1]['objects']) == 1
-    data = args[1]['objects'][0]
+    channels, event, event_data = mock_send_event.call_args[0]
+    assert channels == ['private-user_%s' % rel.elder.id]
+    assert event == 'some_event'
+    assert len(event_data['objects']) == 1
+    data = event_data['objects'][0]
     assert data['name'] == rel.student.name
     assert data['id'] == rel.student.id
     assert data['resource_uri'] == reverse(
@@ -62,20 +203,30 @@ def test_student_event(db):
 
 
 
+def test_student_event_batches_channels(db):
+    """Student event goes to all elders in one API request."""
+    rel = factories.RelationshipFactory.create()
+    rel2 = factories.RelationshipFactory.create(to_profile=rel.student)
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.student_event('some_event', rel.student.id, full_data=False)
+
+    assert mock_send_event.call_count == 1
+    assert set(mock_send_event.call_args[0][0]) == {
+        'private-user_%s' % rel.elder.id, 'private-user_%s' % rel2.elder.id}
+
+
+
 def test_group_event(db):
     """Pusher event for adding/editing/removing a group."""
     group = factories.GroupFactory.create()
-    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % group.owner.id: channel,
-            }
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
         events.group_event('some_event', group.id, group.owner.id)
 
-    args = channel.trigger.call_args[0]
-    assert args[0] == 'some_event'
-    assert len(args[1]['objects']) == 1
-    data = args[1]['objects'][0]
+    channels, event, event_data = mock_send_event.call_args[0]
+    assert channels == ['private-user_%s' % group.owner.id]
+    assert event == 'some_event'
+    assert len(event_data['objects']) == 1
+    data = event_data['objects'][0]
     assert data['name'] == group.name
     assert data['id'] == group.id
     assert data['resource_uri'] == reverse(
@@ -85,6 +236,33 @@ def test_group_event(db):
         )
 
 
+def test_trigger_many_splits_channels():
+    """Channels beyond the per-request limit are sent in further requests."""
+    channels = ['user_%s' % i for i in range(25)]
+    with mock.patch('portfoliyo.pusher.events.send_event') as mock_send_event:
+        events.trigger_many(channels, 'event', {})
+
+    assert [len(c[0][0]) for c in mock_send_event.call_args_list] == [
+        10, 10, 5]
+
+
+def test_trigger_many_local_server(pusher_server):
+    """Batched triggers reach a (local stand-in) Pusher API."""
+    channels = ['user_%s' % i for i in range(12)]
+
+    events.trigger_many(channels, 'some_event', {'objects': []})
+
+    assert len(pusher_server.requests) == 2
+    path, body = pusher_server.requests[0]
+    assert path.startswith('/apps/app/events?auth_key=key&')
+    assert 'auth_signature=' in path
+    assert body['name'] == 'some_event'
+    assert body['channels'] == ['private-%s' % c for c in channels[:10]]
+    assert json.loads(body['data']) == {'objects': []}
+    assert pusher_server.requests[1][1]['channels'] == [
+        'private-%s' % c for c in channels[10:]]
+
+
 def test_pusher_socket_error():
     """
     A pusher socket error is logged to Sentry and then ignored.
@@ -94,11 +272,10 @@ def test_pusher_socket_error():
     """
     import socket
 
-    get_pusher_location = 'portfoliyo.pusher.events.get_pusher'
+    send_event_location = 'portfoliyo.pusher.events.send_event'
     logger_warning_location = 'portfoliyo.pusher.events.logger.warning'
-    with mock.patch(get_pusher_location) as mock_get_pusher:
-        channel = mock_get_pusher.return_value['channel']
-        channel.trigger.side_effect = socket.error('connection timed out')
+    with mock.patch(send_event_location) as mock_send_event:
+        mock_send_event.side_effect = socket.error('connection timed out')
 
         with mock.patch(logger_warning_location) as mock_logger_warning:
             events.trigger('channel', 'event', {})
@@ -110,25 +287,20 @@ def test_pusher_socket_error():
         )
 
 
-def test_pusher_bad_response():
+def test_pusher_bad_response(pusher_server):
     """
     Any exception from Pusher is ignored and logged to Sentry.
 
     Pusher is not critical enough to be worth causing an action to fail.
 
     """
-    get_pusher_location = 'portfoliyo.pusher.events.get_pusher'
+    pusher_server.status = 413
     logger_warning_location = 'portfoliyo.pusher.events.logger.warning'
-    with mock.patch(get_pusher_location) as mock_get_pusher:
-        channel = mock_get_pusher.return_value['channel']
-        channel.trigger.side_effect = Exception(
-            'Unexpected return status 413')
-
-        with mock.patch(logger_warning_location) as mock_logger_warning:
-            events.trigger('channel', 'event', {})
+    with mock.patch(logger_warning_location) as mock_logger_warning:
+        events.trigger('channel', 'event', {})
 
     mock_logger_warning.assert_called_with(
-        "Pusher exception: Unexpected return status 413",
+        "Pusher exception: Unexpected return status 413: {}",
         exc_info=True,
         extra={'stack': True},
         )
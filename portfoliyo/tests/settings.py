@@ -3,6 +3,8 @@ from portfoliyo.settings.default import *
 # settings that are always required for a successful test run
 DEFAULT_FILE_STORAGE = 'portfoliyo.tests.storage.MemoryStorage'
 NOTIFICATION_EMAILS = True
+# send notification emails right away, except in tests of debouncing
+NOTIFICATION_DEBOUNCE_SECONDS = 0
 COMPRESS_ENABLED = False
 CELERY_ALWAYS_EAGER = True
 # avoid actually calling out to Mixpanel in tests
@@ -9,3 +9,47 @@ def test_send_not_implemented():
     sms = base.SMSBackend()
     with pytest.raises(NotImplementedError):
         sms.send('1', '2', 'body')
+
+
+
+class RecordingBackend(base.SMSBackend):
+    max_threads = 4
+
+    def __init__(self):
+        self.sent = []
+        super(RecordingBackend, self).__init__()
+
+
+    def send(self, to, from_, body):
+        if body == 'fail':
+            raise ValueError(body)
+        self.sent.append((to, from_, body))
+
+
+
+def test_send_many():
+    """send_many() sends all messages, in order for each recipient."""
+    sms = RecordingBackend()
+    messages = [
+        (to, '+15555555555', str(i))
+        for to in ['1', '2', '3']
+        for i in range(5)
+        ]
+
+    assert sms.send_many(messages) == []
+    assert sorted(sms.sent) == sorted(messages)
+    for to in ['1', '2', '3']:
+        assert [m for m in sms.sent if m[0] == to] == [
+            m for m in messages if m[0] == to]
+
+
+def test_send_many_isolates_failures():
+    """A failed send is returned and doesn't prevent other sends."""
+    sms = RecordingBackend()
+    bad = ('1', '2', 'fail')
+    good = ('3', '2', 'ok')
+
+    failures = sms.send_many([bad, good])
+
+    assert [(m, info[0]) for m, info in failures] == [(bad, ValueError)]
+    assert sms.sent == [good]
@@ -1,18 +1,48 @@
 """Tests for Twilio SMS backend class."""
-from django.test.utils import override_settings
+import base64
 
-import mock
+from django.test.utils import override_settings
+import pytest
 
 from portfoliyo.sms.backends import twilio
 
 
-@override_settings(TWILIO_ACCOUNT_SID='account_sid', TWILIO_AUTH_TOKEN='token')
-@mock.patch("twilio.rest.TwilioRestClient")
-def test_send(twilio_client_class):
-    """send() method passes on its args to client send."""
+def test_send(twilio_server):
+    """send() method POSTs a message to the Twilio API."""
+    twilio_server.response_data = {'sid': 'SM1'}
+    sms = twilio.TwilioSMSBackend()
+
+    data = sms.send('1', '2', u'body \xe9')
+
+    assert data == {'sid': 'SM1'}
+    assert twilio_server.requests == [
+        (
+            '/2010-04-01/Accounts/sid/SMS/Messages.json',
+            {'To': '1', 'From': '2', 'Body': u'body \xe9'.encode('utf-8')},
+            )
+        ]
+    auth = twilio_server.request_headers[0].getheader('authorization')
+    assert auth == 'Basic %s' % base64.b64encode('sid:token')
+
+
+def test_send_error(twilio_server):
+    """An error response from Twilio raises TwilioError."""
+    twilio_server.status = 400
+    sms = twilio.TwilioSMSBackend()
+
+    with pytest.raises(twilio.TwilioError):
+        sms.send('1', '2', 'body')
+
+
+@override_settings(TWILIO_SENDS_PER_SECOND=None, TWILIO_SEND_THREADS=3)
+def test_send_many(twilio_server):
+    """send_many() sends concurrently over a few keep-alive connections."""
     sms = twilio.TwilioSMSBackend()
-    twilio_client_class.assert_called_with('account_sid', 'token')
+    messages = [(str(i), '2', 'body') for i in range(30)]
+
+    failures = sms.send_many(messages)
 
-    sms.send('1', '2', 'body')
-    sms.client.sms.messages.create.assert_called_with(
-        to='1', from_='2', body='body')
+    assert failures == []
+    assert sorted(data['To'] for path, data in twilio_server.requests) == (
+        sorted(to for to, from_, body in messages))
+    assert twilio_server.connections <= 3
@@ -16,3 +16,20 @@ def test_split_sms():
         phone, source_phone, ('a' * 157) + '...')
     mock_send.assert_any_call(
         phone, source_phone, '...' + ('a' * 4))
+
+
+def test_send_many_splits():
+    """send_many() splits long messages and passes all to backend."""
+    longtext = 'a' * 161
+    with mock.patch('portfoliyo.sms.base.backend') as mock_backend:
+        mock_backend.send_many.return_value = []
+        failures = sms.send_many([('+1', '+2', longtext), ('+3', '+2', 'hi')])
+
+    assert failures == []
+    mock_backend.send_many.assert_called_with(
+        [
+            ('+1', '+2', ('a' * 157) + '...'),
+            ('+1', '+2', '...' + ('a' * 4)),
+            ('+3', '+2', 'hi'),
+            ]
+        )
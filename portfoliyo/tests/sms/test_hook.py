@@ -5,6 +5,7 @@ from datetime import datetime
 from django.conf import settings
 from django.utils.timezone import get_current_timezone
 import mock
+import pytest
 
 from portfoliyo import model
 from portfoliyo.sms import hook
@@ -12,6 +13,16 @@ from portfoliyo.sms import hook
 from portfoliyo.tests import factories, utils
 
 
+CREATE = 'portfoliyo.sms.hook.model.Post.create'
+CREATE_MANY = 'portfoliyo.sms.hook.model.Post.create_many'
+
+
+@pytest.fixture(autouse=True)
+def _redis(redis):
+    """Signup-code lookups use Redis."""
+    return redis
+
+
 def test_create_post(db):
     """Creates Post (and no reply) if one associated student."""
     phone = '+13216430987'
@@ -21,12 +32,12 @@ def test_create_post(db):
     factories.RelationshipFactory.create(
         from_profile__school_staff=True, to_profile=rel.student)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
     assert reply is None
-    mock_create.assert_called_once_with(
-        profile, rel.student, 'foo', from_sms=True)
+    mock_create_many.assert_called_once_with(
+        profile, [rel.student], 'foo', from_sms=True)
 
 
 
@@ -44,14 +55,14 @@ def test_activate_user(db):
         to_profile=rel.student,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
     profile = utils.refresh(profile)
     assert profile.user.is_active
     assert not profile.declined
-    mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
     assert reply == (
         "You can text this number "
         "to talk with Ms. Johns."
@@ -66,7 +77,7 @@ def test_decline(db):
         user__is_active=False, phone=phone)
     rel = factories.RelationshipFactory.create(from_profile=profile)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'stop')
 
     assert not utils.refresh(profile.user).is_active
@@ -75,9 +86,10 @@ def test_decline(db):
         "No problem! Sorry to have bothered you. "
         "Text this number anytime to re-start."
         )
-    mock_create.assert_any_call(profile, rel.student, "stop", from_sms=True)
-    mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        profile, [rel.student], "stop", from_sms=True)
+    mock_create_many.assert_any_call(
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
 
 
 
@@ -88,7 +100,7 @@ def test_active_user_decline(db):
         user__is_active=True, phone=phone)
     rel = factories.RelationshipFactory.create(from_profile=profile)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'stop')
 
     assert not utils.refresh(profile.user).is_active
@@ -97,9 +109,10 @@ def test_active_user_decline(db):
         "No problem! Sorry to have bothered you. "
         "Text this number anytime to re-start."
         )
-    mock_create.assert_any_call(profile, rel.student, "stop", from_sms=True)
-    mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        profile, [rel.student], "stop", from_sms=True)
+    mock_create_many.assert_any_call(
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
 
 
 
@@ -125,11 +138,13 @@ def test_multiple_students(db):
     factories.RelationshipFactory.create(
         from_profile__school_staff=True, to_profile=rel1.student)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
-    mock_create.assert_any_call(profile, rel1.student, 'foo', from_sms=True)
-    mock_create.assert_any_call(profile, rel2.student, 'foo', from_sms=True)
+    mock_create_many.assert_called_once_with(
+        profile, mock.ANY, 'foo', from_sms=True)
+    students = mock_create_many.call_args[0][1]
+    assert set(students) == {rel1.student, rel2.student}
     assert reply is None
 
 
@@ -170,7 +185,7 @@ def test_code_signup(db):
     teacher = factories.ProfileFactory.create(
         school_staff=True, name="Teacher Jane", code="ABCDEF", country_code='ca')
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE) as mock_create:
         with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
             reply = hook.receive_sms(phone, source_phone, "abcdef")
 
@@ -197,7 +212,7 @@ def test_code_signup_with_language(db):
     factories.ProfileFactory.create(
         school_staff=True, name="Teacher Joe", code="ABCDEF")
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "abcdef ES")
 
     assert reply == (
@@ -213,7 +228,7 @@ def test_group_code_signup(db):
     group = factories.GroupFactory.create(
         owner__school_staff=True, owner__name="Teacher Jane", code="ABCDEFG")
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE) as mock_create:
         with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "abcdefg")
 
@@ -246,10 +261,13 @@ def test_code_signup_student_name(db):
         teacher=teacher,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
-        with mock.patch(
-                'portfoliyo.pusher.events.student_added') as mock_student_added:
-            reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
+    with mock.patch(CREATE) as mock_create:
+        with mock.patch(CREATE_MANY) as mock_create_many:
+            with mock.patch(
+                    'portfoliyo.pusher.events.student_added'
+                    ) as mock_student_added:
+                reply = hook.receive_sms(
+                    phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
 
     assert reply == (
         "And what is your relationship to that child "
@@ -273,8 +291,8 @@ def test_code_signup_student_name(db):
     mock_create.assert_any_call(
         parent, student, "Jimmy Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
-    mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_student_name_strips_extra_lines(db):
@@ -290,7 +308,7 @@ def test_code_signup_student_name_strips_extra_lines(db):
         teacher=teacher,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE) as mock_create, mock.patch(CREATE_MANY):
         hook.receive_sms(
             phone, settings.DEFAULT_NUMBER, "Jimmy Doe\nLook at me!")
 
@@ -320,7 +338,7 @@ def test_unusually_long_student_name_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -342,10 +360,13 @@ def test_group_code_signup_student_name(db):
         state=model.TextSignup.STATE.kidname,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
-        with mock.patch(
-                'portfoliyo.pusher.events.student_added') as mock_student_added:
-            reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
+    with mock.patch(CREATE) as mock_create:
+        with mock.patch(CREATE_MANY) as mock_create_many:
+            with mock.patch(
+                    'portfoliyo.pusher.events.student_added'
+                    ) as mock_student_added:
+                reply = hook.receive_sms(
+                    phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
 
     assert reply == (
         "And what is your relationship to that child "
@@ -370,8 +391,8 @@ def test_group_code_signup_student_name(db):
     mock_create.assert_any_call(
         parent, student, "Jimmy Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
-    mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_student_name_dupe_detection(db):
@@ -388,7 +409,7 @@ def test_code_signup_student_name_dupe_detection(db):
         state=model.TextSignup.STATE.kidname,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
 
     assert reply == (
@@ -426,7 +447,7 @@ def test_code_signup_role(db):
         state=model.TextSignup.STATE.relationship,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch(CREATE_MANY) as mock_create_many:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "father")
 
     assert reply == (
@@ -439,11 +460,11 @@ def test_code_signup_role(db):
     assert parent_rel.description == "father"
     student = teacher_rel.student
     # and the role is sent on to the village chat as a post
-    mock_create.assert_any_call(
-        parent, student, "father", from_sms=True, notifications=False)
+    mock_create_many.assert_any_call(
+        parent, [student], "father", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
-    mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_role_strips_extra_lines(db):
@@ -469,7 +490,7 @@ def test_code_signup_role_strips_extra_lines(db):
         state=model.TextSignup.STATE.relationship,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         hook.receive_sms(phone, settings.DEFAULT_NUMBER, "father\nI'm a sig!")
 
     parent = model.Profile.objects.get(phone=phone)
@@ -500,7 +521,7 @@ def test_unusually_long_role_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -532,7 +553,7 @@ def test_code_signup_name(db):
 
     record_notification_path = 'portfoliyo.tasks.record_notification.delay'
     with mock.patch(record_notification_path) as mock_record_notification:
-        with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+        with mock.patch(CREATE_MANY) as mock_create_many:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "John Doe")
 
     assert reply == (
@@ -544,11 +565,11 @@ def test_code_signup_name(db):
     assert parent.name == "John Doe"
     assert signup.state == model.TextSignup.STATE.done
     student = teacher_rel.student
-    mock_create.assert_any_call(
-        parent, student, "John Doe", from_sms=True, notifications=False)
+    mock_create_many.assert_any_call(
+        parent, [student], "John Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
-    mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+    mock_create_many.assert_any_call(
+        None, [student], reply, in_reply_to=phone, notifications=False)
     mock_record_notification.assert_called_with('new_parent', teacher_rel.elder, signup)
 
 
@@ -574,7 +595,7 @@ def test_code_signup_name_strips_extra_lines(db):
         state=model.TextSignup.STATE.name,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         hook.receive_sms(
             phone, settings.DEFAULT_NUMBER, "\n John Doe\nI'm a sig too!")
 
@@ -605,7 +626,7 @@ def test_unusually_long_parent_name_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -632,8 +653,9 @@ def test_subsequent_signup(db):
     with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
         with mock.patch(rn_tgt) as mock_record_notification:
             with mock.patch(create_tgt) as mock_create:
-                reply = hook.receive_sms(
-                    phone, settings.DEFAULT_NUMBER, 'ABCDEF')
+                with mock.patch(create_tgt + '_many') as mock_create_many:
+                    reply = hook.receive_sms(
+                        phone, settings.DEFAULT_NUMBER, 'ABCDEF')
 
     assert reply == (
         "Ok, thanks! You can text Ms. Doe at this number too.")
@@ -644,16 +666,15 @@ def test_subsequent_signup(db):
     assert new_signup.group is None
     assert signup.student in other_teacher.students
     # both incoming text and reply are recorded in village
-    assert mock_create.call_count == 2
-    mock_create.assert_any_call(
+    mock_create.assert_called_once_with(
         signup.family,
         signup.student,
         "ABCDEF",
         from_sms=True,
         )
-    mock_create.assert_any_call(
+    mock_create_many.assert_called_once_with(
         None,
-        signup.student,
+        [signup.student],
         reply,
         in_reply_to=u'+13216430987',
         notifications=False,
@@ -683,7 +704,7 @@ def test_subsequent_signup_with_language(db):
     factories.ProfileFactory.create(
         code='ABCDEF', name='Ms. Doe')
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch(CREATE), mock.patch(CREATE_MANY):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'ABCDEF Es')
 
     profile = utils.refresh(signup.family)
@@ -907,6 +928,56 @@ def test_bogus_signup_state_no_blowup(db):
 
 
 
+def test_reply_query_budget(db):
+    """An ordinary reply from a parent needs only three queries."""
+    phone = '+13216430987'
+    parent = factories.ProfileFactory.create(phone=phone)
+    for i in range(2):
+        rel = factories.RelationshipFactory.create(from_profile=parent)
+        factories.RelationshipFactory.create(
+            to_profile=rel.student, from_profile__school_staff=True)
+    model.codes.rebuild()
+
+    with mock.patch(CREATE_MANY) as mock_create_many:
+        with utils.assert_num_queries(3):
+            reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Hello")
+
+    assert reply is None
+    assert mock_create_many.call_count == 1
+
+
+
+class TestSenderContext(object):
+    def test_load(self, db):
+        """Loads sender's profile, students, teachers and active signup."""
+        phone = '+13216430987'
+        rel = factories.RelationshipFactory.create(
+            from_profile__phone=phone, to_profile__name="Jimmy")
+        teacher_rel = factories.RelationshipFactory.create(
+            to_profile=rel.student, from_profile__school_staff=True)
+        factories.RelationshipFactory.create(to_profile=rel.student)
+        factories.TextSignupFactory.create(
+            family=rel.elder, state=model.TextSignup.STATE.done)
+        signup = factories.TextSignupFactory.create(
+            family=rel.elder, state=model.TextSignup.STATE.name)
+
+        with utils.assert_num_queries(3):
+            context = hook.SenderContext.load(phone)
+
+        with utils.assert_num_queries(0):
+            assert context.profile == rel.elder
+            assert context.profile.students == [rel.student]
+            assert context.teachers == [teacher_rel.elder]
+            assert context.signup == signup
+            assert context.signup.family is context.profile
+
+
+    def test_unknown(self, db):
+        """Returns None if no profile has the given phone."""
+        assert hook.SenderContext.load('+13216430987') is None
+
+
+
 class TestParseCode(object):
     def test_basic(self, db):
         """Gets teacher if text starts with teacher code."""
@@ -937,6 +1008,15 @@ class TestParseCode(object):
         assert hook.parse_code('') == (None, None, None)
 
 
+    def test_non_code_no_queries(self, db):
+        """Text that isn't a code is recognized without database queries."""
+        factories.ProfileFactory.create(school_staff=True, code='ABCDEF')
+        model.codes.rebuild()
+
+        with utils.assert_num_queries(0):
+            assert hook.parse_code("Thanks!") == (None, None, None)
+
+
     def test_lang(self, db):
         """Can specify language with teacher or group code."""
         g = factories.GroupFactory.create(
@@ -0,0 +1,74 @@
+"""Tests for queue of incoming SMS."""
+from portfoliyo.sms import inbox
+
+
+SOURCE = '+13216540987'
+
+
+def test_enqueue_peek_in_order(redis):
+    """Queued messages are taken oldest first, once done with."""
+    assert inbox.enqueue(SOURCE, '+15555555555', 'one') == 1
+    assert inbox.enqueue(SOURCE, '+15555555555', 'two') == 2
+
+    assert inbox.pending(SOURCE) == 2
+    item, to, body = inbox.peek(SOURCE)
+    assert (to, body) == ('+15555555555', 'one')
+    # not removed until done
+    assert inbox.peek(SOURCE) == (item, to, body)
+    assert inbox.done(SOURCE, item)
+    item, to, body = inbox.peek(SOURCE)
+    assert body == 'two'
+    assert inbox.done(SOURCE, item)
+    assert inbox.peek(SOURCE) is None
+    assert inbox.pending(SOURCE) == 0
+
+
+def test_done_already_removed(redis):
+    """An item no longer at the head of the queue isn't removed again."""
+    inbox.enqueue(SOURCE, '+15555555555', 'one')
+    inbox.enqueue(SOURCE, '+15555555555', 'two')
+    item = inbox.peek(SOURCE)[0]
+    assert inbox.done(SOURCE, item)
+
+    assert not inbox.done(SOURCE, item)
+    assert not inbox.fail(SOURCE, item)
+    assert inbox.pending(SOURCE) == 1
+
+
+def test_fail(redis):
+    """A failed item is moved to the dead-letter list."""
+    inbox.enqueue(SOURCE, '+15555555555', 'one')
+    item = inbox.peek(SOURCE)[0]
+
+    assert inbox.fail(SOURCE, item)
+    assert inbox.pending(SOURCE) == 0
+    assert inbox.dead_letters(SOURCE) == [('+15555555555', 'one')]
+
+
+def test_queues_per_phone(redis):
+    """Each phone number's messages are queued separately."""
+    inbox.enqueue(SOURCE, '+15555555555', 'one')
+
+    assert inbox.peek('+13216540988') is None
+    assert inbox.pending(SOURCE) == 1
+
+
+def test_lock(redis):
+    """Only one holder of a phone's processing lock at a time."""
+    token = inbox.lock(SOURCE)
+    assert token
+    assert inbox.lock(SOURCE) is None
+    assert inbox.lock('+13216540988')
+    inbox.unlock(SOURCE, 'stale')
+    assert inbox.lock(SOURCE) is None
+    inbox.unlock(SOURCE, token)
+    assert inbox.lock(SOURCE)
+
+
+def test_renew(redis):
+    """Only the holder of a phone's processing lock can renew it."""
+    token = inbox.lock(SOURCE)
+    assert inbox.renew(SOURCE, token)
+    assert not inbox.renew(SOURCE, 'stale')
+    inbox.unlock(SOURCE, token)
+    assert not inbox.renew(SOURCE, token)
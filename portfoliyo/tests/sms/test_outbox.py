@@ -0,0 +1,126 @@
+"""Tests for outbound SMS scheduling."""
+import mock
+
+from portfoliyo.sms import outbox
+from portfoliyo.tests import utils
+
+
+SOURCE = '+15555555555'
+
+
+def test_enqueue_returns_sources(redis):
+    """enqueue() returns the source numbers messages were queued for."""
+    sources = outbox.enqueue(
+        [('+13216540987', '+15555555555'), ('+13216540988', '+15555555556')],
+        'hello',
+        )
+
+    assert sorted(sources) == ['+15555555555', '+15555555556']
+
+
+def test_enqueue_nothing(redis):
+    """enqueue() with no recipients makes no Redis calls."""
+    assert outbox.enqueue([], 'hello') == []
+    assert redis.num_calls == 0
+
+
+def test_pop_round_robin(redis):
+    """Senders within a lane are served round-robin."""
+    outbox.enqueue([('1', SOURCE), ('2', SOURCE), ('3', SOURCE)], 'a', 1)
+    outbox.enqueue([('4', SOURCE)], 'b', 2)
+    outbox.enqueue([('5', SOURCE)], 'c', 3)
+
+    messages = outbox.pop(SOURCE, 10)
+
+    assert [m[0] for m in messages] == ['1', '4', '5', '2', '3']
+    assert messages[0] == ('1', SOURCE, 'a')
+
+
+def test_pop_priority_lane_first(redis):
+    """All priority messages are served before any bulk messages."""
+    outbox.enqueue([('1', SOURCE), ('2', SOURCE)], 'bulk', 1, outbox.BULK)
+    outbox.enqueue([('3', SOURCE)], 'priority', 2)
+
+    assert [m[0] for m in outbox.pop(SOURCE, 2)] == ['3', '1']
+    outbox.done(SOURCE)
+    assert [m[0] for m in outbox.pop(SOURCE, 2)] == ['2']
+    outbox.done(SOURCE)
+    assert outbox.pop(SOURCE, 2) == []
+
+
+def test_pop_only_given_source(redis):
+    """Only messages from the given source number are popped."""
+    outbox.enqueue([('1', SOURCE), ('2', '+15555555556')], 'a', 1)
+
+    assert outbox.pop(SOURCE, 10) == [('1', SOURCE, 'a')]
+
+
+def test_sender_rejoins_rotation(redis):
+    """A sender whose queue was emptied rejoins at the back of rotation."""
+    outbox.enqueue([('1', SOURCE)], 'a', 1)
+    outbox.enqueue([('2', SOURCE), ('3', SOURCE)], 'b', 2)
+    assert [m[0] for m in outbox.pop(SOURCE, 2)] == ['1', '2']
+    outbox.done(SOURCE)
+
+    outbox.enqueue([('4', SOURCE)], 'a', 1)
+
+    assert [m[0] for m in outbox.pop(SOURCE, 10)] == ['3', '4']
+
+
+def test_pop_one_redis_call(redis):
+    """Taking a batch of messages is one atomic call, plus one for stats."""
+    outbox.enqueue([('1', SOURCE), ('2', SOURCE)], 'a', 1)
+    outbox.enqueue([('3', SOURCE)], 'b', 2, outbox.BULK)
+
+    with utils.assert_num_calls(redis, 2):
+        assert len(outbox.pop(SOURCE, 10)) == 3
+
+
+def test_pop_in_flight_again(redis):
+    """Messages taken but never marked done are taken again."""
+    outbox.enqueue([('1', SOURCE), ('2', SOURCE)], 'a', 1)
+    outbox.enqueue([('3', SOURCE)], 'b', 2)
+    first = outbox.pop(SOURCE, 2)
+
+    assert outbox.pop(SOURCE, 2) == first
+    assert outbox.stats()['priority']['sent'] == 2
+    outbox.done(SOURCE)
+    assert [m[0] for m in outbox.pop(SOURCE, 2)] == ['2']
+
+
+def test_pending(redis):
+    """Messages are pending until taken and marked done."""
+    assert not outbox.pending(SOURCE)
+    outbox.enqueue([('1', SOURCE)], 'a', 1, outbox.BULK)
+    assert outbox.pending(SOURCE)
+    outbox.pop(SOURCE, 10)
+    assert outbox.pending(SOURCE)
+    outbox.done(SOURCE)
+
+    assert not outbox.pending(SOURCE)
+
+
+def test_lock(redis):
+    """Only one drainer of a source number at a time."""
+    token = outbox.lock(SOURCE)
+
+    assert token
+    assert outbox.lock(SOURCE) is None
+    assert outbox.lock('+15555555556')
+    outbox.unlock(SOURCE, token)
+    assert outbox.lock(SOURCE)
+
+
+@mock.patch('portfoliyo.sms.outbox.time.time')
+def test_stats(mock_time, redis):
+    """Queue depth and mean wait time are reported per lane."""
+    mock_time.return_value = 100.0
+    outbox.enqueue([('1', SOURCE), ('2', SOURCE)], 'a', 1)
+    outbox.enqueue([('3', SOURCE)], 'b', 2, outbox.BULK)
+    mock_time.return_value = 102.0
+    outbox.pop(SOURCE, 1)
+
+    assert outbox.stats() == {
+        'priority': {'depth': 1, 'sent': 1, 'mean_wait': 2.0},
+        'bulk': {'depth': 1, 'sent': 0, 'mean_wait': 0.0},
+        }
@@ -0,0 +1,42 @@
+"""Tests for SMS throttling."""
+import mock
+
+from portfoliyo.sms import throttle
+
+
+def test_no_rate():
+    """With no rate limit, never waits."""
+    limiter = throttle.RateLimiter(None)
+    with mock.patch('portfoliyo.sms.throttle.time.sleep') as mock_sleep:
+        limiter.wait('a')
+        limiter.wait('a')
+
+    assert mock_sleep.call_count == 0
+
+
+@mock.patch('portfoliyo.sms.throttle.time.sleep')
+@mock.patch('portfoliyo.sms.throttle.time.time')
+def test_rate_per_key(mock_time, mock_sleep):
+    """Successive waits for one key are spaced out; other keys unaffected."""
+    mock_time.return_value = 100.0
+    limiter = throttle.RateLimiter(2)
+
+    limiter.wait('a')
+    limiter.wait('a')
+    limiter.wait('a')
+    limiter.wait('b')
+
+    assert [c[0][0] for c in mock_sleep.call_args_list] == [0.5, 1.0]
+
+
+@mock.patch('portfoliyo.sms.throttle.time.sleep')
+@mock.patch('portfoliyo.sms.throttle.time.time')
+def test_rate_no_wait_after_interval(mock_time, mock_sleep):
+    """No wait if the interval has already passed."""
+    limiter = throttle.RateLimiter(1)
+    mock_time.return_value = 100.0
+    limiter.wait('a')
+    mock_time.return_value = 101.5
+    limiter.wait('a')
+
+    assert mock_sleep.call_count == 0
@@ -128,3 +128,10 @@ class TestModelTask(object):
         mt = celery.ModelTask()
 
         assert mt(bad_mr) is None
+
+
+
+def test_beat_schedule_tasks_exist():
+    """Every task in the beat schedule is a registered task."""
+    for entry in celery.celery.conf.CELERYBEAT_SCHEDULE.values():
+        assert entry['task'] in celery.celery.tasks
@@ -1,5 +1,8 @@
+import smtplib
+
 from django.core import mail
 import mock
+import pytest
 
 from portfoliyo import email
 
@@ -21,3 +24,54 @@ def test_send_templated_multipart():
     assert msg.subject == 'third here'
     assert msg.body == 'first'
     assert msg.alternatives == [('second', 'text/html')]
+
+
+
+def send(to):
+    """Send a simple multipart email to ``to``."""
+    email.send_multipart('subject', 'text', '<p>html</p>', [to])
+
+
+
+class TestSharedConnection(object):
+    def test_one_connection(self, smtp_server):
+        """All emails in a shared_connection block use one SMTP connection."""
+        with email.shared_connection():
+            send('one@example.com')
+            send('two@example.com')
+
+        assert smtp_server.connections == 1
+        assert [m[1] for m in smtp_server.messages] == [
+            ['one@example.com'], ['two@example.com']]
+
+
+    def test_connection_per_email(self, smtp_server):
+        """Outside a shared_connection block, each email connects anew."""
+        send('one@example.com')
+        send('two@example.com')
+
+        assert smtp_server.connections == 2
+
+
+    def test_nested(self, smtp_server):
+        """Nested shared_connection blocks use the outer connection."""
+        with email.shared_connection() as outer:
+            with email.shared_connection() as inner:
+                send('one@example.com')
+            send('two@example.com')
+
+        assert inner is outer
+        assert smtp_server.connections == 1
+
+
+    def test_failure_isolated(self, smtp_server):
+        """A failed send raises, but later sends in the block still work."""
+        smtp_server.reject.add('bad@example.com')
+        with email.shared_connection():
+            send('one@example.com')
+            with pytest.raises(smtplib.SMTPException):
+                send('bad@example.com')
+            send('two@example.com')
+
+        assert [m[1] for m in smtp_server.messages] == [
+            ['one@example.com'], ['two@example.com']]
@@ -0,0 +1,160 @@
+"""Tests for pooled keep-alive HTTP connections."""
+import httplib
+import threading
+
+import pytest
+
+from portfoliyo import httppool
+
+
+
+def make_pool(server, **kw):
+    """Return a ``ConnectionPool`` for the given fake API server."""
+    host, port = server.server_address
+    return httppool.ConnectionPool(host, port, secure=False, **kw)
+
+
+
+def test_request(http_server):
+    """Returns status and response body."""
+    http_server.status = 201
+    http_server.response_data = {'foo': 'bar'}
+    pool = make_pool(http_server)
+
+    status, content = pool.request(
+        'POST', '/path', 'a=b', {'Content-Type': 'text/plain'})
+
+    assert status == 201
+    assert content == '{"foo": "bar"}'
+    assert http_server.requests == [('/path', {'a': 'b'})]
+
+
+
+def test_reuses_connection(http_server):
+    """Sequential requests are all sent over a single kept-alive connection."""
+    pool = make_pool(http_server)
+    for i in range(5):
+        pool.request('POST', '/', '')
+
+    assert pool.requests_sent == 5
+    assert pool.connections_opened == 1
+    assert http_server.connections == 1
+
+
+
+def test_server_closes_connection(http_server):
+    """If the server won't keep connections alive, a new one is opened."""
+    http_server.keep_alive = False
+    pool = make_pool(http_server)
+    for i in range(3):
+        pool.request('POST', '/', '')
+
+    assert pool.requests_sent == 3
+    assert pool.connections_opened == 3
+
+
+
+def test_retries_stale_connection(http_server):
+    """A pooled connection that has gone away is replaced transparently."""
+    pool = make_pool(http_server)
+    pool.request('POST', '/', '')
+    # simulate the idle connection having been dropped
+    pool._idle[0].sock.close()
+
+    pool.request('POST', '/', '')
+
+    assert pool.connections_opened == 2
+    assert len(http_server.requests) == 2
+
+
+
+def test_replaces_connection_dropped_by_server(http_server):
+    """A pooled connection the server has closed isn't used for a POST."""
+    http_server.drop_idle = True
+    pool = make_pool(http_server)
+    pool.request('POST', '/', '')
+    assert http_server.connection_closed.wait(5)
+
+    pool.request('POST', '/', '')
+
+    assert pool.connections_opened == 2
+    assert len(http_server.requests) == 2
+
+
+
+def _fail_response(conn):
+    """Make ``conn`` fail after sending its next request."""
+    def getresponse():
+        raise httplib.BadStatusLine('')
+    conn.getresponse = getresponse
+
+
+
+def test_no_retry_of_sent_post(http_server):
+    """A POST that may have reached the server isn't sent again."""
+    pool = make_pool(http_server)
+    pool.request('POST', '/', '')
+    _fail_response(pool._idle[0])
+
+    with pytest.raises(httplib.BadStatusLine):
+        pool.request('POST', '/', '')
+
+    assert pool.requests_sent == 2
+    assert pool.connections_opened == 1
+
+
+
+def test_retries_sent_get(http_server):
+    """A GET that fails on a reused connection is retried."""
+    pool = make_pool(http_server)
+    pool.request('POST', '/', '')
+    _fail_response(pool._idle[0])
+
+    pool.request('GET', '/')
+
+    assert pool.requests_sent == 3
+    assert pool.connections_opened == 2
+
+
+
+def test_idle_timeout(http_server):
+    """Connections idle longer than ``idle_timeout`` aren't reused."""
+    pool = make_pool(http_server, idle_timeout=10)
+    pool.request('POST', '/', '')
+    pool._idle[0].idle_since -= 11
+
+    pool.request('POST', '/', '')
+
+    assert pool.connections_opened == 2
+    assert http_server.connections == 2
+
+
+
+def test_max_idle(http_server):
+    """Connections beyond ``max_idle`` are closed rather than pooled."""
+    pool = make_pool(http_server, max_idle=1)
+    conns = [pool._checkout()[0] for i in range(2)]
+    for conn in conns:
+        pool._checkin(conn)
+
+    assert pool._idle == conns[:1]
+
+
+
+def test_thread_safe(http_server):
+    """Pool can be shared by threads; connections are pooled, not shared."""
+    pool = make_pool(http_server, max_idle=4)
+
+    def make_requests():
+        for i in range(10):
+            pool.request('POST', '/', '')
+
+    threads = [threading.Thread(target=make_requests) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.requests_sent == 40
+    assert len(http_server.requests) == 40
+    assert pool.connections_opened <= 4
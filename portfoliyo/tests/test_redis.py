@@ -8,7 +8,11 @@ tests themselves.
 import mock
 
 import pytest
-from redis.exceptions import ResponseError
+from redis.exceptions import NoScriptError, ResponseError
+
+from portfoliyo.redis import (
+    Script, release_lease, renew_lease, scan, sscan, take_lease)
+from portfoliyo.tests import utils
 
 
 
@@ -48,6 +52,24 @@ def test_incr(redis):
     assert redis.incr('foo') == 2
 
 
+def test_incrby(redis):
+    """Test in-memory implementation of Redis incrby."""
+    assert redis.incrby('foo', 3) == 3
+    assert redis.incrby('foo', -1) == 2
+
+
+def test_lists(redis):
+    """Test in-memory implementation of Redis lists."""
+    assert redis.rpush('foo', 'a', 2) == 2
+    assert redis.rpush('foo', 'c') == 3
+    assert redis.llen('foo') == 3
+    assert redis.lpop('foo') == 'a'
+    assert redis.lpop('foo') == '2'
+    assert redis.lpop('foo') == 'c'
+    assert redis.lpop('foo') is None
+    assert redis.llen('foo') == 0
+
+
 def test_pipeline(redis):
     """Test in-memory implementation of Redis pipelining."""
     p = redis.pipeline()
@@ -68,6 +90,26 @@ def test_hashes(redis):
     assert redis.hgetall('foo') == {'one': 'three', 'two': '2', 'four': 'five'}
 
 
+def test_hash_fields(redis):
+    """Test in-memory implementation of Redis hash field commands."""
+    assert redis.hset('foo', 1, 'one') == 1
+    assert redis.hset('foo', 1, 'uno') == 0
+    redis.hset('foo', 'two', 2)
+
+    assert redis.hget('foo', 1) == 'uno'
+    assert redis.hmget('foo', [1, 'two', 'three']) == ['uno', '2', None]
+    assert redis.hdel('foo', 1, 'three') == 1
+    assert redis.hgetall('foo') == {'two': '2'}
+
+
+def test_hincrby(redis):
+    """Test in-memory implementation of Redis hincrby."""
+    assert redis.hincrby('foo', 'one', 2) == 2
+    assert redis.hincrby('foo', 'one') == 3
+
+    assert redis.hgetall('foo') == {'one': '3'}
+
+
 def test_sorted_sets(redis):
     """Test in-memory implementation of Redis sorted sets."""
     redis.zadd('foo', 7, 'five')
@@ -82,6 +124,18 @@ def test_sorted_sets(redis):
         '0', 'three', 'five', 'eight']
 
 
+def test_zremrangebyscore(redis):
+    """Test in-memory implementation of zremrangebyscore."""
+    redis.zadd('foo', 1, 'one')
+    redis.zadd('foo', 2, 'two')
+    redis.zadd('foo', 3, 'three')
+
+    assert redis.zremrangebyscore('foo', '-inf', '(2') == 1
+    assert redis.zrangebyscore('foo', '-inf', '+inf') == ['two', 'three']
+    assert redis.zremrangebyscore('foo', 2, 3) == 2
+    assert redis.zrangebyscore('foo', '-inf', '+inf') == []
+
+
 def test_expireat(redis):
     """Test in-memory implementation of expireat."""
     with mock.patch('portfoliyo.redis.time') as mock_time:
@@ -101,6 +155,161 @@ def test_expireat_timestamp_must_be_integer(redis):
         redis.expireat('foo', 10.231)
 
 
+def test_ttl(redis):
+    """Test in-memory implementation of ttl."""
+    redis.incr('foo')
+    assert redis.ttl('foo') in [-1, None]
+    redis.expire('foo', 5)
+
+    assert 0 < redis.ttl('foo') <= 5
+
+
+def test_expire(redis):
+    """Test in-memory implementation of expire."""
+    assert not redis.expire('foo', 5)
+    with mock.patch('portfoliyo.redis.time.time') as mock_time:
+        mock_time.return_value = 5
+        redis.incr('foo')
+        assert redis.expire('foo', 5)
+        mock_time.return_value = 11
+
+        assert redis.incr('foo') == 1
+
+
+def test_get(redis):
+    """Test in-memory implementation of get."""
+    assert redis.get('foo') is None
+    redis.setnx('foo', 'one')
+    redis.incr('bar')
+    assert redis.get('foo') == 'one'
+    assert redis.get('bar') == '1'
+
+
+def test_sscan(redis):
+    """Scanning a set step by step covers all its members."""
+    for i in range(25):
+        redis.sadd('foo', i)
+    seen = set()
+    cursor, members = sscan('foo', count=10)
+    seen.update(members)
+    while cursor:
+        cursor, members = sscan('foo', cursor, count=10)
+        seen.update(members)
+
+    assert seen == set(str(i) for i in range(25))
+
+
+def test_sscan_removal(redis):
+    """Members removed mid-scan don't cause others to be skipped."""
+    for i in range(25):
+        redis.sadd('foo', i)
+    seen = set()
+    cursor = 0
+    while True:
+        cursor, members = sscan('foo', cursor, count=5)
+        seen.update(members)
+        for member in members:
+            redis.srem('foo', member)
+        if not cursor:
+            break
+
+    assert seen == set(str(i) for i in range(25))
+
+
+def test_scan(redis):
+    """Scanning keys step by step covers all matching keys."""
+    for i in range(15):
+        redis.sadd('foo:%s' % i, 'x')
+    redis.sadd('bar:1', 'x')
+    seen = set()
+    cursor = 0
+    while True:
+        cursor, keys = scan(cursor, match='foo:*', count=5)
+        seen.update(keys)
+        if not cursor:
+            break
+
+    assert seen == set('foo:%s' % i for i in range(15))
+
+
+def test_setnx(redis):
+    """Test in-memory implementation of setnx."""
+    assert redis.setnx('foo', 'one')
+    assert not redis.setnx('foo', 'two')
+    redis.delete('foo')
+    assert redis.setnx('foo', 'three')
+
+
+def test_script(redis):
+    """A script runs in a single call to Redis."""
+    def incr_twice(client, keys, args):
+        client.incr(keys[0])
+        return client.incr(keys[0])
+    script = Script(
+        "redis.call('INCR', KEYS[1])\n"
+        "return redis.call('INCR', KEYS[1])",
+        incr_twice,
+        )
+
+    with utils.assert_num_calls(redis, 1):
+        assert script(keys=['foo']) == 2
+    assert script(keys=['foo']) == 4
+
+
+def test_lease(redis):
+    """Only one holder of a lease at a time; only the holder can release."""
+    token = take_lease('foo', 60)
+
+    assert token is not None
+    assert take_lease('foo', 60) is None
+    assert not release_lease('foo', 'stale')
+    assert take_lease('foo', 60) is None
+    assert release_lease('foo', token)
+    assert take_lease('foo', 60) is not None
+
+
+def test_lease_expires(redis):
+    """A lease lapses after its expiry, even if not released."""
+    with mock.patch('portfoliyo.redis.time.time') as mock_time:
+        mock_time.return_value = 5
+        token = take_lease('foo', 10)
+        mock_time.return_value = 16
+
+        assert take_lease('foo', 10) is not None
+    assert not release_lease('foo', token)
+
+
+def test_renew_lease(redis):
+    """Only the holder of a lease can renew it."""
+    with mock.patch('portfoliyo.redis.time.time') as mock_time:
+        mock_time.return_value = 5
+        token = take_lease('foo', 10)
+        assert renew_lease('foo', token, 20)
+        assert not renew_lease('foo', 'stale', 100)
+        mock_time.return_value = 16
+
+        assert take_lease('foo', 10) is None
+        mock_time.return_value = 26
+        assert not renew_lease('foo', token, 20)
+        assert take_lease('foo', 10) is not None
+
+
+def test_lindex(redis):
+    """Test in-memory implementation of lindex."""
+    redis.rpush('foo', 'one', 'two')
+
+    assert redis.lindex('foo', 0) == 'one'
+    assert redis.lindex('foo', -1) == 'two'
+    assert redis.lindex('foo', 2) is None
+    assert redis.lindex('bar', 0) is None
+
+
+def test_evalsha_unknown_script(redis):
+    """Running a script Redis doesn't know about raises NoScriptError."""
+    with pytest.raises(NoScriptError):
+        redis.evalsha('0' * 40, 0)
+
+
 def test_copies(redis):
     """hgetall returned dictionaries are copies of stored data."""
     redis.hmset('foo', {'one': 'one'})
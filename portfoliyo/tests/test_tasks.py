@@ -1,17 +1,422 @@
 """Tests for Celery tasks."""
+from django.test.utils import override_settings
 import mock
+import pytest
 
-from portfoliyo import tasks
+from portfoliyo import email, tasks
+from portfoliyo.notifications import store
+from portfoliyo.redis import take_lease
+from portfoliyo.sms import inbox, outbox
 
 
 
-def test_check_for_pending_notifications():
-    """Triggers send_notification_email task for all pending profile IDs."""
-    target1 = 'portfoliyo.tasks.send_notification_email'
-    target2 = 'portfoliyo.notifications.store.pending_profile_ids'
-    with mock.patch(target1) as mock_send_notification:
-        with mock.patch(target2) as mock_pending_profile_ids:
-            mock_pending_profile_ids.return_value = [5]
+@pytest.fixture
+def email_budget(request):
+    """Set a notification email budget of 60 emails per minute."""
+    override = override_settings(NOTIFICATION_EMAILS_PER_MINUTE=60)
+    override.enable()
+    request.addfinalizer(override.disable)
+
+
+
+def test_check_for_pending_notifications(redis):
+    """Triggers send_notification_emails task for all pending profile IDs."""
+    store.store(5, 'some', triggering=True)
+    target = 'portfoliyo.tasks.send_notification_emails'
+    with mock.patch(target) as mock_send_notifications:
+        tasks.check_for_pending_notifications.delay()
+
+    mock_send_notifications.apply_async.assert_called_once_with(
+        ([5],), countdown=0)
+
+
+
+def test_check_for_pending_notifications_batches(redis):
+    """Pending profile IDs are sent in batches of NOTIFICATION_BATCH_SIZE."""
+    for profile_id in [1, 2, 3]:
+        store.store(profile_id, 'some', triggering=True)
+    target = 'portfoliyo.tasks.send_notification_emails'
+    with mock.patch(target) as mock_send_notifications:
+        with mock.patch('portfoliyo.tasks.NOTIFICATION_BATCH_SIZE', 2):
+            tasks.check_for_pending_notifications.delay()
+
+    batches = [
+        c[0][0][0] for c in mock_send_notifications.apply_async.call_args_list]
+    assert [len(b) for b in batches] == [2, 1]
+    assert sorted(sum(batches, [])) == [1, 2, 3]
+
+
+
+def test_check_for_pending_notifications_continues(redis):
+    """The sweep continues in further runs until all profiles are covered."""
+    for profile_id in [1, 2, 3]:
+        store.store(profile_id, 'some', triggering=True)
+    target = 'portfoliyo.tasks.send_notification_emails'
+    with mock.patch(target) as mock_send_notifications:
+        with mock.patch('portfoliyo.tasks.NOTIFICATION_SWEEP_SIZE', 1):
+            tasks.check_for_pending_notifications.delay()
+
+    batches = [
+        c[0][0][0] for c in mock_send_notifications.apply_async.call_args_list]
+    assert sorted(sum(batches, [])) == [1, 2, 3]
+
+
+
+def test_check_for_pending_notifications_budget(redis, email_budget):
+    """Batches are spread out to keep within NOTIFICATION_EMAILS_PER_MINUTE."""
+    for profile_id in [1, 2, 3]:
+        store.store(profile_id, 'some', triggering=True)
+    target = 'portfoliyo.tasks.send_notification_emails'
+    with mock.patch(target) as mock_send_notifications:
+        with mock.patch('portfoliyo.tasks.NOTIFICATION_BATCH_SIZE', 2):
             tasks.check_for_pending_notifications.delay()
 
-    mock_send_notification.delay.assert_called_once_with(5)
+    assert [
+        c[1] for c in mock_send_notifications.apply_async.call_args_list
+        ] == [{'countdown': 0}, {'countdown': 2.0}]
+
+
+
+def test_check_for_pending_notifications_budget_delays_next_run(
+        redis, email_budget):
+    """The next run of the sweep waits until this run's batches are due."""
+    task = tasks.check_for_pending_notifications
+    target = 'portfoliyo.notifications.store.scan_pending_profile_ids'
+    with mock.patch(target) as mock_scan:
+        mock_scan.return_value = (7, [1, 2])
+        with mock.patch('portfoliyo.tasks.send_notification_emails'):
+            with mock.patch.object(task, 'apply_async') as mock_apply_async:
+                task()
+
+    mock_apply_async.assert_called_once_with(
+        (7, mock.ANY), countdown=2.0)
+
+
+
+def test_check_for_pending_notifications_one_sweep_at_a_time(redis):
+    """A sweep started while another is in progress does nothing."""
+    store.store(5, 'some', triggering=True)
+    lease = take_lease(store.SWEEP_LEASE_KEY, 60)
+    target = 'portfoliyo.tasks.send_notification_emails'
+    with mock.patch(target) as mock_send_notifications:
+        tasks.check_for_pending_notifications.delay()
+        assert not mock_send_notifications.apply_async.call_count
+        # but the sweep holding the lease carries on
+        tasks.check_for_pending_notifications.delay(0, lease)
+
+    assert mock_send_notifications.apply_async.call_count == 1
+
+
+
+def test_check_for_pending_notifications_releases_lease(redis):
+    """The sweep lease is released when the sweep is done."""
+    with mock.patch('portfoliyo.tasks.send_notification_emails'):
+        tasks.check_for_pending_notifications.delay()
+
+    assert take_lease(store.SWEEP_LEASE_KEY, 60)
+
+
+
+def test_check_for_pending_notifications_budget_holds_lease(
+        redis, email_budget):
+    """With a budget, the lease is held until the last batch is due."""
+    for profile_id in [1, 2, 3]:
+        store.store(profile_id, 'some', triggering=True)
+    with mock.patch('portfoliyo.tasks.send_notification_emails'):
+        with mock.patch('portfoliyo.tasks.NOTIFICATION_BATCH_SIZE', 2):
+            tasks.check_for_pending_notifications.delay()
+
+    assert take_lease(store.SWEEP_LEASE_KEY, 60) is None
+    assert 0 < redis.ttl(store.SWEEP_LEASE_KEY) <= 4
+
+
+
+def test_check_for_pending_notifications_reports_skipped(redis):
+    """Logs number of sends skipped because a render was in progress."""
+    redis.incr('notify:render:skipped')
+    with mock.patch('portfoliyo.tasks.logger.info') as mock_info:
+        tasks.check_for_pending_notifications()
+
+    mock_info.assert_called_once_with(
+        "Notification sends skipped (render in progress): 1")
+
+
+
+def test_sweep_expired_notifications(redis):
+    """Trims expired notifications, continuing until all are covered."""
+    target = 'portfoliyo.notifications.store.trim_expired'
+    with mock.patch(target) as mock_trim:
+        mock_trim.side_effect = [(7, 2), (0, 1)]
+        with mock.patch('portfoliyo.tasks.logger.info') as mock_info:
+            tasks.sweep_expired_notifications.delay()
+
+    assert mock_trim.call_args_list == [
+        mock.call(0, tasks.NOTIFICATION_SWEEP_SIZE),
+        mock.call(7, tasks.NOTIFICATION_SWEEP_SIZE),
+        ]
+    assert mock_info.call_args_list == [
+        mock.call("Removed 2 expired notifications."),
+        mock.call("Removed 1 expired notifications."),
+        ]
+
+
+
+def test_migrate_legacy_notifications(redis):
+    """Migrates legacy notifications, continuing until all are covered."""
+    target = 'portfoliyo.notifications.store.migrate_legacy'
+    with mock.patch(target) as mock_migrate:
+        mock_migrate.side_effect = [(7, 2), (0, 0)]
+        with mock.patch('portfoliyo.tasks.logger.info') as mock_info:
+            tasks.migrate_legacy_notifications.delay()
+
+    assert mock_migrate.call_args_list == [
+        mock.call(0, tasks.NOTIFICATION_SWEEP_SIZE),
+        mock.call(7, tasks.NOTIFICATION_SWEEP_SIZE),
+        ]
+    mock_info.assert_called_once_with("Migrated 2 legacy notifications.")
+
+
+
+def test_send_notification_emails_isolates_failures():
+    """Failure to send one notification email doesn't prevent the rest."""
+    target = 'portfoliyo.notifications.render.send'
+    with mock.patch(target) as mock_send:
+        mock_send.side_effect = [Exception("Boom."), None]
+        with mock.patch('portfoliyo.tasks.logger.warning') as mock_warning:
+            tasks.send_notification_emails([1, 2])
+
+    assert [c[0] for c in mock_send.call_args_list] == [(1,), (2,)]
+    mock_warning.assert_called_once_with(
+        "Notification email to profile 1 failed: Boom.",
+        exc_info=True,
+        extra={'stack': True},
+        )
+
+
+
+def test_send_notification_emails_one_connection(smtp_server):
+    """All notification emails in a batch share one SMTP connection."""
+    def _send(profile_id):
+        email.send_multipart(
+            'subject', 'text', 'html', ['%s@example.com' % profile_id])
+    target = 'portfoliyo.notifications.render.send'
+    with mock.patch(target, _send):
+        tasks.send_notification_emails([1, 2, 3])
+
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 3
+
+
+
+def test_send_sms(sms):
+    """Sends a single SMS via the priority lane."""
+    tasks.send_sms('+13216540987', '+15555555555', 'hello')
+
+    assert [(m.to, m.from_, m.body) for m in sms.outbox] == [
+        ('+13216540987', '+15555555555', 'hello')]
+    assert outbox.stats()['priority']['sent'] == 1
+
+
+
+def test_send_sms_batch(sms):
+    """Sends SMS body to all given recipients."""
+    tasks.send_sms_batch.delay(
+        [('+13216540987', '+15555555555'), ('+13216540988', '+15555555556')],
+        'hello',
+        )
+
+    assert sorted((m.to, m.from_, m.body) for m in sms.outbox) == [
+        ('+13216540987', '+15555555555', 'hello'),
+        ('+13216540988', '+15555555556', 'hello'),
+        ]
+
+
+
+def test_drain_sms_queue_in_batches(sms):
+    """Queue is drained in batches of SMS_BATCH_SIZE until empty."""
+    recipients = [('+1321654%04d' % i, '+15555555555') for i in range(5)]
+    outbox.enqueue(recipients, 'hello')
+    with mock.patch('portfoliyo.tasks.SMS_BATCH_SIZE', 2):
+        with mock.patch('portfoliyo.sms.send_many') as mock_send_many:
+            mock_send_many.return_value = []
+            tasks.drain_sms_queue('+15555555555')
+
+    assert [len(c[0][0]) for c in mock_send_many.call_args_list] == [2, 2, 1]
+    assert outbox.stats()['priority']['depth'] == 0
+
+
+
+def test_drain_sms_queue_priority_first(sms):
+    """Priority-lane messages are sent before bulk messages."""
+    outbox.enqueue([('+13216540987', '+15555555555')], 'bulk', 1, 'bulk')
+    outbox.enqueue([('+13216540988', '+15555555555')], 'priority', 2)
+
+    tasks.drain_sms_queue('+15555555555')
+
+    assert [m.body for m in sms.outbox] == ['priority', 'bulk']
+
+
+
+def test_drain_sms_queue_locked(sms):
+    """Messages are left for the task already draining that source."""
+    outbox.enqueue([('+13216540987', '+15555555555')], 'hello')
+    outbox.lock('+15555555555')
+
+    tasks.drain_sms_queue('+15555555555')
+
+    assert not sms.outbox
+    assert outbox.pending('+15555555555')
+
+
+
+def test_drain_sms_queue_crash_keeps_messages(sms, monkeypatch):
+    """Messages aren't lost if the drain task dies while sending them."""
+    outbox.enqueue([('+13216540987', '+15555555555')], 'hello')
+    with mock.patch('portfoliyo.sms.send_many') as mock_send_many:
+        mock_send_many.side_effect = KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt):
+            tasks.drain_sms_queue('+15555555555')
+
+    tasks.drain_sms_queue('+15555555555')
+
+    assert [(m.to, m.body) for m in sms.outbox] == [
+        ('+13216540987', 'hello')]
+    assert not outbox.pending('+15555555555')
+
+
+
+def test_drain_sms_queue_isolates_failures(sms, monkeypatch):
+    """Failure to send to one recipient doesn't prevent sending to others."""
+    orig_send = sms.send
+    def send(to, from_, body):
+        if to == '+13216540987':
+            raise Exception("Twilio is down.")
+        orig_send(to, from_, body)
+    monkeypatch.setattr(sms, 'send', send)
+
+    with mock.patch('portfoliyo.tasks.logger.warning') as mock_warning:
+        tasks.send_sms_batch(
+            [
+                ('+13216540987', '+15555555555'),
+                ('+13216540988', '+15555555555'),
+                ],
+            'hello',
+            )
+
+    assert [m.to for m in sms.outbox] == ['+13216540988']
+    assert mock_warning.call_count == 1
+    # the failure's traceback is logged
+    exc_info = mock_warning.call_args[1]['exc_info']
+    assert str(exc_info[1]) == "Twilio is down."
+    assert exc_info[2] is not None
+
+
+
+def test_receive_sms_in_order(sms):
+    """Queued incoming SMS are processed in order; replies are sent."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+    inbox.enqueue('+13216540987', '+15555555555', 'two')
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        mock_receive_sms.side_effect = [None, 'reply']
+        tasks.receive_sms('+13216540987')
+
+    assert [c[0] for c in mock_receive_sms.call_args_list] == [
+        ('+13216540987', '+15555555555', 'one'),
+        ('+13216540987', '+15555555555', 'two'),
+        ]
+    assert [(m.to, m.from_, m.body) for m in sms.outbox] == [
+        ('+13216540987', '+15555555555', 'reply')]
+    assert not inbox.pending('+13216540987')
+
+
+
+def test_receive_sms_crash_keeps_message(redis):
+    """A message isn't lost if its processing task dies."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        mock_receive_sms.side_effect = KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt):
+            tasks.receive_sms('+13216540987')
+
+    assert inbox.peek('+13216540987')[1:] == ('+15555555555', 'one')
+    # lock is released
+    assert inbox.lock('+13216540987')
+
+
+
+def test_receive_sms_locked(redis):
+    """Messages are left for the task already processing that phone."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+    inbox.lock('+13216540987')
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        tasks.receive_sms('+13216540987')
+
+    assert mock_receive_sms.call_count == 0
+    assert inbox.pending('+13216540987') == 1
+
+
+
+def test_receive_sms_lock_lost(redis):
+    """Stops processing if its lock lapsed and was taken by another task."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+    inbox.enqueue('+13216540987', '+15555555555', 'two')
+
+    def _steal_lock(*args):
+        redis.delete(inbox.make_lock_key('+13216540987'))
+        inbox.lock('+13216540987')
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        mock_receive_sms.side_effect = _steal_lock
+        tasks.receive_sms('+13216540987')
+
+    assert mock_receive_sms.call_count == 1
+    assert inbox.peek('+13216540987')[1:] == ('+15555555555', 'two')
+
+
+
+def test_receive_sms_sends_reply_after_lock_lost(sms):
+    """A committed reply is sent even if another task took over meanwhile."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+
+    def _taken_over(*args):
+        inbox.done('+13216540987', inbox.peek('+13216540987')[0])
+        return 'reply'
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        mock_receive_sms.side_effect = _taken_over
+        tasks.receive_sms('+13216540987')
+
+    assert [m.body for m in sms.outbox] == ['reply']
+
+
+
+def test_receive_sms_isolates_failures(sms):
+    """A message that fails to process doesn't block later messages."""
+    inbox.enqueue('+13216540987', '+15555555555', 'one')
+    inbox.enqueue('+13216540987', '+15555555555', 'two')
+
+    target = 'portfoliyo.sms.hook.receive_sms'
+    with mock.patch(target) as mock_receive_sms:
+        mock_receive_sms.side_effect = [Exception("Boom."), 'reply']
+        with mock.patch('portfoliyo.tasks.logger.warning') as mock_warning:
+            tasks.receive_sms('+13216540987')
+
+    mock_warning.assert_called_once_with(
+        "Processing SMS from +13216540987 failed: Boom.",
+        exc_info=True,
+        extra={'stack': True},
+        )
+    assert [m.body for m in sms.outbox] == ['reply']
+    assert inbox.dead_letters('+13216540987') == [
+        ('+15555555555', 'one')]
+    assert not inbox.pending('+13216540987')
+    # lock is released
+    assert inbox.lock('+13216540987')
@@ -64,3 +64,17 @@ def assert_num_calls(redis, num):
     total_calls = redis.num_calls - start_calls
     assert total_calls == num, 'Expected %s redis quer%s, saw %s' % (
         num, 'y' if num == 1 else 'ies', total_calls)
+
+
+@contextmanager
+def count_queries():
+    """Context manager: yield a list; filled with queries run within block."""
+    queries = []
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    start = len(connection.queries)
+    try:
+        yield queries
+    finally:
+        queries.extend(connection.queries[start:])
+        connection.use_debug_cursor = old_debug_cursor
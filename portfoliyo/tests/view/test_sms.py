@@ -6,6 +6,7 @@ from django.test import RequestFactory
 from django.test.utils import override_settings
 import mock
 
+from portfoliyo.sms import inbox
 from portfoliyo.view import sms
 
 
@@ -74,6 +75,25 @@ def test_reply(mock_receive_sms, mock_validate):
     assert xml[0].text == "a reply message!"
 
 
+@override_settings(TWILIO_AUTH_TOKEN='foo', TWILIO_ASYNC_RECEIVE=True)
+@mock.patch('portfoliyo.view.sms.RequestValidator.validate')
+@mock.patch('portfoliyo.view.sms.tasks.receive_sms.delay')
+@mock.patch('portfoliyo.sms.hook.receive_sms')
+def test_async_receive(
+        mock_receive_sms, mock_receive_sms_task, mock_validate, redis):
+    """With async receive, SMS is queued for a task; no immediate reply."""
+    mock_validate.return_value = True
+
+    response = sms.twilio_receive(signed_request(data()))
+    xml = ElementTree.XML(response.content)
+
+    assert response.status_code == 200
+    assert not list(xml)
+    assert mock_receive_sms.call_count == 0
+    mock_receive_sms_task.assert_called_once_with('from')
+    assert inbox.peek('from')[1:] == ('to', 'body')
+
+
 @override_settings(TWILIO_AUTH_TOKEN='foo')
 @mock.patch('portfoliyo.view.sms.RequestValidator.validate')
 @mock.patch('portfoliyo.sms.hook.receive_sms')
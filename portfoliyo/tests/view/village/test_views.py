@@ -1056,7 +1056,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(rel.student),
@@ -1068,7 +1068,11 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000")],
+            "foo --Mr. Doe",
+            sender=rel.elder.id,
+            lane='priority',
+            )
 
 
     def test_create_meeting_with_present_and_extra_names(self, no_csrf_client):
@@ -1110,7 +1114,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(group=group),
@@ -1122,7 +1126,11 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000")],
+            "foo --Mr. Doe",
+            sender=rel.elder.id,
+            lane='bulk',
+            )
 
 
     def test_all_students_post_sms_all(self, no_csrf_client):
@@ -1137,7 +1145,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(),
@@ -1149,7 +1157,11 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000")],
+            "foo --Mr. Doe",
+            sender=rel.elder.id,
+            lane='bulk',
+            )
 
 
     def test_create_group_post(self, no_csrf_client):
@@ -9,8 +9,8 @@ from django.views.decorators import http, csrf
 from twilio import twiml
 from twilio.util import RequestValidator
 
-from portfoliyo import xact
-from portfoliyo.sms import hook
+from portfoliyo import tasks, xact
+from portfoliyo.sms import hook, inbox
 from portfoliyo.sms.base import split_sms
 
 
@@ -47,16 +47,27 @@ def twilio(viewfunc):
 @http.require_POST
 @twilio
 def twilio_receive(request):
-    """Receive an SMS via Twilio."""
+    """
+    Receive an SMS via Twilio.
+
+    If ``settings.TWILIO_ASYNC_RECEIVE`` is set, the SMS is queued for a task
+    to process and send any reply, and an empty response is returned at once.
+
+    """
     source = request.POST['From']
     to = request.POST['To']
     body = request.POST['Body']
 
+    response = twiml.Response()
+
+    if settings.TWILIO_ASYNC_RECEIVE:
+        inbox.enqueue(source, to, body)
+        tasks.receive_sms.delay(source)
+        return response
+
     with xact.xact():
         reply = hook.receive_sms(source, to, body)
 
-    response = twiml.Response()
-
     if reply:
         for chunk in split_sms(reply):
             response.sms(chunk)